@@ -0,0 +1,6 @@
+"""
+ベンチマーク - フェイクのGitHub・OpenAIサーバーを使い、ネットワーク・APIキーなしで実行する
+
+backend/api から `python -m benchmarks.<スクリプト名> --help` で実行する。
+各スクリプトは一時ディレクトリにChromaDB・キャッシュを作り、終了時に削除する
+"""
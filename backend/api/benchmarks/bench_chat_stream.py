@@ -0,0 +1,123 @@
+"""
+チャットのストリーミングの最初のトークンまでの時間（TTFT）のベンチマーク
+
+API（uvicorn）とフェイクのOpenAI API（8文字ごとに --token-delay-ms の生成時間）を起動し、
+- stream: /api/chat/stream（SSE）。最初の token イベントを受け取るまでの時間を TTFT とする
+- non-stream: /api/chat。回答全体が届くまで何も表示できないため TTFT = 全体の時間
+をクライアント側で計測する（回答キャッシュは使わない）
+
+    python -m benchmarks.bench_chat_stream --token-delay-ms 20 --answer-chars 400
+"""
+import argparse
+import asyncio
+
+from benchmarks.common import isolated_env, latency_summary, print_table, stopwatch, synthetic_document
+
+isolated_env(OPENAI_API_KEY="bench")
+
+import os  # noqa: E402
+import time  # noqa: E402
+
+import httpx  # noqa: E402
+
+from benchmarks.fakes import FakeOpenAI, serve  # noqa: E402
+
+REPOSITORY = "bench/chat-stream"
+HEADERS = {"Authorization": "Bearer bench"}
+QUESTIONS = ["デプロイの手順は？", "キャッシュの設定は？", "認証トークンの扱いは？", "webhook の同期は？"]
+
+
+def ingest(documents: int):
+    from core.dependencies import get_chroma_service
+    get_chroma_service().add_documents(REPOSITORY, [
+        {"path": f"docs/doc{i}.md", "name": f"doc{i}.md", "sha": f"{i:040x}", "directory": "docs",
+         "depth": 1, "content": synthetic_document(i)}
+        for i in range(documents)
+    ])
+
+
+async def stream_once(client: httpx.AsyncClient, payload: dict):
+    """(最初の token イベントまでの秒, 全体の秒)"""
+    started = time.perf_counter()
+    ttft = None
+    async with client.stream("POST", "/api/chat/stream", json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                if event == "token" and ttft is None:
+                    ttft = time.perf_counter() - started
+                elif event == "error":
+                    raise RuntimeError("error event from /api/chat/stream")
+    return ttft, time.perf_counter() - started
+
+
+async def measure(base_url: str, requests: int, context_limit: int):
+    streamed = {"ttft": [], "total": []}
+    blocking = []
+    async with httpx.AsyncClient(base_url=base_url, headers=HEADERS, timeout=120) as client:
+        for i in range(requests):
+            payload = {
+                "message": QUESTIONS[i % len(QUESTIONS)], "repository": REPOSITORY,
+                "context_limit": context_limit, "use_cache": False
+            }
+            ttft, total = await stream_once(client, payload)
+            streamed["ttft"].append(ttft)
+            streamed["total"].append(total)
+
+            with stopwatch() as elapsed:
+                response = await client.post("/api/chat", json=payload)
+            response.raise_for_status()
+            blocking.append(elapsed["seconds"])
+
+    def summary(label, ttft, total):
+        ttft_stats, total_stats = latency_summary(ttft), latency_summary(total)
+        return {
+            "path": label,
+            "requests": len(total),
+            "ttft_p50_ms": ttft_stats["p50_ms"],
+            "ttft_p95_ms": ttft_stats["p95_ms"],
+            "total_p50_ms": total_stats["p50_ms"],
+            "total_p95_ms": total_stats["p95_ms"]
+        }
+
+    return [summary("stream", streamed["ttft"], streamed["total"]), summary("non-stream", blocking, blocking)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--context-limit", type=int, default=3)
+    parser.add_argument("--answer-chars", type=int, default=400, help="フェイクのLLMの回答の長さ")
+    parser.add_argument("--token-delay-ms", type=float, default=20, help="8文字ごとの生成時間")
+    parser.add_argument("--latency-ms", type=float, default=200, help="生成を始めるまでの遅延（プロンプトの処理）")
+    args = parser.parse_args()
+
+    answer = ("ドキュメントによると、手順は次の通りです。" * args.answer_chars)[:args.answer_chars]
+    fake = FakeOpenAI(
+        latency=args.latency_ms / 1000,
+        token_delay=args.token_delay_ms / 1000,
+        answer=lambda messages: answer
+    )
+    fake_url, stop_fake = serve(fake.app)
+    os.environ["OPENAI_BASE_URL"] = fake_url + "/v1"
+
+    from main import app
+    api_url, stop_api = serve(app)
+    try:
+        ingest(args.documents)
+        rows = asyncio.run(measure(api_url, args.requests, args.context_limit))
+    finally:
+        stop_api()
+        stop_fake()
+
+    print_table(
+        f"Chat time to first token ({args.answer_chars}-char answers, "
+        f"{args.latency_ms:.0f}ms before the first token + {args.token_delay_ms:.0f}ms per 8 chars, fake OpenAI)",
+        rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+ChromaDB の embedded モードとサーバー（http）モードの検索スループットのベンチマーク
+
+同じドキュメントを embedded（プロセス内の PersistentClient）と、ローカルに起動した `chroma run` のサーバーに
+登録し、N ワーカーで search を繰り返したときのクエリ/秒とレイテンシを比べる。
+- embedded-threads: 1プロセス内の N スレッド（embedded は複数プロセスで同じファイルを開けない）
+- http-threads: 1プロセス内の N スレッド（プールしたHTTPクライアントを共有）
+- http-processes: N プロセス（複数のAPIワーカーを想定、それぞれがHTTPクライアントを持つ）
+クエリは毎回変えるため検索結果のキャッシュには当たらない。
+`chroma` コマンドがない・サーバーが起動しない場合は http の行を理由を表示して飛ばす
+
+    python -m benchmarks.bench_chroma_modes --workers 1,2,4,8 --queries 400
+"""
+import argparse
+
+from benchmarks.common import isolated_env, latency_summary, parse_ints, print_table, stopwatch, synthetic_document
+
+DATA_DIR = isolated_env()
+
+import multiprocessing  # noqa: E402
+import os  # noqa: E402
+import shutil  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+from concurrent.futures import ThreadPoolExecutor  # noqa: E402
+
+import httpx  # noqa: E402
+
+from benchmarks.fakes import free_port  # noqa: E402
+
+REPOSITORY = "bench/chroma-modes"
+QUERIES = ["デプロイ 手順", "cache server", "認証 トークン", "docker nginx", "検索 index", "webhook 同期"]
+
+
+def start_server(path: str):
+    """`chroma run` を起動し、(ポート, 停止する関数) を返す"""
+    executable = shutil.which("chroma") or os.path.join(os.path.dirname(sys.executable), "chroma")
+    if not os.path.exists(executable):
+        raise RuntimeError("chroma command not found")
+    port = free_port()
+    process = subprocess.Popen(
+        [executable, "run", "--path", path, "--host", "127.0.0.1", "--port", str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        cwd=DATA_DIR,  # chroma.log をカレントディレクトリに書くため
+        env={**os.environ, "ANONYMIZED_TELEMETRY": "false"}
+    )
+
+    def stop():
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"chroma run exited with {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/api/v1/heartbeat", timeout=1).status_code == 200:
+                return port, stop
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    stop()
+    raise RuntimeError("chroma run did not answer the heartbeat within 60s")
+
+
+def use_mode(mode: str, port: int = 0):
+    """以降に作る ChromaService の接続先を切り替える（キーワードインデックスもモードごとに分ける）"""
+    os.environ["CHROMA_MODE"] = mode
+    os.environ["CHROMA_HOST"] = "127.0.0.1"
+    os.environ["CHROMA_PORT"] = str(port)
+    os.environ["KEYWORD_INDEX_PATH"] = os.path.join(DATA_DIR, f"keyword_index_{mode}.sqlite3")
+
+
+def run_queries(chroma, worker: int, count: int, n_results: int):
+    """1ワーカー分の検索を行い、各クエリのレイテンシ（秒）を返す"""
+    seconds = []
+    for i in range(count):
+        query = f"{QUERIES[i % len(QUERIES)]} {worker}-{i}"
+        with stopwatch() as elapsed:
+            results = chroma.search(REPOSITORY, query, n_results)
+        if not results:
+            raise RuntimeError(f"No results for {query!r}")
+        seconds.append(elapsed["seconds"])
+    return seconds
+
+
+def measure_threads(chroma, workers: int, queries: int, n_results: int):
+    per_worker = max(queries // workers, 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        with stopwatch() as elapsed:
+            latencies = list(executor.map(
+                lambda worker: run_queries(chroma, worker, per_worker, n_results), range(workers)
+            ))
+    return elapsed["seconds"], [s for worker in latencies for s in worker]
+
+
+def process_worker(env, worker: int, count: int, n_results: int, ready, start, results):
+    """別プロセスのAPIワーカー（spawn で起動するため環境変数は親から受け取る）"""
+    try:
+        os.environ.update(env)
+        from services.chroma_service import ChromaService
+
+        chroma = ChromaService()
+        run_queries(chroma, worker + 1000, 5, n_results)  # 接続・コレクションの読み込みを計測に含めない
+        ready.put(worker)
+        start.wait()
+        with stopwatch() as elapsed:
+            seconds = run_queries(chroma, worker, count, n_results)
+        results.put((elapsed["seconds"], seconds))
+    finally:
+        shutil.rmtree(DATA_DIR, ignore_errors=True)  # このプロセスの isolated_env が作った一時ディレクトリ
+
+
+def measure_processes(workers: int, queries: int, n_results: int):
+    context = multiprocessing.get_context("spawn")
+    ready, results, start = context.Queue(), context.Queue(), context.Event()
+    per_worker = max(queries // workers, 1)
+    processes = [
+        context.Process(target=process_worker, args=(dict(os.environ), worker, per_worker, n_results, ready, start, results))
+        for worker in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for _ in processes:
+            ready.get(timeout=120)
+        start.set()
+        finished = [results.get(timeout=600) for _ in processes]
+    finally:
+        for process in processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.kill()
+    # 全ワーカーが同時に始めるため、最も遅いワーカーの所要時間を全体の時間とする
+    return max(elapsed for elapsed, _ in finished), [s for _, seconds in finished for s in seconds]
+
+
+def row(mode: str, workers: int, elapsed: float, seconds):
+    return {
+        "mode": mode,
+        "workers": workers,
+        "queries": len(seconds),
+        "qps": round(len(seconds) / elapsed, 1),
+        **latency_summary(seconds),
+        "skipped": ""
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=parse_ints, default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=400, help="ワーカー数ごとのクエリ数の合計")
+    parser.add_argument("--documents", type=int, default=1000)
+    parser.add_argument("--n-results", type=int, default=5)
+    args = parser.parse_args()
+
+    from services.chroma_service import ChromaService
+
+    documents = [
+        {"path": f"docs/doc{i}.md", "name": f"doc{i}.md", "sha": f"{i:040x}", "directory": "docs",
+         "depth": 1, "content": synthetic_document(i, paragraphs=2)}
+        for i in range(args.documents)
+    ]
+
+    services, ingest, skipped = {}, [], ""
+    use_mode("embedded")
+    services["embedded"] = ChromaService()
+    stop_server = None
+    try:
+        port, stop_server = start_server(os.path.join(DATA_DIR, "chroma-server"))
+        use_mode("http", port)
+        services["http"] = ChromaService()
+    except Exception as e:
+        skipped = f"{type(e).__name__}: {e}"[:80]
+
+    try:
+        for mode, chroma in services.items():
+            with stopwatch() as elapsed:
+                chroma.add_documents(REPOSITORY, documents)
+            ingest.append({"mode": mode, "documents": args.documents, "seconds": round(elapsed["seconds"], 2)})
+            run_queries(chroma, -1, 5, args.n_results)
+
+        rows = []
+        for workers in args.workers:
+            rows.append(row("embedded-threads", workers,
+                            *measure_threads(services["embedded"], workers, args.queries, args.n_results)))
+            if "http" not in services:
+                rows.extend({"mode": mode, "workers": workers, "skipped": skipped}
+                            for mode in ("http-threads", "http-processes"))
+                continue
+            rows.append(row("http-threads", workers,
+                            *measure_threads(services["http"], workers, args.queries, args.n_results)))
+            rows.append(row("http-processes", workers, *measure_processes(workers, args.queries, args.n_results)))
+    finally:
+        if stop_server:
+            stop_server()
+
+    print_table("Ingest (fake embeddings)", ingest)
+    print_table(
+        f"Search throughput by Chroma mode ({args.documents} documents, n_results={args.n_results}, "
+        f"{args.queries} queries per row, fake embeddings)",
+        rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+チャンク分割のスループットとチャンクサイズ分布のベンチマーク
+
+実際のドキュメント（既定はリポジトリの docs/ 以下の .md）を
+- structured: MarkdownChunker（見出し・コードブロック・リストを考慮、トークン数で区切る）
+- legacy: 以前の空白区切り・500文字の分割
+で分割し、MB/秒・チャンク数・チャンクのトークン数の分布・コードブロックを途中で切ったチャンクの数を比べる
+
+    python -m benchmarks.bench_chunker --corpus ../../docs --repeat 5
+"""
+import argparse
+import os
+from typing import Callable, Dict, List
+
+from benchmarks.common import percentile, print_table, stopwatch
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "..", "..", "..", "docs")
+
+
+def legacy_split(text: str, chunk_size: int = 500) -> List[str]:
+    """MarkdownChunker 導入前の ChromaService.split_into_chunks"""
+    if not text:
+        return []
+    chunks, current, size = [], [], 0
+    for word in text.split():
+        word_len = len(word) + 1
+        if size + word_len > chunk_size and current:
+            chunks.append(" ".join(current))
+            current, size = [word], word_len
+        else:
+            current.append(word)
+            size += word_len
+    if current:
+        chunks.append(" ".join(current))
+    return chunks if chunks else [text]
+
+
+def load_corpus(directory: str) -> Dict[str, str]:
+    documents = {}
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if name.endswith(".md"):
+                path = os.path.join(root, name)
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    documents[os.path.relpath(path, directory)] = f.read()
+    return documents
+
+
+def broken_fences(chunk: str) -> bool:
+    """コードブロックの開き・閉じが揃っていない（途中で切られた）チャンク"""
+    return sum(1 for line in chunk.splitlines() if line.lstrip().startswith(("```", "~~~"))) % 2 == 1
+
+
+def measure(label: str, split: Callable[[str], List[str]], texts: List[str], repeat: int,
+            count_tokens: Callable[[str], int]) -> Dict:
+    total_bytes = sum(len(text.encode("utf-8")) for text in texts)
+    with stopwatch() as elapsed:
+        for _ in range(repeat):
+            chunks = [chunk for text in texts for chunk in split(text)]
+    sizes = [count_tokens(chunk) for chunk in chunks]
+    return {
+        "chunker": label,
+        "mb_per_s": round(total_bytes * repeat / 1024 / 1024 / elapsed["seconds"], 2),
+        "chunks": len(chunks),
+        "tokens_p5": percentile(sizes, 5),
+        "tokens_p50": percentile(sizes, 50),
+        "tokens_p95": percentile(sizes, 95),
+        "tokens_max": max(sizes, default=0),
+        "total_tokens": sum(sizes),
+        "broken_fences": sum(1 for chunk in chunks if broken_fences(chunk))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help=".md を探すディレクトリ")
+    parser.add_argument("--repeat", type=int, default=5, help="スループット計測の繰り返し回数")
+    parser.add_argument("--model", default="", help="トークン数を数えるモデル（未指定なら概算）")
+    parser.add_argument("--max-tokens", type=int, default=300)
+    parser.add_argument("--overlap-tokens", type=int, default=40)
+    args = parser.parse_args()
+
+    from services.chunker import MarkdownChunker
+    from services.tokenizer import estimate_tokens, get_token_counter
+
+    documents = load_corpus(args.corpus)
+    if not documents:
+        parser.error(f"No .md files under {args.corpus}")
+    texts = list(documents.values())
+    count_tokens = get_token_counter(args.model) if args.model else estimate_tokens
+    chunker = MarkdownChunker(count_tokens, max_tokens=args.max_tokens, overlap_tokens=args.overlap_tokens)
+
+    rows = [
+        measure("structured", lambda text: [c["text"] for c in chunker.split(text)], texts, args.repeat, count_tokens),
+        measure("legacy", legacy_split, texts, args.repeat, count_tokens)
+    ]
+    size_mb = sum(len(text.encode("utf-8")) for text in texts) / 1024 / 1024
+    print_table(
+        f"Chunking {len(texts)} files ({size_mb:.2f} MB) from {os.path.abspath(args.corpus)}, "
+        f"tokens by {args.model or 'estimate'}",
+        rows
+    )
+
+
+if __name__ == "__main__":
+    main()
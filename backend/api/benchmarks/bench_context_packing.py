@@ -0,0 +1,151 @@
+"""
+チャットのコンテキストの組み立て方のベンチマーク（送信トークン数と回答の正確さ）
+
+固定の質問集合（各質問に正解の値が1つ）と、正解を含むドキュメント・その複製（backup/ 等）・
+無関係なドキュメントからなるリポジトリを同期し、同じ検索結果から
+- packed: ContextBuilder（重複除去・隣接チャンクの連結・スコア/トークン順でトークン予算内に詰める）
+- legacy: 以前の「--- ドキュメント i ---」で連結して3000文字で切る方法
+でコンテキストを作り、フェイクのLLMに送る。
+フェイクのLLMはプロンプトに正解の文があればその値を答えるため、正答率はコンテキストに正解が残ったかを表す
+
+    python -m benchmarks.bench_context_packing --context-limit 10
+"""
+import argparse
+import asyncio
+import re
+
+from benchmarks.common import isolated_env, print_table, synthetic_document
+
+isolated_env(OPENAI_API_KEY="bench")
+
+import os  # noqa: E402
+import statistics  # noqa: E402
+
+from benchmarks.fakes import FakeOpenAI, serve  # noqa: E402
+
+REPOSITORY = "bench/context"
+SERVICES = [
+    "auth", "billing", "search", "editor", "webhook", "gateway",
+    "scheduler", "storage", "notifier", "exporter", "importer", "renderer"
+]
+_FACT = re.compile(r"(\w+) サービスのリクエストタイムアウトは (\d+) 秒")
+
+
+def gold_value(index: int) -> str:
+    return str(17 + index * 7)
+
+
+def service_document(index: int, name: str, section_lines: int) -> str:
+    """概要・構成・設定の節を持つサービスのドキュメント（正解は設定の節にある）"""
+    return "\n".join([
+        f"# {name} サービス\n",
+        "## 概要\n",
+        f"{name} サービスは API からのリクエストを受け取り、設定に従って処理する。"
+        f"{name} サービスのタイムアウトや再試行は環境ごとの設定ファイルで管理する。\n",
+        "## 構成\n",
+        *[f"- {name} worker {i}: キューからジョブを取り出して処理する\n" for i in range(section_lines)],
+        "## 設定\n",
+        f"{name} サービスのリクエストタイムアウトは {gold_value(index)} 秒。"
+        f"これを超えたリクエストは {name} サービスが打ち切り、エラーとして記録する。\n",
+        "```yaml\n" + f"{name}:\n  retries: 3\n  log_level: info\n" + "```\n"
+    ])
+
+
+def corpus(distractors: int, section_lines: int):
+    documents = {}
+    for index, name in enumerate(SERVICES):
+        content = service_document(index, name, section_lines)
+        # 同じ内容のファイルが複数の場所にあるリポジトリを想定（重複除去の効果を見る）
+        for directory in ("docs/services", "docs/backup", "archive/2023"):
+            documents[f"{directory}/{name}.md"] = content
+    for i in range(distractors):
+        documents[f"notes/note{i}.md"] = synthetic_document(i)
+    return [
+        {"path": path, "name": path.rsplit("/", 1)[1], "sha": f"{i:040x}", "directory": path.rsplit("/", 1)[0],
+         "depth": path.count("/"), "content": content}
+        for i, (path, content) in enumerate(documents.items())
+    ]
+
+
+def legacy_context(results, context_limit: int) -> str:
+    """ContextBuilder 導入前の routers/chat.py のコンテキスト"""
+    chunks = []
+    for i, result in enumerate(results[:context_limit], 1):
+        path = result.get("metadata", {}).get("path", "Unknown")
+        chunks.append(f"--- ドキュメント {i}: {path} ---\n{result.get('content', '')}")
+    context = "\n\n".join(chunks)
+    if len(context) > 3000:
+        context = context[:3000] + "\n...[以下省略]"
+    return context
+
+
+def answer_from_prompt(messages) -> str:
+    """質問のサービスの正解の文がプロンプトにあればその値を、なければ「不明」を返すフェイクのLLM"""
+    prompt = messages[-1]["content"]
+    asked = re.search(r"質問: (\w+) サービス", prompt)
+    for name, seconds in _FACT.findall(prompt):
+        if asked and name == asked.group(1):
+            return f"{seconds} 秒です。"
+    return "ドキュメントに記載がないため不明です。"
+
+
+async def run(context_limit: int, distractors: int, section_lines: int):
+    fake = FakeOpenAI(answer=answer_from_prompt)
+    base_url, stop = serve(fake.app)
+    os.environ["OPENAI_BASE_URL"] = base_url + "/v1"
+
+    from routers.chat import context_builder
+    from services.chroma_service import ChromaService
+    from services.openai_service import OpenAIService
+    from services.tokenizer import estimate_tokens
+
+    chroma = ChromaService()
+    chroma.add_documents(REPOSITORY, corpus(distractors, section_lines))
+    openai_service = OpenAIService()
+
+    stats = {label: {"tokens": [], "correct": 0} for label in ("packed", "legacy")}
+    try:
+        for index, name in enumerate(SERVICES):
+            question = f"{name} サービスのリクエストタイムアウトは何秒ですか？"
+            results = chroma.search(REPOSITORY, question, n_results=context_limit)
+            contexts = {
+                "packed": context_builder.build(results)[0],
+                "legacy": legacy_context(results, context_limit)
+            }
+            for label, context in contexts.items():
+                answer = await openai_service.agenerate_response(question, context)
+                messages = fake.prompts[-1]
+                stats[label]["tokens"].append(sum(estimate_tokens(message["content"]) for message in messages))
+                stats[label]["correct"] += gold_value(index) in answer
+    finally:
+        stop()
+
+    rows = [
+        {
+            "builder": label,
+            "questions": len(SERVICES),
+            "correct": values["correct"],
+            "accuracy": f"{values['correct'] / len(SERVICES):.0%}",
+            "prompt_tokens_mean": round(statistics.fmean(values["tokens"])),
+            "prompt_tokens_max": max(values["tokens"])
+        }
+        for label, values in stats.items()
+    ]
+    print_table(
+        f"Context packing ({context_limit} retrieved chunks, budget {context_builder.token_budget} tokens, "
+        f"{distractors} distractor documents, fake LLM)",
+        rows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--context-limit", type=int, default=10, help="検索してコンテキストに渡すチャンク数")
+    parser.add_argument("--distractors", type=int, default=200, help="無関係なドキュメントの数")
+    parser.add_argument("--section-lines", type=int, default=30, help="正解の手前の節の行数（ドキュメントの長さ）")
+    args = parser.parse_args()
+    asyncio.run(run(args.context_limit, args.distractors, args.section_lines))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+ディレクトリを絞り込んだ検索のレイテンシのベンチマーク
+
+階層の深さ（depth）と各階層のディレクトリ数（fanout）を変えた合成リポジトリで
+- subtree: 最上位ディレクトリ1つのサブツリー全体（祖先ディレクトリのメタデータ dir_N で絞り込み）
+- leaf: 最も深いディレクトリ1つ（サブディレクトリなし）
+を search_by_directory で検索し、レイテンシと返った件数を計測する。
+post_filter_hits は以前のように n_results * 2 件を取得してからパスで絞り込んだ場合に残る件数
+（スコープが狭いほど n_results に届かない）
+
+    python -m benchmarks.bench_directory_search --files 2000 --depths 1,2,3,4 --fanouts 5,10
+"""
+import argparse
+
+from benchmarks.common import isolated_env, latency_summary, parse_ints, print_table, stopwatch, synthetic_files
+
+isolated_env()
+
+from services.chroma_service import ChromaService  # noqa: E402
+from services.query_cache import search_result_cache  # noqa: E402
+
+QUERIES = ["デプロイ 手順", "cache server", "認証 トークン", "docker nginx", "検索 index", "webhook 同期"]
+
+
+def documents_for(files):
+    docs = []
+    for i, (path, content) in enumerate(files.items()):
+        directory, _, name = path.rpartition("/")
+        docs.append({
+            "path": path, "name": name, "sha": f"{i:040x}", "directory": directory,
+            "depth": directory.count("/") + 1, "content": content
+        })
+    return docs
+
+
+def measure(chroma: ChromaService, repo: str, directory: str, recursive: bool, n_results: int, repeat: int):
+    seconds, hits = [], []
+    for _ in range(repeat):
+        for query in QUERIES:
+            search_result_cache.clear()
+            with stopwatch() as elapsed:
+                results = chroma.search_by_directory(repo, directory, query, n_results, recursive=recursive)
+            seconds.append(elapsed["seconds"])
+            hits.append(len(results))
+    return latency_summary(seconds), min(hits)
+
+
+def post_filter_hits(chroma: ChromaService, repo: str, directory: str, recursive: bool, n_results: int) -> int:
+    """検索全体から n_results * 2 件を取り、パスで絞り込んだ後に残る件数の最小値"""
+    prefix = directory + "/"
+    found = []
+    for query in QUERIES:
+        search_result_cache.clear()
+        results = chroma.search(repo, query, n_results * 2)
+        found.append(sum(
+            1 for item in results
+            if (item["metadata"]["path"].startswith(prefix) if recursive
+                else item["metadata"]["directory"] == directory)
+        ))
+    return min(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--depths", type=parse_ints, default=[1, 2, 3, 4])
+    parser.add_argument("--fanouts", type=parse_ints, default=[5, 10])
+    parser.add_argument("--n-results", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    chroma = ChromaService()
+    rows = []
+    for fanout in args.fanouts:
+        for depth in args.depths:
+            repo = f"bench/dir-d{depth}-f{fanout}"
+            files = {path: content for path, content in synthetic_files(args.files, depth, fanout, paragraphs=1).items()
+                     if path.endswith(".md")}
+            chroma.add_documents(repo, documents_for(files))
+            leaf = "/".join(f"d{level}_0" for level in range(depth))
+
+            for scope, directory, recursive in (("subtree", "d0_0", True), ("leaf", leaf, False)):
+                in_scope = sum(
+                    1 for path in files
+                    if (path.startswith(directory + "/") if recursive else path.rpartition("/")[0] == directory)
+                )
+                latency, hits = measure(chroma, repo, directory, recursive, args.n_results, args.repeat)
+                rows.append({
+                    "depth": depth,
+                    "fanout": fanout,
+                    "scope": scope,
+                    "files_in_scope": in_scope,
+                    **latency,
+                    "hits": hits,
+                    "post_filter_hits": post_filter_hits(chroma, repo, directory, recursive, args.n_results)
+                })
+
+    print_table(f"Scoped search latency ({args.files} files, n_results={args.n_results}, fake embeddings)", rows)
+
+
+if __name__ == "__main__":
+    main()
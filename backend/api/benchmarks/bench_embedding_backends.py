@@ -0,0 +1,94 @@
+"""
+埋め込みバックエンドごとのスループットのベンチマーク（チャンク/秒）
+
+合成ドキュメントを MarkdownChunker で分割したチャンクを、キャッシュなしの EmbeddingService で埋め込む。
+- fake: ハッシュによる埋め込み（モデルを使わない場合の上限）
+- openai: フェイクのOpenAI埋め込みAPI（--openai-latency-ms の遅延、EMBEDDING_BATCH_SIZE 件ずつ送る）
+- onnx: ONNX_MODEL_PATH のモデル（onnxruntime）
+- sentence-transformers: sentence-transformers のモデル（PyTorch）
+モデルやパッケージがなく使えないバックエンドは理由を表示して飛ばす
+
+    python -m benchmarks.bench_embedding_backends --chunks 500
+"""
+import argparse
+
+from benchmarks.common import isolated_env, print_table, stopwatch, synthetic_document
+
+isolated_env(OPENAI_API_KEY="bench", OPENAI_EMBEDDING_MODEL="text-embedding-3-small")
+
+import os  # noqa: E402
+
+from benchmarks.fakes import FakeOpenAI, serve  # noqa: E402
+
+BACKENDS = ["fake", "openai", "onnx", "sentence-transformers"]
+
+
+def chunk_texts(count: int):
+    from services.chunker import MarkdownChunker
+    from services.tokenizer import estimate_tokens
+
+    chunker = MarkdownChunker(estimate_tokens)
+    texts, index = [], 0
+    while len(texts) < count:
+        texts.extend(chunk["text"] for chunk in chunker.split(synthetic_document(index, paragraphs=4)))
+        index += 1
+    return texts[:count]
+
+
+def measure(backend: str, texts, repeat: int):
+    from services.embedding_service import EmbeddingService, create_embedding_function
+
+    os.environ["EMBEDDING_BACKEND"] = backend
+    try:
+        embedding_function, model_name = create_embedding_function()
+        service = EmbeddingService(embedding_function, model_name, cache=None)
+        service.embed(texts[:1])  # モデルの読み込み・接続を計測に含めない
+    except Exception as e:
+        return {"backend": backend, "model": "-", "skipped": f"{type(e).__name__}: {e}"[:80]}
+
+    seconds = []
+    for _ in range(repeat):
+        with stopwatch() as elapsed:
+            service.embed(texts)
+        seconds.append(elapsed["seconds"])
+    best = min(seconds)
+    stats = service.stats()
+    return {
+        "backend": backend,
+        "model": model_name,
+        "dimensions": service.dimensions,
+        "chunks": len(texts),
+        "seconds": round(best, 2),
+        "chunks_per_s": round(len(texts) / best, 1),
+        "batches": (stats["batches"] - 1) // repeat,
+        "skipped": ""
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3, help="繰り返して最速の回を採る")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--openai-latency-ms", type=float, default=200, help="フェイクのOpenAI APIの1リクエストの遅延")
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(latency=args.openai_latency_ms / 1000)
+    base_url, stop = serve(fake.app)
+    os.environ["OPENAI_BASE_URL"] = base_url + "/v1"
+
+    texts = chunk_texts(args.chunks)
+    try:
+        rows = [measure(backend.strip(), texts, args.repeat) for backend in args.backends.split(",") if backend.strip()]
+    finally:
+        stop()
+
+    print_table(
+        f"Embedding throughput without cache ({args.chunks} chunks, "
+        f"batch size {os.getenv('EMBEDDING_BATCH_SIZE', '100')}, fake OpenAI latency {args.openai_latency_ms:.0f}ms)",
+        rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+検索モード（vector / keyword / hybrid）ごとの recall@k とレイテンシのベンチマーク
+
+実際のドキュメント（既定はリポジトリの docs/ 以下の .md）を登録し、正解を付けた2種類のクエリで比べる。
+- identifier: 関数名・設定キーなどの識別子。正解はその識別子を含むファイル
+- japanese: 日本語の質問。正解は人手で付けたファイル
+recall@k は上位 k 件の検索結果（チャンク）に含まれるファイルのうち正解の割合（正解が k 件より多い場合は k で割る）。
+既定の埋め込みは fake（同じ語を含むほど近いハッシュ埋め込み）のため、vector の値は本物のモデルより低く出る
+
+    python -m benchmarks.bench_hybrid_search --k 5,10
+"""
+import argparse
+
+from benchmarks.common import isolated_env, latency_summary, parse_ints, print_table, stopwatch
+
+isolated_env()
+
+import os  # noqa: E402
+import statistics  # noqa: E402
+
+from benchmarks.bench_chunker import DEFAULT_CORPUS, load_corpus  # noqa: E402
+from benchmarks.fixtures import labelled_queries, to_documents  # noqa: E402
+
+MODES = ["vector", "keyword", "hybrid"]
+REPOSITORY = "bench/docs"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help=".md を探すディレクトリ")
+    parser.add_argument("--k", type=parse_ints, default=[5, 10])
+    parser.add_argument("--repeat", type=int, default=3, help="レイテンシ計測の繰り返し回数")
+    parser.add_argument("--embedding-backend", default="fake", help="EMBEDDING_BACKEND（openai 等で本物のモデル）")
+    args = parser.parse_args()
+
+    os.environ["EMBEDDING_BACKEND"] = args.embedding_backend
+    from services.chroma_service import ChromaService
+    from services.query_cache import query_embedding_cache, search_result_cache
+
+    documents = load_corpus(args.corpus)
+    if not documents:
+        parser.error(f"No .md files under {args.corpus}")
+    queries = labelled_queries(documents)
+    chroma = ChromaService()
+    chroma.add_documents(REPOSITORY, to_documents(documents))
+    max_k = max(args.k)
+
+    rows = []
+    for mode in MODES:
+        for kind in ("identifier", "japanese"):
+            selected = [(query, relevant) for query_kind, query, relevant in queries if query_kind == kind]
+            recalls = {k: [] for k in args.k}
+            seconds = []
+            for query, relevant in selected:
+                for _ in range(args.repeat):
+                    search_result_cache.clear()
+                    query_embedding_cache.clear()
+                    with stopwatch() as elapsed:
+                        results = chroma.search(REPOSITORY, query, max_k, mode=mode)
+                    seconds.append(elapsed["seconds"])
+                paths = [result["metadata"]["path"] for result in results]
+                for k in args.k:
+                    found = relevant & set(paths[:k])
+                    recalls[k].append(len(found) / min(k, len(relevant)))
+            latency = latency_summary(seconds)
+            rows.append({
+                "mode": mode,
+                "queries": kind,
+                "count": len(selected),
+                **{f"recall@{k}": round(statistics.fmean(values), 3) for k, values in recalls.items()},
+                "p50_ms": latency["p50_ms"],
+                "p95_ms": latency["p95_ms"]
+            })
+
+    print_table(
+        f"Search modes on {len(documents)} files from {os.path.abspath(args.corpus)} "
+        f"({args.embedding_backend} embeddings, recall over chunk results)",
+        rows
+    )
+
+
+if __name__ == "__main__":
+    main()
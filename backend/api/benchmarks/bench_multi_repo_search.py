@@ -0,0 +1,111 @@
+"""
+複数リポジトリ検索のベンチマーク
+
+API（uvicorn）とフェイクのOpenAI埋め込みAPI（既定で100msの遅延）を起動し、1〜50リポジトリについて
+- fan-out: フロントエンドと同じくリポジトリごとに /api/search を同時に送る
+- multi: /api/search/multi に1回だけ送る（埋め込みは1回、コレクションは並列に検索）
+の1クエリあたりのレイテンシと埋め込みAPIの呼び出し回数を比べる。
+クエリは毎回変えるため、キャッシュには当たらない
+
+    python -m benchmarks.bench_multi_repo_search --repos 1,5,10,25,50
+"""
+import argparse
+import asyncio
+
+from benchmarks.common import isolated_env, latency_summary, parse_ints, print_table, stopwatch, synthetic_document
+
+isolated_env(EMBEDDING_BACKEND="openai", OPENAI_API_KEY="bench", OPENAI_EMBEDDING_MODEL="text-embedding-3-small")
+
+import os  # noqa: E402
+
+import httpx  # noqa: E402
+
+from benchmarks.fakes import FakeOpenAI, serve  # noqa: E402
+
+HEADERS = {"Authorization": "Bearer bench"}
+
+
+def repository_names(count: int):
+    return [f"bench/repo{i:02d}" for i in range(count)]
+
+
+def ingest(repositories, documents: int):
+    from core.dependencies import get_chroma_service
+    chroma = get_chroma_service()
+    for r, repository in enumerate(repositories):
+        chroma.add_documents(repository, [
+            {"path": f"docs/doc{i}.md", "name": f"doc{i}.md", "sha": f"{r:08x}{i:032x}", "directory": "docs",
+             "depth": 1, "content": synthetic_document(r * documents + i, paragraphs=1)}
+            for i in range(documents)
+        ])
+
+
+async def measure(base_url: str, fake: FakeOpenAI, repositories, queries: int, limit: int):
+    fan_out, multi = [], []
+    fan_out_calls = multi_calls = 0
+    async with httpx.AsyncClient(base_url=base_url, headers=HEADERS, timeout=120) as client:
+        for q in range(queries):
+            query = f"デプロイ 手順 cache server {len(repositories)}-{q}"
+
+            fake.calls.clear()
+            with stopwatch() as elapsed:
+                responses = await asyncio.gather(*(
+                    client.post("/api/search", json={"query": query + " fan-out", "repository": repository, "limit": limit})
+                    for repository in repositories
+                ))
+            fan_out.append(elapsed["seconds"])
+            fan_out_calls += fake.calls["embeddings"]
+            for response in responses:
+                response.raise_for_status()
+
+            fake.calls.clear()
+            with stopwatch() as elapsed:
+                response = await client.post("/api/search/multi", json={
+                    "query": query + " multi", "repositories": repositories, "limit": limit
+                })
+            multi.append(elapsed["seconds"])
+            multi_calls += fake.calls["embeddings"]
+            response.raise_for_status()
+
+    return [
+        {"repos": len(repositories), "strategy": "fan-out", **latency_summary(fan_out),
+         "embedding_calls_per_query": round(fan_out_calls / queries, 1)},
+        {"repos": len(repositories), "strategy": "multi", **latency_summary(multi),
+         "embedding_calls_per_query": round(multi_calls / queries, 1)}
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repos", type=parse_ints, default=[1, 5, 10, 25, 50])
+    parser.add_argument("--documents", type=int, default=100, help="1リポジトリあたりのドキュメント数")
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--embedding-latency-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    fake = FakeOpenAI()
+    fake_url, stop_fake = serve(fake.app)
+    os.environ["OPENAI_BASE_URL"] = fake_url + "/v1"
+
+    from main import app
+    api_url, stop_api = serve(app)
+    rows = []
+    try:
+        ingest(repository_names(max(args.repos)), args.documents)
+        fake.latency = args.embedding_latency_ms / 1000
+        for count in args.repos:
+            rows.extend(asyncio.run(measure(api_url, fake, repository_names(count), args.queries, args.limit)))
+    finally:
+        stop_api()
+        stop_fake()
+
+    print_table(
+        f"Multi-repository search ({args.documents} documents per repository, "
+        f"embedding API latency {args.embedding_latency_ms:.0f}ms)",
+        rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+再ランキングの品質向上と追加レイテンシのベンチマーク
+
+docs/ のコーパスと正解付きのクエリ（benchmarks.fixtures）で
+- none: 検索の上位 k 件
+- rerank: RERANK_CANDIDATES 件を取得し、LLMScorer（フェイクのOpenAI）で採点して上位 k 件
+の recall@k・MRR@k と1クエリの所要時間を比べる。再ランキングは予算（RERANK_LATENCY_BUDGET_MS）ごとに計測する。
+フェイクのLLMは文書に含まれるクエリの語の割合を0〜10で返し、1回の採点に --scorer-latency-ms かかる
+（品質の値はこの採点器の場合のもの。本物のモデルでの向上幅は採点器次第）
+
+    python -m benchmarks.bench_rerank --budgets 150,300,1000 --scorer-latency-ms 80
+"""
+import argparse
+import json
+import re
+
+from benchmarks.common import isolated_env, latency_summary, parse_ints, print_table, stopwatch
+
+isolated_env(OPENAI_API_KEY="bench", RERANK_BACKEND="llm")
+
+import os  # noqa: E402
+import statistics  # noqa: E402
+
+from benchmarks.bench_chunker import DEFAULT_CORPUS, load_corpus  # noqa: E402
+from benchmarks.fakes import FakeOpenAI, serve  # noqa: E402
+from benchmarks.fixtures import labelled_queries, to_documents  # noqa: E402
+from services.keyword_index import tokenize  # noqa: E402
+
+REPOSITORY = "bench/rerank"
+_DOCUMENT = re.compile(r"^\[(\d+)\]\n", re.MULTILINE)
+
+
+def score_by_term_coverage(messages) -> str:
+    """LLMScorer のプロンプトから質問と文書を取り出し、文書に含まれる質問の語の割合で採点する"""
+    prompt = messages[-1]["content"]
+    question, _, documents = prompt.partition("\n\n文書:\n")
+    terms = set(tokenize(question[len("質問: "):]))
+    texts = _DOCUMENT.split(documents)[2::2]
+    scores = [
+        round(10 * len(terms & set(tokenize(text))) / max(len(terms), 1), 2)
+        for text in texts
+    ]
+    return json.dumps({"scores": scores})
+
+
+def evaluate(queries, search, k: int):
+    """(recall@k, MRR@k, 1クエリの秒数のリスト, 予算切れの回数)"""
+    recalls, reciprocal_ranks, seconds, exhausted = [], [], [], 0
+    for query, relevant in queries:
+        with stopwatch() as elapsed:
+            results, info = search(query)
+        seconds.append(elapsed["seconds"])
+        exhausted += bool(info and info.get("budget_exhausted"))
+        paths = [result["metadata"]["path"] for result in results[:k]]
+        recalls.append(len(relevant & set(paths)) / min(k, len(relevant)))
+        reciprocal_ranks.append(next((1 / rank for rank, path in enumerate(paths, 1) if path in relevant), 0.0))
+    return statistics.fmean(recalls), statistics.fmean(reciprocal_ranks), seconds, exhausted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help=".md を探すディレクトリ")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--mode", default="vector", help="再ランキング前の検索モード")
+    parser.add_argument("--budgets", type=parse_ints, default=[150, 300, 1000], help="RERANK_LATENCY_BUDGET_MS")
+    parser.add_argument("--scorer-latency-ms", type=float, default=80, help="フェイクのLLMの1回の採点の遅延")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(latency=args.scorer_latency_ms / 1000, answer=score_by_term_coverage)
+    base_url, stop = serve(fake.app)
+    os.environ["OPENAI_BASE_URL"] = base_url + "/v1"
+
+    from services.chroma_service import ChromaService
+    from services.query_cache import query_embedding_cache, search_result_cache
+    from services.reranker import RERANK_CANDIDATES, Reranker, create_scorer
+
+    documents = load_corpus(args.corpus)
+    if not documents:
+        parser.error(f"No .md files under {args.corpus}")
+    queries = [(query, relevant) for _, query, relevant in labelled_queries(documents)]
+    chroma = ChromaService()
+    chroma.add_documents(REPOSITORY, to_documents(documents))
+
+    def retrieve(query: str, n_results: int):
+        search_result_cache.clear()
+        query_embedding_cache.clear()
+        return chroma.search(REPOSITORY, query, n_results, mode=args.mode)
+
+    strategies = {"none": lambda query: (retrieve(query, args.k), None)}
+    for budget in args.budgets:
+        reranker = Reranker(
+            create_scorer(budget), batch_size=int(os.getenv("RERANK_BATCH_SIZE", "8")), latency_budget_ms=budget
+        )
+        strategies[f"rerank {budget}ms"] = (
+            lambda query, reranker=reranker: reranker.rerank(query, retrieve(query, max(args.k, RERANK_CANDIDATES)), args.k)
+        )
+
+    rows = []
+    try:
+        baseline_p95 = None
+        for label, search in strategies.items():
+            recall, mrr, seconds, exhausted = evaluate(queries, search, args.k)
+            for _ in range(args.repeat - 1):
+                seconds += evaluate(queries, search, args.k)[2]
+            latency = latency_summary(seconds)
+            if baseline_p95 is None:
+                baseline_p95 = latency["p95_ms"]
+            rows.append({
+                "strategy": label,
+                f"recall@{args.k}": round(recall, 3),
+                f"mrr@{args.k}": round(mrr, 3),
+                "p50_ms": latency["p50_ms"],
+                "p95_ms": latency["p95_ms"],
+                "added_p95_ms": round(latency["p95_ms"] - baseline_p95, 2),
+                "budget_exhausted": f"{exhausted}/{len(queries)}"
+            })
+    finally:
+        stop()
+
+    print_table(
+        f"Reranking on {len(queries)} labelled queries over {len(documents)} files ({args.mode} retrieval, "
+        f"{RERANK_CANDIDATES} candidates, term-coverage LLM scorer at {args.scorer_latency_ms:.0f}ms per batch)",
+        rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+クエリ埋め込み・検索結果キャッシュのレイテンシのベンチマーク
+
+OpenAIの埋め込みAPI（フェイク、既定で100msの遅延）を使うコレクションに対して、同じクエリ集合を
+- cold: 初めてのクエリ（埋め込みAPI + ChromaDB）
+- embedding warm: クエリ埋め込みはキャッシュ済み、検索結果キャッシュは空（ChromaDBのみ）
+- warm: 両方キャッシュ済み
+- after write: 別プロセスの同期を想定して index_version だけを更新した直後（検索結果キャッシュは使われない）
+の順に検索し、1クエリあたりのレイテンシを比較する
+
+    python -m benchmarks.bench_search_cache --documents 2000 --queries 50
+"""
+import argparse
+
+from benchmarks.common import WORDS, isolated_env, latency_summary, print_table, stopwatch, synthetic_document
+
+isolated_env(EMBEDDING_BACKEND="openai", OPENAI_API_KEY="bench", OPENAI_EMBEDDING_MODEL="text-embedding-3-small")
+
+import os  # noqa: E402
+
+from benchmarks.fakes import FakeOpenAI, serve  # noqa: E402
+
+REPOSITORY = "bench/search-cache"
+
+
+def make_queries(count: int):
+    return [f"{WORDS[i % len(WORDS)]} {WORDS[(i * 3 + 1) % len(WORDS)]} の手順 {i}" for i in range(count)]
+
+
+def run(documents: int, queries: int, latency: float):
+    fake = FakeOpenAI(latency=latency)
+    base_url, stop = serve(fake.app)
+    os.environ["OPENAI_BASE_URL"] = base_url + "/v1"
+
+    from services.chroma_service import ChromaService
+    from services.query_cache import query_embedding_cache, search_result_cache
+
+    chroma = ChromaService()
+    chroma.add_documents(REPOSITORY, [
+        {"path": f"docs/doc{i}.md", "name": f"doc{i}.md", "sha": f"{i:040x}", "directory": "docs", "depth": 1,
+         "content": synthetic_document(i)}
+        for i in range(documents)
+    ])
+    texts = make_queries(queries)
+
+    def measure(label: str):
+        fake.calls.clear()
+        before = search_result_cache.stats()
+        seconds = []
+        for text in texts:
+            with stopwatch() as elapsed:
+                chroma.search(REPOSITORY, text, n_results=5)
+            seconds.append(elapsed["seconds"])
+        after = search_result_cache.stats()
+        return {
+            "phase": label,
+            **latency_summary(seconds),
+            "embedding_calls": fake.calls["embeddings"],
+            "result_cache_hits": after["hits"] - before["hits"]
+        }
+
+    rows = []
+    try:
+        query_embedding_cache.clear()
+        search_result_cache.clear()
+        rows.append(measure("cold"))
+        search_result_cache.clear()
+        rows.append(measure("embedding warm"))
+        rows.append(measure("warm"))
+        chroma.bump_index_version(REPOSITORY)
+        rows.append(measure("after write"))
+    finally:
+        stop()
+
+    print_table(
+        f"Search latency per query ({documents} documents, embedding API latency {latency * 1000:.0f}ms)", rows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--embedding-latency-ms", type=float, default=100)
+    args = parser.parse_args()
+    run(args.documents, args.queries, args.embedding_latency_ms / 1000)
+
+
+if __name__ == "__main__":
+    main()
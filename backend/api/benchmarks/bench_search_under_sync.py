@@ -0,0 +1,130 @@
+"""
+同期中の検索レイテンシの負荷試験
+
+API（uvicorn）・フェイクのGitHub・フェイクのOpenAI埋め込みAPIを起動し、--concurrency 本のクライアントから
+/api/search を送り続けて p50 / p95 / p99 を計測する。
+- idle: 同期なし
+- during-sync: 同期用のプール（sync_executor）で SyncPipeline の全件同期を実行している間
+クエリは毎回変えるため、キャッシュには当たらない。
+idle との差で、同期が検索のスレッド・イベントループをどれだけ妨げているかを見る
+
+    python -m benchmarks.bench_search_under_sync --files 2000 --concurrency 8
+"""
+import argparse
+import asyncio
+
+from benchmarks.common import (
+    isolated_env, latency_summary, percentile, print_table, stopwatch, synthetic_document, synthetic_files
+)
+
+isolated_env(EMBEDDING_BACKEND="openai", OPENAI_API_KEY="bench", OPENAI_EMBEDDING_MODEL="text-embedding-3-small")
+
+import os  # noqa: E402
+import time  # noqa: E402
+
+import httpx  # noqa: E402
+
+from benchmarks.fakes import FakeGitHub, FakeOpenAI, serve  # noqa: E402
+
+SEARCH_REPOSITORY = "bench/search"
+SYNC_REPOSITORY = "bench/sync-under-load"
+HEADERS = {"Authorization": "Bearer bench"}
+QUERIES = ["デプロイ 手順", "cache server", "認証 トークン", "docker nginx", "検索 index", "webhook 同期"]
+
+
+async def search_load(base_url: str, concurrency: int, until) -> list:
+    """until() が True になるまで concurrency 本のクライアントで検索し、各リクエストの秒数を返す"""
+    seconds = []
+
+    async def client_loop(client: httpx.AsyncClient, worker: int):
+        i = 0
+        while not until():
+            query = f"{QUERIES[i % len(QUERIES)]} {worker}-{i}-{time.perf_counter_ns()}"
+            with stopwatch() as elapsed:
+                response = await client.post("/api/search", json={
+                    "query": query, "repository": SEARCH_REPOSITORY, "limit": 5
+                })
+            response.raise_for_status()
+            seconds.append(elapsed["seconds"])
+            i += 1
+
+    async with httpx.AsyncClient(base_url=base_url, headers=HEADERS, timeout=120) as client:
+        await asyncio.gather(*(client_loop(client, worker) for worker in range(concurrency)))
+    return seconds
+
+
+def row(phase: str, seconds: list, elapsed: float, **extra):
+    ms = [s * 1000 for s in seconds]
+    summary = latency_summary(seconds)
+    return {
+        "phase": phase,
+        "queries": len(seconds),
+        "qps": round(len(seconds) / elapsed, 1),
+        "p50_ms": summary["p50_ms"],
+        "p95_ms": summary["p95_ms"],
+        "p99_ms": round(percentile(ms, 99), 2),
+        "max_ms": round(max(ms), 2),
+        **extra
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=2000, help="同期するリポジトリの .md ファイル数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に検索するクライアント数")
+    parser.add_argument("--idle-seconds", type=float, default=10, help="同期なしで検索する秒数")
+    parser.add_argument("--embedding-latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    os.environ["SYNC_FILE_LIMIT"] = str(args.files)
+    github = FakeGitHub()
+    github.set_repository(SYNC_REPOSITORY, synthetic_files(args.files, paragraphs=2))
+    openai = FakeOpenAI()
+    github_url, stop_github = serve(github.app)
+    openai_url, stop_openai = serve(openai.app)
+    os.environ["GITHUB_API_URL"] = github_url
+    os.environ["OPENAI_BASE_URL"] = openai_url + "/v1"
+
+    from core.dependencies import get_chroma_service, get_sync_pipeline
+    from core.executor import SYNC_WORKERS, sync_executor
+    from main import app
+
+    api_url, stop_api = serve(app)
+    rows = []
+    try:
+        get_chroma_service().add_documents(SEARCH_REPOSITORY, [
+            {"path": f"docs/doc{i}.md", "name": f"doc{i}.md", "sha": f"{i:040x}", "directory": "docs",
+             "depth": 1, "content": synthetic_document(i)}
+            for i in range(200)
+        ])
+        openai.latency = args.embedding_latency_ms / 1000
+
+        deadline = time.perf_counter() + args.idle_seconds
+        with stopwatch() as elapsed:
+            seconds = asyncio.run(search_load(api_url, args.concurrency, lambda: time.perf_counter() >= deadline))
+        rows.append(row("idle", seconds, elapsed["seconds"], sync_files="", sync_chunks="", sync_s=""))
+
+        with stopwatch() as elapsed:
+            future = sync_executor.submit(get_sync_pipeline().run, SYNC_REPOSITORY, True)
+            seconds = asyncio.run(search_load(api_url, args.concurrency, future.done))
+        result = future.result()
+        rows.append(row(
+            "during-sync", seconds, elapsed["seconds"],
+            sync_files=result["added"] + result["updated"], sync_chunks=result["chunks_written"],
+            sync_s=round(elapsed["seconds"], 1)
+        ))
+    finally:
+        stop_api()
+        stop_openai()
+        stop_github()
+
+    print_table(
+        f"Search latency while syncing ({args.concurrency} concurrent clients, {args.files}-file sync, "
+        f"embedding API latency {args.embedding_latency_ms:.0f}ms, "
+        f"SEARCH_WORKERS={os.getenv('SEARCH_WORKERS', '8')}, SYNC_WORKERS={SYNC_WORKERS})",
+        rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+起動時間とメモリ（RSS）のベンチマーク - ルーターごとの ChromaService と共有レジストリの比較
+
+レイアウトと埋め込みバックエンドの組み合わせごとに別プロセスで main を import し、検索できる状態まで初期化する。
+- per-router: 以前の構成。search / chat / sync のルーターがそれぞれ PersistentClient と埋め込み関数を作り、
+  admin もリクエストごとに PersistentClient を開く（ここでは1回）
+- shared: core.dependencies のレジストリ（init_services）でプロセスに1つずつ
+いずれも埋め込みを1回計算して、モデルを読み込み終えた状態で計測する。
+既定のバックエンドはOPENAI_API_KEYがない場合のフォールバック（sentence-transformers）と fake。
+パッケージ・モデルがなく使えないバックエンドは理由を表示して飛ばす
+
+    python -m benchmarks.bench_startup --backends sentence-transformers,fake
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from benchmarks.common import print_table
+
+LAYOUTS = ["per-router", "shared"]
+# 以前の構成で ChromaService を作っていたルーター
+LEGACY_ROUTERS = ["search", "chat", "sync"]
+
+
+def run_child(layout: str, backend: str):
+    """別プロセスで1つの構成を起動し、結果をJSONで出力"""
+    started = time.perf_counter()
+    from benchmarks.common import isolated_env, peak_rss_mb
+    isolated_env(EMBEDDING_BACKEND=backend)
+
+    import os
+
+    try:
+        import main  # noqa: F401
+
+        if layout == "per-router":
+            import chromadb
+            from services.embedding_service import create_embedding_function
+
+            path = os.environ["CHROMA_PATH"]
+            services = []
+            for _ in LEGACY_ROUTERS:
+                client = chromadb.PersistentClient(path=path)
+                embedding_function, _ = create_embedding_function()
+                embedding_function(["warmup"])
+                services.append((client, embedding_function))
+            chromadb.PersistentClient(path=path).list_collections()  # admin
+        else:
+            from core.dependencies import close_services, init_services
+            from services.embedding_service import get_embedding_service
+
+            init_services()
+            get_embedding_service().embed(["warmup"])
+            close_services()
+    except Exception as e:
+        print(json.dumps({
+            "layout": layout, "backend": backend, "startup_s": "", "rss_mb": "", "peak_rss_mb": "",
+            "skipped": f"{type(e).__name__}: {e}"[:80]
+        }))
+        return
+
+    with open("/proc/self/status") as status:
+        rss = next((int(line.split()[1]) / 1024 for line in status if line.startswith("VmRSS:")), None)
+    print(json.dumps({
+        "layout": layout,
+        "backend": backend,
+        "startup_s": round(time.perf_counter() - started, 2),
+        "rss_mb": round(rss, 1) if rss else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "skipped": ""
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="sentence-transformers,fake")
+    parser.add_argument("--repeat", type=int, default=3, help="繰り返して起動時間の最小値を採る")
+    parser.add_argument("--child", nargs=2, metavar=("LAYOUT", "BACKEND"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    rows = []
+    for backend in (b.strip() for b in args.backends.split(",") if b.strip()):
+        for layout in LAYOUTS:
+            results = []
+            for _ in range(args.repeat):
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_startup", "--child", layout, backend],
+                    stdout=subprocess.PIPE, check=True, text=True
+                ).stdout
+                results.append(json.loads(output.strip().splitlines()[-1]))
+                if results[-1]["skipped"]:
+                    break
+            rows.append(min(results, key=lambda result: result["startup_s"] or 0))
+
+    print_table(f"Startup to first embedding, per-router services vs shared registry (best of {args.repeat})", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+同期パイプラインのメモリ・スループットのベンチマーク
+
+合成リポジトリ（既定 5k / 50k ファイル）を tar.gz のローカルミラーとして作り、
+SyncPipeline で全件を同期したときの最大常駐メモリ（RSS）とファイル・チャンク/秒を計測する。
+サイズごとに別プロセスで実行するため、最大メモリは互いに影響しない。
+ファイル数が10倍になっても peak_rss がほぼ変わらなければ、メモリ使用量はリポジトリの大きさに比例していない
+（content_mb は全ファイルの本文を一度に保持した場合の大きさの目安）
+
+    python -m benchmarks.bench_sync_pipeline --sizes 5000,50000
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+from benchmarks.common import parse_ints, print_table, synthetic_files
+
+REPOSITORY = "bench/sync"
+
+
+def write_mirror(root: str, files) -> int:
+    """{root}/bench/sync.tar.gz を作り、本文の合計バイト数を返す"""
+    os.makedirs(os.path.join(root, "bench"), exist_ok=True)
+    total = 0
+    with tarfile.open(os.path.join(root, REPOSITORY + ".tar.gz"), "w:gz") as archive:
+        for path, content in files.items():
+            data = content.encode("utf-8")
+            total += len(data)
+            info = tarfile.TarInfo(f"bench-sync-0000000/{path}")
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return total
+
+
+def run_child(mirror_root: str, size: int):
+    """別プロセスで1サイズ分を同期し、結果をJSONで出力"""
+    from benchmarks.common import isolated_env, peak_rss_mb, stopwatch
+    isolated_env(LOCAL_MIRROR_ROOT=mirror_root, SYNC_FILE_LIMIT=str(size))
+
+    from services.chroma_service import ChromaService
+    from services.github_service import GitHubService
+    from services.sync_pipeline import SyncPipeline
+
+    pipeline = SyncPipeline(GitHubService(), ChromaService())
+    baseline = peak_rss_mb()
+    with stopwatch() as elapsed:
+        result = pipeline.run(REPOSITORY)
+
+    print(json.dumps({
+        "files": result["added"],
+        "chunks": result["chunks_written"],
+        "seconds": round(elapsed["seconds"], 1),
+        "files_per_s": round(result["added"] / elapsed["seconds"], 1),
+        "chunks_per_s": round(result["chunks_written"] / elapsed["seconds"], 1),
+        "rss_before_mb": baseline,
+        "peak_rss_mb": peak_rss_mb(),
+        "timings": result["timings"]
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=parse_ints, default=[5000, 50000], help="ファイル数（カンマ区切り）")
+    parser.add_argument("--paragraphs", type=int, default=2, help="1ファイルあたりの段落数")
+    parser.add_argument("--child", nargs=2, metavar=("MIRROR_ROOT", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], int(args.child[1]))
+        return
+
+    rows = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory(prefix="rag-bench-mirror-") as mirror_root:
+            content_bytes = write_mirror(mirror_root, synthetic_files(size, paragraphs=args.paragraphs))
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_sync_pipeline", "--child", mirror_root, str(size)],
+                stdout=subprocess.PIPE, check=True, text=True
+            ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings = result.pop("timings")
+        rows.append({
+            **result,
+            "content_mb": round(content_bytes / 1024 / 1024, 1),
+            **{f"{stage}_s": round(timings.get(stage, 0), 1) for stage in ("fetch", "chunk", "embed", "write")}
+        })
+
+    print_table("Streaming sync from a local tar.gz mirror (fake embeddings)", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Trees API による一覧取得のベンチマーク
+
+10 / 1k / 10k ファイルのリポジトリについて、GitHubへのリクエスト数と所要時間を計測する。
+- list: Trees API 1回での全階層の一覧（directories は以前のディレクトリごとの get_contents で必要だった回数）
+- list (warm): 2回目の一覧（ETag が一致して 304 になる）
+- blobs: 一覧の .md を blob API で並列取得
+- archive: tarball 1回で取得
+
+    python -m benchmarks.bench_tree_listing --sizes 10,1000,10000
+"""
+import argparse
+
+from benchmarks.common import isolated_env, directory_count, parse_ints, print_table, stopwatch, synthetic_files
+
+isolated_env()
+
+import os  # noqa: E402
+
+from benchmarks.fakes import FakeGitHub, serve  # noqa: E402
+from services.github_service import GitHubService  # noqa: E402
+
+
+def run(sizes, latency: float):
+    fake = FakeGitHub(latency=latency)
+    base_url, stop = serve(fake.app)
+    os.environ["GITHUB_API_URL"] = base_url
+    github = GitHubService()
+
+    rows = []
+    try:
+        for size in sizes:
+            repository = f"bench/tree-{size}"
+            files = synthetic_files(size)
+            fake.set_repository(repository, files)
+            row = {"files": size, "directories": directory_count(list(files))}
+
+            fake.reset_calls()
+            with stopwatch() as elapsed:
+                entries = github.list_markdown_tree(repository)
+            row.update({"list_calls": fake.calls["total"], "list_s": round(elapsed["seconds"], 3)})
+
+            fake.reset_calls()
+            with stopwatch() as elapsed:
+                github.list_markdown_tree(repository)
+            row.update({"warm_304": fake.calls["not_modified"], "warm_s": round(elapsed["seconds"], 3)})
+
+            fake.reset_calls()
+            with stopwatch() as elapsed:
+                fetched = sum(1 for _ in github.iter_file_contents(repository, entries))
+            row.update({"blob_calls": fake.calls["total"], "blobs_s": round(elapsed["seconds"], 3)})
+
+            fake.reset_calls()
+            with stopwatch() as elapsed:
+                archived = sum(1 for _ in github.iter_archive_contents(repository, entries))
+            row.update({"archive_calls": fake.calls["total"], "archive_s": round(elapsed["seconds"], 3)})
+
+            assert fetched == archived == len(entries), (fetched, archived, len(entries))
+            rows.append(row)
+    finally:
+        github.close()
+        stop()
+
+    print_table(f"GitHub requests and wall time (latency {latency * 1000:.0f}ms/request)", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=parse_ints, default=[10, 1000, 10000], help="ファイル数（カンマ区切り）")
+    parser.add_argument("--latency-ms", type=float, default=0, help="フェイクGitHubの1リクエストあたりの遅延")
+    args = parser.parse_args()
+    run(args.sizes, args.latency_ms / 1000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""ベンチマーク共通の環境設定・データ生成・集計"""
+import atexit
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+
+
+def isolated_env(**overrides: str) -> str:
+    """
+    一時ディレクトリにデータを置く環境変数を設定し、そのパスを返す
+
+    サービスのモジュールは読み込み時に環境変数を読むため、services を import する前に呼ぶこと
+    """
+    data_dir = tempfile.mkdtemp(prefix="rag-bench-")
+    atexit.register(shutil.rmtree, data_dir, ignore_errors=True)
+
+    os.environ.pop("GITHUB_TOKEN", None)
+    os.environ.pop("LOCAL_MIRROR_ROOT", None)
+    os.environ.update({
+        "CHROMA_MODE": "embedded",
+        "CHROMA_PATH": os.path.join(data_dir, "chromadb"),
+        "EMBEDDING_BACKEND": "fake",
+        "EMBEDDING_CACHE_PATH": os.path.join(data_dir, "embedding_cache.sqlite3"),
+        "KEYWORD_INDEX_PATH": os.path.join(data_dir, "keyword_index.sqlite3"),
+        "SYNC_JOB_DB_PATH": os.path.join(data_dir, "sync_jobs.sqlite3"),
+        "GITHUB_CACHE_PATH": os.path.join(data_dir, "github_cache.sqlite3"),
+        "RERANK_BACKEND": "none",
+        "RAG_API_KEY": "bench",
+        "ANONYMIZED_TELEMETRY": "false",
+        # main を import するベンチマークでもリクエストごとのログを出さない
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+        **overrides
+    })
+
+    logging.basicConfig(level=os.environ["LOG_LEVEL"], format="%(levelname)s %(name)s: %(message)s")
+    # chromadb のテレメトリー送信失敗のログを出さない
+    logging.getLogger("chromadb.telemetry").setLevel(logging.CRITICAL)
+    return data_dir
+
+
+WORDS = [
+    "デプロイ", "手順", "設定", "認証", "トークン", "キャッシュ", "同期", "検索", "エディター", "コンポーネント",
+    "deploy", "config", "cache", "server", "client", "webhook", "index", "docker", "nginx", "release"
+]
+
+
+def synthetic_document(index: int, paragraphs: int = 3) -> str:
+    """見出し・段落・コードブロックを含むMarkdown（index ごとに内容が変わる）"""
+    sections = [f"# ドキュメント {index}\n"]
+    for p in range(paragraphs):
+        words = " ".join(WORDS[(index * 7 + p * 3 + i) % len(WORDS)] for i in range(40))
+        sections.append(f"## セクション {p}\n\n{words}。ID {index}-{p} の説明です。\n")
+        if p % 2 == 0:
+            sections.append(f"```bash\necho step-{index}-{p}\n```\n")
+    return "\n".join(sections)
+
+
+def synthetic_files(n_files: int, depth: int = 3, fanout: int = 10, paragraphs: int = 3) -> Dict[str, str]:
+    """
+    n_files 個の .md を depth 階層・各階層 fanout 個のディレクトリに振り分けた {パス: 本文}
+
+    .md 以外のファイルも1割混ぜる（一覧からの除外を含めて計測するため）
+    """
+    files = {}
+    for i in range(n_files):
+        parts, rest = [], i
+        for level in range(depth):
+            parts.append(f"d{level}_{rest % fanout}")
+            rest //= fanout
+        directory = "/".join(parts)
+        files[f"{directory}/doc{i}.md"] = synthetic_document(i, paragraphs)
+        if i % 10 == 0:
+            files[f"{directory}/script{i}.py"] = f"print({i})\n"
+    return files
+
+
+def directory_count(paths: Sequence[str]) -> int:
+    """パスが含まれるディレクトリの数（ルートを含む）"""
+    directories = {""}
+    for path in paths:
+        parts = path.split("/")[:-1]
+        for depth in range(1, len(parts) + 1):
+            directories.add("/".join(parts[:depth]))
+    return len(directories)
+
+
+@contextmanager
+def stopwatch() -> Iterator[Dict[str, float]]:
+    """with の中の経過秒数を result["seconds"] に入れる"""
+    result = {"seconds": 0.0}
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result["seconds"] = time.perf_counter() - start
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    """ミリ秒の p50 / p95 / 平均"""
+    ms = [s * 1000 for s in seconds]
+    return {
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "mean_ms": round(statistics.fmean(ms), 2) if ms else 0.0
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """このプロセスの最大常駐メモリ（MB、Linuxのみ）"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def parse_ints(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def print_table(title: str, rows: List[Dict]):
+    """辞書のリストを列幅を揃えて出力"""
+    print(f"\n## {title}")
+    if not rows:
+        print("(no results)")
+        return
+    headers = list(rows[0])
+    widths = [max(len(str(header)), *(len(str(row.get(header, ""))) for row in rows)) for header in headers]
+    print("  ".join(str(header).rjust(width) for header, width in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(row.get(header, "")).rjust(width) for header, width in zip(headers, widths)))
@@ -0,0 +1,270 @@
+"""
+ベンチマーク用のフェイクサーバー
+
+- FakeGitHub: リポジトリ情報・Trees API・blob・tarball を返し、リクエスト数を数える。
+  ETag（304）とレート制限ヘッダーも本物と同じ形で返す
+- FakeOpenAI: 埋め込み・チャット（ストリーミングを含む）を返し、チャットのプロンプトを記録する。
+  latency で応答の遅延、token_delay でチャットの生成速度（8文字ごとの間隔）を再現できる
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import socket
+import tarfile
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
+
+from services.embedding_service import FakeEmbeddingFunction
+from services.repository_source import git_blob_sha
+from services.tokenizer import estimate_tokens
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(app: FastAPI) -> Tuple[str, Callable[[], None]]:
+    """アプリを別スレッドのuvicornで起動し、(ベースURL, 停止する関数) を返す"""
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error"))
+    thread = threading.Thread(target=server.run, name=f"fake-server-{port}", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Fake server on port {port} failed to start")
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+        thread.join(timeout=5)
+
+    return f"http://127.0.0.1:{port}", stop
+
+
+class FakeRepository:
+    """1リポジトリ分のファイルと、Trees API・blob・tarball のレスポンスの元データ"""
+
+    def __init__(self, name: str, files: Dict[str, str]):
+        self.name = name
+        self.blobs: Dict[str, bytes] = {}
+        self.tree = []
+        for path, content in files.items():
+            data = content.encode("utf-8")
+            sha = git_blob_sha(data)
+            self.blobs[sha] = data
+            self.tree.append({"path": path, "mode": "100644", "type": "blob", "sha": sha, "size": len(data)})
+        self.files = files
+        self._tarball: Optional[bytes] = None
+
+    def tarball(self) -> bytes:
+        """GitHubのtarballと同じく owner-repo-<sha>/ の下にファイルを置いた tar.gz"""
+        if self._tarball is None:
+            prefix = self.name.replace("/", "-") + "-0000000"
+            buffer = io.BytesIO()
+            with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+                for path, content in self.files.items():
+                    data = content.encode("utf-8")
+                    info = tarfile.TarInfo(f"{prefix}/{path}")
+                    info.size = len(data)
+                    archive.addfile(info, io.BytesIO(data))
+            self._tarball = buffer.getvalue()
+        return self._tarball
+
+
+class FakeGitHub:
+    """GitHub REST API（同期で使う範囲）のフェイク"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.repositories: Dict[str, FakeRepository] = {}
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+        self.app = self._build_app()
+
+    def set_repository(self, name: str, files: Dict[str, str]):
+        self.repositories[name] = FakeRepository(name, files)
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+    def _count(self, kind: str, request: bool = True):
+        with self._lock:
+            self.calls[kind] += 1
+            if request:
+                self.calls["total"] += 1
+
+    def _respond(self, request: Request, kind: str, body: bytes, media_type: str) -> Response:
+        """ETag・レート制限ヘッダーを付けて返す（If-None-Match が一致すれば 304）"""
+        self._count(kind)
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        headers = {
+            "ETag": etag,
+            "X-RateLimit-Limit": "5000",
+            "X-RateLimit-Remaining": str(max(0, 5000 - self.calls["total"])),
+            "X-RateLimit-Used": str(self.calls["total"]),
+            "X-RateLimit-Reset": str(int(time.time()) + 3600),
+            "X-RateLimit-Resource": "core"
+        }
+        if request.headers.get("if-none-match") == etag:
+            self._count("not_modified", request=False)
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type=media_type, headers=headers)
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.middleware("http")
+        async def delay(request: Request, call_next):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return await call_next(request)
+
+        def repository(owner: str, repo: str) -> FakeRepository:
+            found = self.repositories.get(f"{owner}/{repo}")
+            if found is None:
+                raise KeyError(f"{owner}/{repo}")
+            return found
+
+        @app.exception_handler(KeyError)
+        async def not_found(request: Request, exc: KeyError):
+            return Response(status_code=404)
+
+        @app.get("/repos/{owner}/{repo}")
+        def get_repository(owner: str, repo: str, request: Request):
+            repository(owner, repo)
+            body = json.dumps({"full_name": f"{owner}/{repo}", "default_branch": "main"}).encode()
+            return self._respond(request, "repository", body, "application/json")
+
+        @app.get("/repos/{owner}/{repo}/git/trees/{ref}")
+        def get_tree(owner: str, repo: str, ref: str, request: Request):
+            body = json.dumps({"sha": ref, "truncated": False, "tree": repository(owner, repo).tree}).encode()
+            return self._respond(request, "tree", body, "application/json")
+
+        @app.get("/repos/{owner}/{repo}/git/blobs/{sha}")
+        def get_blob(owner: str, repo: str, sha: str, request: Request):
+            data = repository(owner, repo).blobs.get(sha)
+            if data is None:
+                return Response(status_code=404)
+            return self._respond(request, "blob", data, "application/vnd.github.raw")
+
+        @app.get("/repos/{owner}/{repo}/tarball/{ref}")
+        def get_tarball(owner: str, repo: str, ref: str):
+            repository(owner, repo)
+            self._count("tarball")
+            return RedirectResponse(f"/codeload/{owner}/{repo}/{ref}", status_code=302)
+
+        @app.get("/codeload/{owner}/{repo}/{ref}")
+        def codeload(owner: str, repo: str, ref: str):
+            self._count("codeload")
+            return Response(repository(owner, repo).tarball(), media_type="application/x-gzip")
+
+        return app
+
+
+class FakeOpenAI:
+    """
+    OpenAI API（埋め込み・チャット）のフェイク
+
+    埋め込みは FakeEmbeddingFunction で計算する（同じ語を含むテキストほど近い）。
+    チャットは answer(プロンプト) の戻り値を返し、送られたメッセージを prompts に記録する。
+    回答は CHAT_CHUNK_CHARS 文字ごとに token_delay 秒かけて生成する（ストリーミングでなければ全体を待ってから返す）
+    """
+
+    CHAT_CHUNK_CHARS = 8
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        dimensions: int = 1536,
+        answer: Optional[Callable[[List[Dict]], str]] = None,
+        token_delay: float = 0.0
+    ):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.embedder = FakeEmbeddingFunction(dimensions)
+        self.answer = answer or (lambda messages: "フェイクの回答です。")
+        self.prompts: List[List[Dict]] = []
+        self.calls: Counter = Counter()
+        self.app = self._build_app()
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/v1/embeddings")
+        async def embeddings(request: Request):
+            body = await request.json()
+            texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            self.calls["embeddings"] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            vectors = self.embedder(texts)
+            tokens = sum(map(estimate_tokens, texts))
+            # openai SDK は numpy があれば base64（float32）で受け取る。float のリストで返すと
+            # SDK の変換とFastAPIの jsonable_encoder が計測対象より時間を使うため、本物と同じ形で直接JSONにする
+            if body.get("encoding_format") == "base64":
+                embeddings = [base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode() for vector in vectors]
+            else:
+                embeddings = [[float(x) for x in vector] for vector in vectors]
+            body = json.dumps({
+                "object": "list",
+                "model": body.get("model"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": embedding}
+                    for i, embedding in enumerate(embeddings)
+                ],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+            })
+            return Response(body, media_type="application/json")
+
+        @app.post("/v1/chat/completions")
+        async def chat_completions(request: Request):
+            body = await request.json()
+            messages = body["messages"]
+            self.prompts.append(messages)
+            self.calls["chat"] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            content = self.answer(messages)
+            starts = range(0, len(content), self.CHAT_CHUNK_CHARS)
+
+            if body.get("stream"):
+                async def events():
+                    for start in starts:
+                        if self.token_delay:
+                            await asyncio.sleep(self.token_delay)
+                        chunk = {
+                            "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": 0,
+                            "model": body["model"],
+                            "choices": [{"index": 0, "delta": {"content": content[start:start + self.CHAT_CHUNK_CHARS]}, "finish_reason": None}]
+                        }
+                        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    yield "data: [DONE]\n\n"
+                return StreamingResponse(events(), media_type="text/event-stream")
+
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay * len(starts))
+            prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+            completion_tokens = estimate_tokens(content)
+            return {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+            }
+
+        return app
@@ -0,0 +1,56 @@
+"""
+ベンチマーク用の正解付きクエリ（docs/ のコーパスに対するもの）
+
+- identifier: 関数名・設定キーなどの識別子。正解はその識別子を含むファイル
+- japanese: 日本語の質問。正解は人手で付けたファイル
+"""
+import os
+from typing import Dict, List, Set, Tuple
+
+IDENTIFIER_QUERIES = [
+    "zodResolver", "useSyncPolling", "toggleTheme", "restoreEditorState", "invalidateQueries",
+    "get_or_create_collection", "split_into_chunks", "signInWithOAuth", "NEXT_PUBLIC_VPS_RAG_ENDPOINT",
+    "idx_user_repositories_selected", "proxy_add_x_forwarded_for", "saveExpandedFolders", "useDragDrop",
+    "handleDragStart"
+]
+
+# 質問 -> 正解のファイル（corpus からの相対パス）
+JAPANESE_QUERIES = {
+    "ダークモードはどう実装する？": ["59_DARK_MODE_IMPLEMENTATION_PLAN.md"],
+    "ファイルやディレクトリの名前を変更する機能": ["61_FILE_RENAME_IMPLEMENTATION_PLAN.md"],
+    "ドラッグ&ドロップでファイルを移動する": [
+        "48_DRAG_DROP_IMPLEMENTATION_PLAN.md", "54_DRAG_DROP_FEATURES_DETAILED.md"
+    ],
+    "エディタの状態を永続化して復元する": ["57_EDITOR_STATE_PERSISTENCE_PLAN.md"],
+    "モバイルのレスポンシブデザイン対応": ["backup/45_MOBILE_RESPONSIVE_DESIGN_PLAN.md"],
+    "VPSで複数のアプリケーションを両立する構成": ["63_vps_multi_app_architecture.md"],
+    "ChromaDB のデータ管理の既知の問題と注意事項": ["backup/12_KNOWN_ISSUES_AND_NOTES.md"],
+    "Docker と API の基本コマンド": ["backup/16_DOCKER_API_COMMANDS.md"],
+    "ファイル保存機能の保存トリガー": ["56_FILE_SAVE_IMPLEMENTATION_PLAN.md"],
+    "新しいSupabaseワークスペースの作成手順": ["50_SUPABASE_NEW_WORKSPACE_SETUP.md"],
+    "認証フローとトークン管理の仕組み": ["51_AUTHENTICATION_FLOW.md"],
+    "RAGプロキシの実装プラン": ["backup/45_RAG_PROXY_IMPLEMENTATION_PLAN.md"]
+}
+
+
+def labelled_queries(documents: Dict[str, str]) -> List[Tuple[str, str, Set[str]]]:
+    """[(種類, クエリ, 正解のパスの集合)]（コーパスにない正解は除く）"""
+    queries = []
+    for identifier in IDENTIFIER_QUERIES:
+        relevant = {path for path, content in documents.items() if identifier in content}
+        if relevant:
+            queries.append(("identifier", identifier, relevant))
+    for question, paths in JAPANESE_QUERIES.items():
+        relevant = {path for path in paths if path in documents}
+        if relevant:
+            queries.append(("japanese", question, relevant))
+    return queries
+
+
+def to_documents(documents: Dict[str, str]) -> List[Dict]:
+    """load_corpus の {パス: 本文} を add_documents に渡す形に"""
+    return [
+        {"path": path, "name": os.path.basename(path), "sha": f"{i:040x}", "directory": os.path.dirname(path),
+         "depth": path.count("/"), "content": content}
+        for i, (path, content) in enumerate(documents.items())
+    ]
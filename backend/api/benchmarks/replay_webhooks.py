@@ -0,0 +1,240 @@
+"""
+記録した push Webhook のペイロードを署名して API に送り、部分同期の結果を確かめるリプレイ
+
+API（uvicorn）とフェイクのGitHubを起動し、リポジトリを全件同期してから webhook_payloads/ のペイロードを
+GITHUB_WEBHOOK_SECRET で署名して /api/webhooks/github に POST する。
+- single-commit: 1コミットで1ファイルを変更
+- multi-commit: 追加・変更・削除・リネーム（削除＋追加）と .md 以外の変更を含む3コミット
+- non-default-branch: デフォルトブランチ以外への push（無視される）
+- burst: single-commit のペイロードを元に、別々のファイルを変更する push を --burst 回続けて送る
+ペイロードごとにフェイクのGitHubのツリーをそのコミット後の内容に差し替え、同期の前後で
+ChromaDB のファイルごとの (sha, チャンクID) を比べて、変更されたパスだけが再登録されたこと・
+連続した push が1つのジョブにまとまることを確認する（失敗があれば終了コード1）
+
+    python -m benchmarks.replay_webhooks --burst 5 --debounce-seconds 1
+"""
+import argparse
+import copy
+import hashlib
+import hmac
+import json
+import sys
+
+from benchmarks.common import isolated_env, print_table, synthetic_document
+
+isolated_env(GITHUB_WEBHOOK_SECRET="bench-webhook-secret", SYNC_POLL_INTERVAL="0.2")
+
+import os  # noqa: E402
+import time  # noqa: E402
+import uuid  # noqa: E402
+
+import httpx  # noqa: E402
+
+from benchmarks.fakes import FakeGitHub, serve  # noqa: E402
+
+REPOSITORY = "bench/webhook-docs"
+HEADERS = {"Authorization": "Bearer bench"}
+PAYLOADS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "webhook_payloads")
+INITIAL_PATHS = [
+    "README.md", "docs/setup.md", "docs/deploy.md", "docs/faq.md", "docs/old-name.md",
+    "docs/api/auth.md", "docs/api/search.md", "guides/cache.md", "guides/webhook.md", "guides/editor.md"
+]
+# burst で1回の push ごとに変更するファイル
+BURST_PATHS = ["guides/cache.md", "guides/webhook.md", "guides/editor.md", "docs/api/auth.md", "docs/api/search.md"]
+
+
+def load_payload(name: str) -> bytes:
+    with open(os.path.join(PAYLOADS, name), "rb") as f:
+        return f.read()
+
+
+def edited(content: str, note: str) -> str:
+    return f"{content}\n## 更新\n\n{note}\n"
+
+
+def sign(body: bytes) -> str:
+    secret = os.environ["GITHUB_WEBHOOK_SECRET"].encode()
+    return "sha256=" + hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+
+def post_push(client: httpx.Client, body: bytes) -> dict:
+    response = client.post("/api/webhooks/github", content=body, headers={
+        "Content-Type": "application/json",
+        "X-GitHub-Event": "push",
+        "X-GitHub-Delivery": str(uuid.uuid4()),
+        "X-Hub-Signature-256": sign(body)
+    })
+    response.raise_for_status()
+    return response.json()
+
+
+def wait_for_job(client: httpx.Client, job_id: str, timeout: float = 60) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/sync/status/{job_id}").json()
+        if job["status"] in ("completed", "error"):
+            return job
+        time.sleep(0.1)
+    raise TimeoutError(f"Sync job {job_id} did not finish in {timeout}s")
+
+
+def snapshot() -> dict:
+    """登録済みファイルごとの (sha, チャンクID)"""
+    from core.dependencies import get_chroma_service
+    indexed = get_chroma_service().get_indexed_files(REPOSITORY)
+    return {path: (info["sha"], tuple(sorted(info["ids"]))) for path, info in indexed.items()}
+
+
+class Replay:
+    """フェイクのGitHubのツリーを差し替えながらペイロードを送り、確認結果を表の行にする"""
+
+    def __init__(self, client: httpx.Client, github: FakeGitHub, debounce: float):
+        self.client = client
+        self.github = github
+        self.debounce = debounce
+        self.rows = []
+        self.failures = []
+
+    def check(self, scenario: str, condition: bool, detail: str):
+        if not condition:
+            self.failures.append(f"{scenario}: {detail}")
+        return condition
+
+    def run(self, scenario: str, pushes, expected_paths, expected_counts=None, interval: float = 0.0):
+        """
+        pushes は (そのコミット後のファイル, ペイロード) のリスト。interval 秒おきに送る。
+        expected_paths が None ならジョブが作られず何も再登録されないことを確かめる
+        """
+        self.github.reset_calls()
+        before = snapshot()
+        failures = len(self.failures)
+
+        responses = []
+        for i, (files, body) in enumerate(pushes):
+            if i and interval:
+                time.sleep(interval)
+            self.github.set_repository(REPOSITORY, files)
+            responses.append(post_push(self.client, body))
+
+        job_ids = {response["job_id"] for response in responses if "job_id" in response}
+        if expected_paths is None:
+            # 無視された push でジョブが動かないことを、デバウンスとポーリングを待ってから確かめる
+            time.sleep(self.debounce + 1)
+            job = {}
+            self.check(scenario, all(r["status"] == "ignored" for r in responses), f"not ignored: {responses}")
+        else:
+            self.check(scenario, len(job_ids) == 1, f"{len(pushes)} pushes made {len(job_ids)} jobs")
+            self.check(
+                scenario,
+                [r["message"] for r in responses[1:]] == ["Merged into the queued sync for this repository"] * (len(responses) - 1),
+                "later pushes were not merged into the queued job"
+            )
+            job = wait_for_job(self.client, responses[-1]["job_id"])
+            self.check(scenario, job["status"] == "completed", f"job {job['status']}: {job.get('error')}")
+            self.check(scenario, job.get("paths") == sorted(expected_paths), f"job paths {job.get('paths')}")
+
+        after = snapshot()
+        reindexed = {path for path in before.keys() | after.keys() if before.get(path) != after.get(path)}
+        self.check(scenario, reindexed == set(expected_paths or ()), f"re-indexed {sorted(reindexed)}")
+        for key, value in (expected_counts or {}).items():
+            self.check(scenario, job.get(key) == value, f"{key}={job.get(key)}, expected {value}")
+        fetched = job.get("added", 0) + job.get("updated", 0)
+        self.check(scenario, self.github.calls["blob"] == fetched, f"{self.github.calls['blob']} blob requests")
+        self.check(scenario, self.github.calls["tarball"] == 0, "downloaded the tarball")
+
+        self.rows.append({
+            "scenario": scenario,
+            "pushes": len(pushes),
+            "jobs": len(job_ids),
+            "job_paths": len(job.get("paths") or []),
+            "added": job.get("added", 0),
+            "updated": job.get("updated", 0),
+            "deleted": job.get("deleted", 0),
+            "blob_requests": self.github.calls["blob"],
+            "re_indexed": len(reindexed),
+            "untouched": len(after.keys() - reindexed),
+            "result": "ok" if len(self.failures) == failures else "FAIL"
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst", type=int, default=5, help="続けて送る push の数")
+    parser.add_argument("--burst-interval-ms", type=float, default=200, help="push の間隔（デバウンスより短くする）")
+    parser.add_argument("--debounce-seconds", type=float, default=1, help="WEBHOOK_DEBOUNCE_SECONDS")
+    args = parser.parse_args()
+    if not 1 <= args.burst <= len(BURST_PATHS):
+        parser.error(f"--burst must be between 1 and {len(BURST_PATHS)}")
+
+    os.environ["WEBHOOK_DEBOUNCE_SECONDS"] = str(args.debounce_seconds)
+    github = FakeGitHub()
+    files = {path: synthetic_document(i) for i, path in enumerate(INITIAL_PATHS)}
+    files["src/app.py"] = "print('hello')\n"
+    github.set_repository(REPOSITORY, files)
+    github_url, stop_github = serve(github.app)
+    os.environ["GITHUB_API_URL"] = github_url
+
+    from core.dependencies import get_sync_pipeline
+    from main import app
+
+    api_url, stop_api = serve(app)
+    try:
+        get_sync_pipeline().run(REPOSITORY)
+        with httpx.Client(base_url=api_url, headers=HEADERS, timeout=60) as client:
+            replay = Replay(client, github, args.debounce_seconds)
+
+            single = dict(files)
+            single["docs/setup.md"] = edited(single["docs/setup.md"], "RAG_API_KEY を設定する。")
+            replay.run(
+                "single-commit", [(single, load_payload("push_single_commit.json"))],
+                ["docs/setup.md"], {"added": 0, "updated": 1, "deleted": 0}
+            )
+
+            multi = dict(single)
+            multi["docs/api/webhooks.md"] = synthetic_document(100)
+            multi["docs/deploy.md"] = edited(multi["docs/deploy.md"], "ロールバックの手順を追加。")
+            multi["src/app.py"] = "print('hello, webhook')\n"
+            del multi["docs/faq.md"]
+            multi["docs/guide.md"] = multi.pop("docs/old-name.md")
+            replay.run(
+                "multi-commit", [(multi, load_payload("push_multi_commit.json"))],
+                ["docs/api/webhooks.md", "docs/deploy.md", "docs/faq.md", "docs/guide.md", "docs/old-name.md"],
+                {"added": 2, "updated": 1, "deleted": 2}
+            )
+
+            branch = dict(multi)
+            branch["docs/setup.md"] = edited(branch["docs/setup.md"], "ブランチでの書き直し。")
+            replay.run("non-default-branch", [(branch, load_payload("push_non_default_branch.json"))], None)
+
+            # デフォルトブランチの内容に戻し、ファイルを1つずつ変える push を続けて送る
+            current = dict(multi)
+            template = json.loads(load_payload("push_single_commit.json"))
+            pushes = []
+            for i, path in enumerate(BURST_PATHS[:args.burst]):
+                current = {**current, path: edited(current[path], f"burst {i}")}
+                payload = copy.deepcopy(template)
+                commit_id = hashlib.sha1(f"burst-{i}".encode()).hexdigest()
+                payload["before"], payload["after"] = payload["after"], commit_id
+                payload["commits"][0].update(id=commit_id, modified=[path], message=f"docs: {path} を更新")
+                payload["head_commit"] = payload["commits"][0]
+                pushes.append((current, json.dumps(payload, ensure_ascii=False).encode()))
+            replay.run(
+                "burst", pushes, BURST_PATHS[:args.burst],
+                {"added": 0, "updated": args.burst, "deleted": 0}, interval=args.burst_interval_ms / 1000
+            )
+    finally:
+        stop_api()
+        stop_github()
+
+    print_table(
+        f"Webhook replay against FakeGitHub ({REPOSITORY}, WEBHOOK_DEBOUNCE_SECONDS={args.debounce_seconds}, "
+        f"burst of {args.burst} pushes {args.burst_interval_ms:.0f}ms apart)",
+        replay.rows
+    )
+    if replay.failures:
+        print("\n".join(["", "FAILED:", *replay.failures]))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
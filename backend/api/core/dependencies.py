@@ -0,0 +1,106 @@
+"""プロセス内で共有するサービスの登録（遅延初期化・FastAPIの依存性注入用）"""
+import os
+import threading
+
+from fastapi import HTTPException
+
+from core.executor import SYNC_WORKERS, shutdown_executors, sync_executor
+from services.chroma_service import ChromaService
+from services.github_service import GitHubService
+from services.job_store import SyncJobStore
+from services.openai_service import OpenAIService
+from services.sync_pipeline import SyncPipeline
+from services.sync_worker import SyncWorker
+
+_lock = threading.Lock()
+_chroma_service = None
+_github_service = None
+_openai_service = None
+_sync_pipeline = None
+_job_store = None
+_sync_worker = None
+
+
+def get_chroma_service() -> ChromaService:
+    """ChromaServiceの遅延初期化（クライアント・埋め込みモデルはプロセスで1つ）"""
+    global _chroma_service
+    if _chroma_service is None:
+        with _lock:
+            if _chroma_service is None:
+                _chroma_service = ChromaService()
+    return _chroma_service
+
+
+def get_github_service() -> GitHubService:
+    """GitHubServiceの遅延初期化"""
+    global _github_service
+    if _github_service is None:
+        with _lock:
+            if _github_service is None:
+                _github_service = GitHubService()
+    return _github_service
+
+
+def get_openai_service() -> OpenAIService:
+    """OpenAIサービスの遅延初期化"""
+    global _openai_service
+    if _openai_service is None:
+        if not os.getenv("OPENAI_API_KEY"):
+            raise HTTPException(
+                status_code=503,
+                detail="OpenAI API key is not configured. Chat feature is disabled."
+            )
+        with _lock:
+            if _openai_service is None:
+                _openai_service = OpenAIService()
+    return _openai_service
+
+
+def get_sync_pipeline() -> SyncPipeline:
+    """同期パイプラインの遅延初期化"""
+    global _sync_pipeline
+    if _sync_pipeline is None:
+        github_service = get_github_service()
+        chroma_service = get_chroma_service()
+        with _lock:
+            if _sync_pipeline is None:
+                _sync_pipeline = SyncPipeline(github_service, chroma_service)
+    return _sync_pipeline
+
+
+def get_job_store() -> SyncJobStore:
+    """同期ジョブストアの遅延初期化（全ワーカープロセスで同じSQLiteファイルを共有）"""
+    global _job_store
+    if _job_store is None:
+        with _lock:
+            if _job_store is None:
+                _job_store = SyncJobStore(os.getenv("SYNC_JOB_DB_PATH", "/data/sync_jobs.sqlite3"))
+    return _job_store
+
+
+def get_sync_worker() -> SyncWorker:
+    """同期ワーカーの遅延初期化"""
+    global _sync_worker
+    if _sync_worker is None:
+        job_store = get_job_store()
+        with _lock:
+            if _sync_worker is None:
+                _sync_worker = SyncWorker(job_store, get_sync_pipeline, sync_executor, SYNC_WORKERS)
+    return _sync_worker
+
+
+def init_services():
+    """起動時に重い初期化（ChromaDBクライアント・埋め込みモデル）を済ませ、同期ワーカーを開始"""
+    get_chroma_service()
+    get_github_service()
+    get_sync_worker().start()
+
+
+def close_services():
+    """終了時に同期ワーカー・スレッドプール・HTTPクライアントの順に停止"""
+    if _sync_worker is not None:
+        _sync_worker.stop()
+    # 実行中の同期ジョブの完了を待ってからクライアントを閉じる
+    shutdown_executors()
+    if _github_service is not None:
+        _github_service.close()
@@ -0,0 +1,51 @@
+"""ブロッキング処理用のスレッドプール
+
+ChromaDB・GitHub API（httpxの同期クライアント）・埋め込み計算は同期APIのため、async ハンドラから直接呼ぶと
+イベントループ全体が止まる。用途ごとに上限付きのプールを分け、
+同期処理が検索のスレッドを使い切らないようにする。
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+# 検索・チャットの検索処理（クエリ埋め込み + ANN検索）
+search_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SEARCH_WORKERS", "8")),
+    thread_name_prefix="search"
+)
+
+# バックグラウンド同期ジョブ（このプロセスで同時に実行する同期数の上限を兼ねる）
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "2"))
+sync_executor = ThreadPoolExecutor(
+    max_workers=SYNC_WORKERS,
+    thread_name_prefix="sync"
+)
+
+# その他のブロッキングI/O（GitHub API読み取り、管理系のChromaDB操作）
+io_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("IO_WORKERS", "4")),
+    thread_name_prefix="io"
+)
+
+
+async def run_in_executor(executor: ThreadPoolExecutor, func: Callable, *args, **kwargs) -> Any:
+    """同期関数を指定したプールで実行して結果を待つ"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+
+async def run_in_search(func: Callable, *args, **kwargs) -> Any:
+    return await run_in_executor(search_executor, func, *args, **kwargs)
+
+
+async def run_in_io(func: Callable, *args, **kwargs) -> Any:
+    return await run_in_executor(io_executor, func, *args, **kwargs)
+
+
+def shutdown_executors():
+    """アプリ終了時に全プールを停止（実行中の同期ジョブは完了を待つ）"""
+    search_executor.shutdown(wait=False, cancel_futures=True)
+    io_executor.shutdown(wait=False, cancel_futures=True)
+    sync_executor.shutdown(wait=True)
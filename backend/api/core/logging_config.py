@@ -0,0 +1,46 @@
+"""ログ出力の設定 - LOG_FORMAT=json で1行1JSONの構造化ログにする"""
+import json
+import logging
+import os
+import time
+
+# logging.LogRecord が標準で持つ属性（extra で渡した項目と区別する）
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """time / level / logger / message と extra で渡した項目を1行のJSONで出力"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging():
+    """
+    ルートロガーに標準エラー出力のハンドラーを設定
+
+    LOG_FORMAT: text（デフォルト）/ json
+    LOG_LEVEL: DEBUG / INFO（デフォルト）/ WARNING / ERROR
+    """
+    handler = logging.StreamHandler()
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    # httpx はリクエストごとに INFO を出すため、GitHub APIの個別リクエストは DEBUG のときだけ出す
+    logging.getLogger("httpx").setLevel(logging.DEBUG if root.level <= logging.DEBUG else logging.WARNING)
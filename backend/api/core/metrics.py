@@ -0,0 +1,126 @@
+"""Prometheus メトリクスの定義
+
+uvicorn を複数ワーカーで動かす場合は PROMETHEUS_MULTIPROC_DIR に空のディレクトリを指定すると、
+全ワーカーの値を合算して /metrics で返す
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess
+)
+
+# 検索・埋め込み・ChromaDB・GitHub向け（数ms〜数秒）
+FAST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# OpenAIの回答生成・同期の段階向け（数百ms〜数分）
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+HTTP_REQUESTS = Counter(
+    "rag_http_requests_total", "HTTPリクエスト数", ["method", "route", "status"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "rag_http_request_duration_seconds", "HTTPリクエストの所要時間（レスポンスヘッダーまで）",
+    ["method", "route"], buckets=SLOW_BUCKETS
+)
+
+SEARCH_SECONDS = Histogram(
+    "rag_search_duration_seconds", "ChromaService の検索の所要時間（キャッシュヒットを含む）",
+    ["operation", "mode"], buckets=FAST_BUCKETS
+)
+SEARCH_CACHE = Counter(
+    "rag_search_cache_total", "検索結果キャッシュの参照数", ["result"]
+)
+CHROMA_SECONDS = Histogram(
+    "rag_chroma_operation_duration_seconds", "ChromaDB への問い合わせ・書き込みの所要時間",
+    ["operation"], buckets=FAST_BUCKETS
+)
+ADD_DOCUMENTS_SECONDS = Histogram(
+    "rag_add_documents_duration_seconds", "ChromaService.add_documents 1回の所要時間（分割・埋め込み・書き込み）",
+    buckets=SLOW_BUCKETS
+)
+INDEXED_CHUNKS = Counter(
+    "rag_indexed_chunks_total", "コレクションに書き込んだチャンク数"
+)
+
+EMBEDDING_SECONDS = Histogram(
+    "rag_embedding_batch_duration_seconds", "埋め込みモデル1バッチ分の所要時間（リトライを含む）",
+    ["model"], buckets=SLOW_BUCKETS
+)
+EMBEDDING_TEXTS = Counter(
+    "rag_embedding_texts_total", "埋め込みを求められたテキスト数（キャッシュヒット・ミス別）", ["model", "result"]
+)
+EMBEDDING_TOKENS = Counter(
+    "rag_embedding_tokens_total", "埋め込みモデルに送ったトークン数", ["model"]
+)
+EMBEDDING_RETRIES = Counter(
+    "rag_embedding_retries_total", "埋め込みバッチのリトライ数", ["model"]
+)
+
+OPENAI_SECONDS = Histogram(
+    "rag_openai_request_duration_seconds", "OpenAI API呼び出しの所要時間",
+    ["model", "operation"], buckets=SLOW_BUCKETS
+)
+OPENAI_TOKENS = Counter(
+    "rag_openai_tokens_total", "OpenAI APIのトークン使用量", ["model", "operation", "kind"]
+)
+OPENAI_ERRORS = Counter(
+    "rag_openai_errors_total", "OpenAI API呼び出しの失敗数", ["model", "operation"]
+)
+
+GITHUB_REQUESTS = Counter(
+    "rag_github_requests_total", "GitHub APIへのリクエスト数（cached はリクエストせずにキャッシュから返した数）",
+    ["kind", "status"]
+)
+GITHUB_REQUEST_SECONDS = Histogram(
+    "rag_github_request_duration_seconds", "GitHub APIリクエストの所要時間", ["kind"], buckets=FAST_BUCKETS
+)
+GITHUB_RATE_LIMIT_REMAINING = Gauge(
+    "rag_github_rate_limit_remaining", "GitHub APIのレート制限の残り回数", ["resource"],
+    multiprocess_mode="mostrecent"
+)
+
+SYNC_JOBS = Counter(
+    "rag_sync_jobs_total", "終了した同期ジョブ数", ["status"]
+)
+SYNC_STAGE_SECONDS = Histogram(
+    "rag_sync_stage_duration_seconds", "同期ジョブ1回あたりの段階別の所要時間（段階内の合計）",
+    ["stage"], buckets=SLOW_BUCKETS
+)
+SYNC_FILES = Counter(
+    "rag_sync_files_total", "同期で処理したファイル数", ["change"]
+)
+
+
+@contextmanager
+def observe(histogram: Histogram, **labels: str):
+    """ブロックの所要時間を histogram に記録（例外で抜けた場合も記録する）"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        # ラベルのないメトリクスに labels() を呼ぶと ValueError になる
+        (histogram.labels(**labels) if labels else histogram).observe(time.perf_counter() - start)
+
+
+def observe_stages(histogram: Histogram, timings: Dict[str, float]):
+    """StageTimer の段階ごとの合計時間を記録"""
+    for stage, seconds in timings.items():
+        histogram.labels(stage=stage).observe(seconds)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """/metrics のレスポンス本文と Content-Type"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,44 @@
+"""処理段階ごとの所要時間計測"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class StageTimer:
+    """
+    段階名ごとに経過時間（秒）を積算する
+
+    同じ段階を複数回計測した場合は合計される（バッチ処理の積算用）
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def as_dict(self, ndigits: int = 3) -> Dict[str, float]:
+        """JSONに載せる用に丸めた辞書を返す"""
+        with self._lock:
+            return {name: round(seconds, ndigits) for name, seconds in self.timings.items()}
+
+
+def timings_ms(timer: StageTimer) -> Dict[str, float]:
+    """段階ごとの所要時間をミリ秒で返す"""
+    return {name: round(seconds * 1000, 1) for name, seconds in timer.timings.items()}
+
+
+def format_server_timing(timer: StageTimer) -> str:
+    """Server-Timing ヘッダーの値を組み立てる"""
+    return ", ".join(f"{name};dur={ms}" for name, ms in timings_ms(timer).items())
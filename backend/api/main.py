@@ -1,18 +1,43 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+import logging
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
+# 環境変数読み込み（core / services / routers はモジュールの読み込み時に環境変数を読むため、それらより先に行う。
+# PROMETHEUS_MULTIPROC_DIR も prometheus_client の読み込み前に設定されている必要がある）
+load_dotenv()
+
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.middleware.cors import CORSMiddleware  # noqa: E402
+from fastapi.responses import JSONResponse, Response  # noqa: E402
+from starlette.routing import Match  # noqa: E402
+from core.dependencies import close_services, init_services  # noqa: E402
+from core.executor import run_in_io  # noqa: E402
+from core.logging_config import configure_logging  # noqa: E402
+from core.metrics import HTTP_REQUEST_SECONDS, HTTP_REQUESTS, render_metrics  # noqa: E402
+from services.chroma_service import EmbeddingModelMismatch  # noqa: E402
+
 # ルーターインポート
-from routers import search, sync, repository, chat, admin, debug
+from routers import search, sync, repository, chat, admin, debug, webhook  # noqa: E402
 
-# 環境変数読み込み
-load_dotenv()
+configure_logging()
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 起動時にサービスを1回だけ初期化（ChromaDBクライアント・埋め込みモデルを共有）
+    await run_in_io(init_services)
+    yield
+    # 終了時に同期ワーカー・スレッドプール・HTTPクライアントを停止
+    close_services()
 
 # FastAPIアプリ初期化
 app = FastAPI(
     title="VPS RAG API",
     description="GitHub Repository RAG System",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS設定（開発時は全許可、本番では制限）
@@ -24,6 +49,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# コレクションを作ったモデルで埋め込みを計算できない場合は 409（force=true での再同期を促す）
+@app.exception_handler(EmbeddingModelMismatch)
+async def embedding_model_mismatch_handler(request: Request, exc: EmbeddingModelMismatch):
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+def route_template(request: Request) -> str:
+    """メトリクスのラベル用にパスパラメーターを含まないルートのパスを返す"""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+# リクエストごとの所要時間をメトリクスとログに記録
+@app.middleware("http")
+async def request_timing(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        route = route_template(request)
+        HTTP_REQUESTS.labels(request.method, route, str(status)).inc()
+        HTTP_REQUEST_SECONDS.labels(request.method, route).observe(elapsed)
+        logger.info(
+            "%s %s %d %.1fms", request.method, request.url.path, status, elapsed * 1000,
+            extra={"method": request.method, "route": route, "status": status, "duration_ms": round(elapsed * 1000, 1)}
+        )
+
 # ルーター登録
 app.include_router(search.router)
 app.include_router(sync.router)
@@ -31,6 +88,7 @@ app.include_router(repository.router)
 app.include_router(chat.router)
 app.include_router(admin.router)
 app.include_router(debug.router)
+app.include_router(webhook.router)
 
 # ルートエンドポイント
 @app.get("/")
@@ -45,4 +103,10 @@ async def root():
 # ヘルスチェック
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+# Prometheus メトリクス（認証不要。公開しない場合はリバースプロキシで制限）
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, headers={"Content-Type": content_type})
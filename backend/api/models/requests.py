@@ -1,26 +1,53 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 
 class SearchRequest(BaseModel):
     query: str
     repository: str
     limit: Optional[int] = 5
+    # vector: セマンティック検索 / keyword: BM25 / hybrid: 両者をRRFで統合
+    mode: Literal["vector", "keyword", "hybrid"] = "vector"
+    # 候補を多めに取得して再ランキングする
+    rerank: bool = False
 
 class SearchResponse(BaseModel):
     results: List[dict]
     total: int
+    rerank: Optional[dict] = None
 
 class SyncRequest(BaseModel):
     repository: str
     force: Optional[bool] = False
+    # ファイル本文の取得元（auto: 初回・強制同期はtarball、差分同期はblobごと）
+    source: Literal["auto", "api", "archive"] = "auto"
 
 class ChatRequest(BaseModel):
     message: str
     repository: str
     context_limit: Optional[int] = 3
+    debug: Optional[bool] = False
+    # false にすると回答キャッシュを使わずに必ず生成する
+    use_cache: bool = True
+    # 候補を多めに取得して再ランキングしてからコンテキストを作る
+    rerank: bool = False
 
 class DirectorySearchRequest(BaseModel):
     query: str
     repository: str
     directory: str = ""
-    limit: Optional[int] = 5
\ No newline at end of file
+    limit: Optional[int] = 5
+    # True: サブディレクトリを含む / False: 直下のファイルのみ
+    recursive: bool = True
+
+class MultiSearchRequest(BaseModel):
+    query: str
+    repositories: List[str] = Field(..., min_length=1, max_length=50)
+    limit: Optional[int] = 10
+    # 1リポジトリから採用する件数の上限（省略時は limit）
+    per_repo_limit: Optional[int] = None
+    mode: Literal["vector", "keyword", "hybrid"] = "vector"
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=32)
+    repository: str
+    limit: Optional[int] = 5
@@ -1,17 +1,17 @@
 from fastapi import APIRouter, Depends
 from core.auth import verify_token
-import chromadb
-import hashlib
+from core.dependencies import get_chroma_service, get_github_service
+from core.executor import run_in_io
+from services.answer_cache import answer_cache
+from services.chroma_service import ChromaService
+from services.embedding_service import get_embedding_service
+from services.github_service import GitHubService
+from services.query_cache import query_embedding_cache, search_result_cache
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
-@router.get("/collections")
-async def list_collections(token: str = Depends(verify_token)):
-    """
-    ChromaDBに保存されている全コレクション一覧
-    """
-    client = chromadb.PersistentClient(path="/data/chromadb")
-    collections = client.list_collections()
+def _list_collections(chroma_service: ChromaService) -> list:
+    collections = chroma_service.client.list_collections()
 
     result = []
     for col in collections:
@@ -24,51 +24,107 @@ async def list_collections(token: str = Depends(verify_token)):
             "probable_repo": repo_name,
             "document_count": col.count(),
             "created_at": metadata.get("created_at"),
-            "embedding_model": metadata.get("embedding_model")
+            "embedding_model": metadata.get("embedding_model"),
+            "embedding_dimensions": metadata.get("embedding_dimensions"),
+            "keyword_index_documents": chroma_service.keyword_index.count(col.name)
         })
 
-    return {"collections": result}
+    return result
+
+@router.get("/collections")
+async def list_collections(
+    token: str = Depends(verify_token),
+    chroma_service: ChromaService = Depends(get_chroma_service)
+):
+    """
+    ChromaDBに保存されている全コレクション一覧
+    """
+    return {"collections": await run_in_io(_list_collections, chroma_service)}
+
+def _delete_collection(chroma_service: ChromaService, collection_name: str):
+    chroma_service.client.delete_collection(name=collection_name)
+    chroma_service.forget_collection(collection_name=collection_name)
+    chroma_service.keyword_index.drop(collection_name)
+    chroma_service.invalidate_search_cache(collection_name=collection_name)
 
 @router.delete("/collections/{collection_name}")
 async def delete_collection(
     collection_name: str,
-    token: str = Depends(verify_token)
+    token: str = Depends(verify_token),
+    chroma_service: ChromaService = Depends(get_chroma_service)
 ):
     """
     特定のコレクションを削除
     """
-    client = chromadb.PersistentClient(path="/data/chromadb")
     try:
-        client.delete_collection(name=collection_name)
+        await run_in_io(_delete_collection, chroma_service, collection_name)
         return {"status": "success", "message": f"Collection {collection_name} deleted"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+def _peek_collection(chroma_service: ChromaService, repo_name: str, limit: int) -> dict:
+    collection_name = chroma_service.get_collection_name(repo_name)
+
+    col = chroma_service.client.get_collection(name=collection_name)
+    result = col.peek(limit)
+    return {
+        "repository": repo_name,
+        "collection_name": collection_name,
+        "total_documents": col.count(),
+        "sample_data": {
+            "ids": result.get('ids', [])[:3],
+            "metadatas": result.get('metadatas', [])[:3],
+            "documents": [doc[:100] + "..." if len(doc) > 100 else doc
+                        for doc in result.get('documents', [])[:3]]
+        }
+    }
+
 @router.get("/collection/{repo_name}/peek")
 async def peek_collection(
     repo_name: str,
     limit: int = 5,
-    token: str = Depends(verify_token)
+    token: str = Depends(verify_token),
+    chroma_service: ChromaService = Depends(get_chroma_service)
 ):
     """
     特定リポジトリのコレクション内容を確認
     """
-    client = chromadb.PersistentClient(path="/data/chromadb")
-    collection_name = f"repo_{hashlib.md5(repo_name.encode()).hexdigest()[:8]}"
-
     try:
-        col = client.get_collection(name=collection_name)
-        result = col.peek(limit)
-        return {
-            "repository": repo_name,
-            "collection_name": collection_name,
-            "total_documents": col.count(),
-            "sample_data": {
-                "ids": result.get('ids', [])[:3],
-                "metadatas": result.get('metadatas', [])[:3],
-                "documents": [doc[:100] + "..." if len(doc) > 100 else doc
-                            for doc in result.get('documents', [])[:3]]
-            }
-        }
+        return await run_in_io(_peek_collection, chroma_service, repo_name, limit)
     except Exception as e:
-        return {"status": "error", "message": f"Collection not found: {str(e)}"}
\ No newline at end of file
+        return {"status": "error", "message": f"Collection not found: {str(e)}"}
+
+def _embedding_stats() -> dict:
+    # 初回は埋め込みモデルの読み込みも行うため、サービスの取得もスレッドで行う
+    return get_embedding_service().stats()
+
+@router.get("/embeddings/stats")
+async def embedding_stats(token: str = Depends(verify_token)):
+    """
+    埋め込みキャッシュのヒット率・節約トークン数
+    """
+    return await run_in_io(_embedding_stats)
+
+def _cache_stats() -> dict:
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "search_results": search_result_cache.stats(),
+        "answers": answer_cache.stats()
+    }
+
+@router.get("/cache/stats")
+async def cache_stats(token: str = Depends(verify_token)):
+    """
+    クエリ埋め込みキャッシュ・検索結果キャッシュ・回答キャッシュの統計
+    """
+    return await run_in_io(_cache_stats)
+
+@router.get("/github/stats")
+async def github_stats(
+    token: str = Depends(verify_token),
+    github_service: GitHubService = Depends(get_github_service)
+):
+    """
+    GitHub APIの条件付きリクエスト（ETag）キャッシュのヒット率とレート制限の残量
+    """
+    return await run_in_io(github_service.stats)
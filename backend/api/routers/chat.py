@@ -1,32 +1,166 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from models.requests import ChatRequest
 from core.auth import verify_token
-from services.chroma_service import ChromaService
-from services.openai_service import OpenAIService
+from core.timing import StageTimer, format_server_timing, timings_ms
+from core.dependencies import get_chroma_service, get_openai_service
+from core.executor import run_in_search
+from services.answer_cache import answer_cache
+from services.chroma_service import ChromaService, EmbeddingModelMismatch
+from services.context_builder import ContextBuilder
+from services.openai_service import CHAT_MODEL
+from services.reranker import RERANK_CANDIDATES, rerank_results
+from services.tokenizer import get_token_counter
+from typing import List, Optional, Tuple
+import json
+import logging
 import os
+import time
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api", tags=["chat"])
 
-# サービスのインスタンス化
-chroma_service = ChromaService()
-openai_service = None
-
-def get_openai_service():
-    """OpenAIサービスの遅延初期化"""
-    global openai_service
-    if openai_service is None:
-        if not os.getenv("OPENAI_API_KEY"):
-            raise HTTPException(
-                status_code=503,
-                detail="OpenAI API key is not configured. Chat feature is disabled."
-            )
-        openai_service = OpenAIService()
-    return openai_service
+# debug=true の場合に返す検索結果の件数
+DEBUG_RESULT_LIMIT = 20
+
+# コンテキストに使うトークン数の上限（回答生成モデルのトークナイザーで数える）
+context_builder = ContextBuilder(
+    get_token_counter(CHAT_MODEL),
+    token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+)
+
+NO_RESULTS_ANSWER = "関連するドキュメントが見つかりませんでした。リポジトリが同期されているか確認してください。"
+
+async def retrieve(
+    request: ChatRequest,
+    chroma_service: ChromaService,
+    timer: StageTimer,
+    index_version: Optional[Tuple[str, str]] = None
+) -> Tuple[List[dict], List[dict], Optional[dict]]:
+    """
+    関連ドキュメントを1回の検索で取得
+
+    rerank=true の場合は候補を多めに取得し、再ランキングした上位をコンテキストに使う。
+    index_version には回答キャッシュを引いたときのバージョンを渡す（回答とコンテキストのバージョンを揃える）
+
+    Returns:
+        (デバッグ用を含む全検索結果, コンテキストに使う上位 context_limit 件, 再ランキングの情報)
+    """
+    context_limit = request.context_limit or 10  # デフォルトを10に増加
+    n_results = max(context_limit, DEBUG_RESULT_LIMIT) if request.debug else context_limit
+    if request.rerank:
+        n_results = max(n_results, RERANK_CANDIDATES)
+
+    with timer.stage("retrieve"):
+        all_search_results = await run_in_search(
+            chroma_service.search,
+            repo_name=request.repository,
+            query=request.message,
+            n_results=n_results,
+            index_version=index_version
+        )
+
+    if not request.rerank:
+        return all_search_results, all_search_results[:context_limit], None
+
+    with timer.stage("rerank"):
+        search_results, rerank_info = await run_in_search(
+            rerank_results, request.message, all_search_results, context_limit
+        )
+    return all_search_results, search_results, rerank_info
+
+def lookup_answer(
+    chroma_service: ChromaService,
+    request: ChatRequest
+) -> Tuple[Optional[tuple], Optional[Tuple[dict, float]]]:
+    """
+    回答キャッシュを引く（検索プールで実行する）
+
+    バージョン（コレクションID・index_version）と回答条件（context_limit・rerank）ごとに引く。
+    同期でバージョンが変わると以前の回答は使われない
+
+    Returns:
+        (保存用のキー (バージョン, クエリ埋め込み, 回答条件), ヒットした (回答, 類似度))。
+        キャッシュを使わない場合はキーも None
+    """
+    if not request.use_cache or request.debug:
+        return None, None
+
+    version = chroma_service.get_index_version(request.repository)
+    if version is None:
+        return None, None
+
+    cache_key = (
+        version,
+        chroma_service.embed_query(request.message, chroma_service.collection_embedder(request.repository)),
+        (request.context_limit or 10, request.rerank)
+    )
+    return cache_key, answer_cache.get(request.repository, *cache_key)
+
+def cache_version(cache_key: Optional[tuple]) -> Optional[Tuple[str, str]]:
+    """回答キャッシュのキーに含まれるコレクションのバージョン"""
+    return cache_key[0] if cache_key is not None else None
+
+def store_answer(request: ChatRequest, cache_key: Optional[tuple], result: dict):
+    """最後まで生成できた回答だけを渡すこと（エラーはキャッシュしない）"""
+    if cache_key is not None:
+        version, embedding, variant = cache_key
+        answer_cache.set(request.repository, version, embedding, result, variant)
+
+def build_context(search_results: List[dict], timer: StageTimer) -> Tuple[str, dict]:
+    """
+    検索結果のチャンクをトークン予算内でコンテキストにまとめる
+
+    Returns:
+        (コンテキスト, 採用したチャンク・トークン数の情報)
+    """
+    with timer.stage("build_context"):
+        return context_builder.build(search_results)
+
+def format_sources(search_results: List[dict]) -> List[dict]:
+    """ソース情報を整形"""
+    sources = []
+    for result in search_results:
+        metadata = result.get('metadata', {})
+        sources.append({
+            "path": metadata.get('path', 'Unknown'),
+            "relevance": round(result.get('score', 0), 3),
+            "chunk_index": metadata.get('chunk_index', 0),
+            "preview": result.get('content', '')[:100] + "..."
+        })
+    return sources
+
+def format_debug(
+    request: ChatRequest,
+    all_search_results: List[dict],
+    timer: StageTimer,
+    packing: Optional[dict] = None,
+    rerank_info: Optional[dict] = None
+) -> dict:
+    """デバッグ用: 同じ検索結果から上位20件と段階別の所要時間"""
+    return {
+        "total_search_results": len(all_search_results),
+        "all_results": [
+            {
+                "path": r.get('metadata', {}).get('path', 'Unknown'),
+                "score": round(r.get('score', 0), 3),
+                "preview": r.get('content', '')[:100] + "..."
+            }
+            for r in all_search_results
+        ],
+        "context_limit": request.context_limit or 10,
+        "context": packing,
+        "rerank": rerank_info,
+        "timings_ms": timings_ms(timer)
+    }
 
 @router.post("/chat")
 async def chat(
     request: ChatRequest,
-    token: str = Depends(verify_token)
+    response: Response,
+    token: str = Depends(verify_token),
+    chroma_service: ChromaService = Depends(get_chroma_service)
 ):
     """
     RAGベースのAIチャット
@@ -34,93 +168,185 @@ async def chat(
     1. ユーザーの質問に関連するドキュメントをChromaDBから検索
     2. 検索結果をコンテキストとしてOpenAI APIに送信
     3. AIが生成した回答とソース情報を返却
+
+    検索は1回のみ。debug=true の場合は同じ検索で上位20件まで取得してデバッグ情報に使う。
+    各段階の所要時間は Server-Timing ヘッダー（debug時はdebugブロックにも）で返す。
+    似た質問への回答がキャッシュにあればそれを返す（use_cache=false または debug=true で無効）。
     """
+    timer = StageTimer()
     try:
         # OpenAIサービスを取得
         ai_service = get_openai_service()
 
-        # 1. セマンティック検索で関連ドキュメント取得（より多く取得）
-        search_results = chroma_service.search(
-            repo_name=request.repository,
-            query=request.message,
-            n_results=request.context_limit or 10  # デフォルトを10に増加
+        # 0. 回答キャッシュ（同じリポジトリ・同じインデックスバージョンでの類似質問）
+        with timer.stage("answer_cache"):
+            cache_key, cached = await run_in_search(lookup_answer, chroma_service, request)
+        if cached is not None:
+            answer, similarity = cached
+            response.headers["Server-Timing"] = format_server_timing(timer)
+            return {**answer, "cached": True, "cache_similarity": round(similarity, 4)}
+
+        # 1. セマンティック検索で関連ドキュメント取得（コンテキスト・デバッグ共通）
+        all_search_results, search_results, rerank_info = await retrieve(
+            request, chroma_service, timer, cache_version(cache_key)
         )
 
         if not search_results:
+            response.headers["Server-Timing"] = format_server_timing(timer)
             return {
-                "answer": "関連するドキュメントが見つかりませんでした。リポジトリが同期されているか確認してください。",
+                "answer": NO_RESULTS_ANSWER,
                 "sources": [],
                 "context_used": 0
             }
 
-        # 2. コンテキスト構築（チャンクを結合）
-        context_chunks = []
-        for i, result in enumerate(search_results[:request.context_limit], 1):
-            metadata = result.get('metadata', {})
-            content = result.get('content', '')
-            path = metadata.get('path', 'Unknown')
+        # 2. コンテキスト構築（重複を除き、隣接チャンクをまとめてトークン予算内に詰める）
+        context, packing = build_context(search_results, timer)
 
-            context_chunks.append(
-                f"--- ドキュメント {i}: {path} ---\n{content}"
-            )
+        # 3. OpenAI APIで回答生成（非同期クライアントでイベントループをブロックしない）
+        with timer.stage("generate"):
+            try:
+                answer = await ai_service.agenerate_response(
+                    query=request.message,
+                    context=context,
+                    max_tokens=500
+                )
+            except Exception as e:
+                # 生成に失敗した場合は回答を返さない（キャッシュもしない）
+                raise HTTPException(status_code=502, detail=f"回答の生成に失敗しました: {str(e)}")
 
-        context = "\n\n".join(context_chunks)
-
-        # コンテキストサイズ制限（約3000文字）
-        if len(context) > 3000:
-            context = context[:3000] + "\n...[以下省略]"
-
-        # 3. OpenAI APIで回答生成
-        answer = ai_service.generate_response(
-            query=request.message,
-            context=context,
-            max_tokens=500
-        )
+        response.headers["Server-Timing"] = format_server_timing(timer)
 
         # 4. ソース情報を整形
-        sources = []
-        for result in search_results[:request.context_limit]:
-            metadata = result.get('metadata', {})
-            sources.append({
-                "path": metadata.get('path', 'Unknown'),
-                "relevance": round(result.get('score', 0), 3),
-                "chunk_index": metadata.get('chunk_index', 0),
-                "preview": result.get('content', '')[:100] + "..."
-            })
-
-        # デバッグ用: 全検索結果を含める
-        all_search_results = chroma_service.search(
-            repo_name=request.repository,
-            query=request.message,
-            n_results=20  # より多くの結果を取得
-        )
-
-        debug_results = [
-            {
-                "path": result.get('metadata', {}).get('path', 'Unknown'),
-                "score": round(result.get('score', 0), 3),
-                "preview": result.get('content', '')[:100] + "..."
-            }
-            for result in all_search_results
-        ]
-
-        return {
+        result = {
             "answer": answer,
-            "sources": sources,
-            "context_used": len(search_results),
-            "repository": request.repository,
-            "debug": {
-                "total_search_results": len(all_search_results),
-                "all_results": debug_results,
-                "context_limit": request.context_limit or 10
-            }
+            "sources": format_sources(search_results),
+            "context_used": packing["chunks"],
+            "context_tokens": packing["tokens"],
+            "repository": request.repository
         }
+        store_answer(request, cache_key, result)
+
+        if request.debug:
+            result["debug"] = format_debug(request, all_search_results, timer, packing, rerank_info)
 
-    except HTTPException:
+        return {**result, "cached": False}
+
+    except (HTTPException, EmbeddingModelMismatch):
         raise
     except Exception as e:
-        print(f"Chat error: {e}")
+        logger.exception("Chat error: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"チャット処理中にエラーが発生しました: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+def sse_event(event: str, data: dict) -> str:
+    """Server-Sent Events の1イベント分の文字列"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    token: str = Depends(verify_token),
+    chroma_service: ChromaService = Depends(get_chroma_service)
+):
+    """
+    RAGベースのAIチャット（Server-Sent Events でストリーミング）
+
+    イベント順:
+    1. sources: 参照ドキュメント（回答生成前に送信）
+    2. token: 生成されたテキストの差分（複数回）
+    3. done: 段階別の所要時間と最初のトークンまでの時間（ttft_ms）
+    エラー時は error イベントを送信して終了する。
+    回答キャッシュにヒットした場合は回答全体を1つの token イベントで送る
+    """
+    ai_service = get_openai_service()
+
+    async def event_stream():
+        timer = StageTimer()
+        started = time.perf_counter()
+        try:
+            with timer.stage("answer_cache"):
+                cache_key, cached = await run_in_search(lookup_answer, chroma_service, request)
+            if cached is not None:
+                answer, similarity = cached
+                yield sse_event("sources", {
+                    "sources": answer["sources"],
+                    "context_used": answer["context_used"],
+                    "repository": request.repository
+                })
+                yield sse_event("token", {"content": answer["answer"]})
+                yield sse_event("done", {
+                    "timings_ms": timings_ms(timer),
+                    "ttft_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "context_used": answer["context_used"],
+                    "context_tokens": answer["context_tokens"],
+                    "cached": True,
+                    "cache_similarity": round(similarity, 4)
+                })
+                return
+
+            all_search_results, search_results, rerank_info = await retrieve(
+                request, chroma_service, timer, cache_version(cache_key)
+            )
+
+            # context_used を done と同じ値（コンテキストに採用したチャンク数）にするため、sources の前に組み立てる
+            context, packing = build_context(search_results, timer)
+
+            yield sse_event("sources", {
+                "sources": format_sources(search_results),
+                "context_used": packing["chunks"],
+                "repository": request.repository
+            })
+
+            if not search_results:
+                yield sse_event("token", {"content": NO_RESULTS_ANSWER})
+                yield sse_event("done", {"timings_ms": timings_ms(timer)})
+                return
+
+            ttft_ms = None
+            deltas = []
+            generate_started = time.perf_counter()
+            async for delta in ai_service.stream_response(
+                query=request.message,
+                context=context,
+                max_tokens=500
+            ):
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                deltas.append(delta)
+                yield sse_event("token", {"content": delta})
+            timer.add("generate", time.perf_counter() - generate_started)
+
+            # 最後まで生成できた回答だけをキャッシュする
+            store_answer(request, cache_key, {
+                "answer": "".join(deltas),
+                "sources": format_sources(search_results),
+                "context_used": packing["chunks"],
+                "context_tokens": packing["tokens"],
+                "repository": request.repository
+            })
+
+            done = {
+                "timings_ms": timings_ms(timer),
+                "ttft_ms": ttft_ms,
+                "context_used": packing["chunks"],
+                "context_tokens": packing["tokens"],
+                "cached": False
+            }
+            if request.debug:
+                done["debug"] = format_debug(request, all_search_results, timer, packing, rerank_info)
+            yield sse_event("done", done)
+
+        except Exception as e:
+            logger.exception("Chat stream error: %s", e)
+            yield sse_event("error", {"detail": f"チャット処理中にエラーが発生しました: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # nginxでバッファリングさせない
+        }
+    )
@@ -1,21 +1,23 @@
 from fastapi import APIRouter, Depends
 from core.auth import verify_token
+from core.dependencies import get_github_service
+from core.executor import run_in_io
 from services.github_service import GitHubService
 
 router = APIRouter(prefix="/api/debug", tags=["debug"])
-github_service = GitHubService()
 
 @router.get("/files/{repo_owner}/{repo_name}")
 async def list_github_files(
     repo_owner: str,
     repo_name: str,
-    token: str = Depends(verify_token)
+    token: str = Depends(verify_token),
+    github_service: GitHubService = Depends(get_github_service)
 ):
     """
-    GitHubから実際に取得されるファイル一覧を確認
+    GitHubから実際に取得されるファイル一覧を確認（ツリー一覧のみ、本文は取得しない）
     """
     repo_full_name = f"{repo_owner}/{repo_name}"
-    files = github_service.get_markdown_files(repo_full_name, limit=200)
+    files = await run_in_io(github_service.list_markdown_files, repo_full_name, limit=200)
 
     # architectureを含むファイルを探す
     architecture_files = [
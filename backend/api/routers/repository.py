@@ -1,20 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException
 from core.auth import verify_token
+from core.dependencies import get_github_service
+from core.executor import run_in_io
 from services.github_service import GitHubService
 
 router = APIRouter(prefix="/api", tags=["repository"])
-github_service = GitHubService()
 
 @router.get("/repository/structure")
 async def get_repository_structure(
     repo_name: str,
-    token: str = Depends(verify_token)
+    token: str = Depends(verify_token),
+    github_service: GitHubService = Depends(get_github_service)
 ):
     """
     リポジトリの階層構造を取得
+
+    ツリー一覧（パス・サイズ）だけから組み立て、ファイル本文は取得しない
     """
     try:
-        files = github_service.get_all_markdown_files(repo_name)
+        files = await run_in_io(github_service.list_markdown_tree, repo_name)
 
         structure = {}
         for file in files:
@@ -1,25 +1,45 @@
-from fastapi import APIRouter, Depends
-from models.requests import SearchRequest, SearchResponse, DirectorySearchRequest
+import asyncio
+
+from fastapi import APIRouter, Depends, Response
+from models.requests import (
+    BatchSearchRequest,
+    DirectorySearchRequest,
+    MultiSearchRequest,
+    SearchRequest,
+    SearchResponse
+)
 from core.auth import verify_token
-from services.chroma_service import ChromaService
+from core.dependencies import get_chroma_service
+from core.executor import run_in_search
+from core.timing import StageTimer, format_server_timing, timings_ms
+from services.chroma_service import ChromaService, merge_repository_results
+from services.reranker import RERANK_CANDIDATES, rerank_results
 
 router = APIRouter(prefix="/api", tags=["search"])
-chroma_service = ChromaService()
 
 @router.post("/search", response_model=SearchResponse)
 async def search(
     request: SearchRequest,
-    token: str = Depends(verify_token)
+    token: str = Depends(verify_token),
+    chroma_service: ChromaService = Depends(get_chroma_service)
 ):
     """
-    リポジトリ内のドキュメントをセマンティック検索
+    リポジトリ内のドキュメントを検索（mode でセマンティック / キーワード / ハイブリッドを選択）
+
+    rerank=true の場合は候補を多めに取得し、再ランキングした上位 limit 件を返す
     """
-    results = chroma_service.search(
+    results = await run_in_search(
+        chroma_service.search,
         repo_name=request.repository,
         query=request.query,
-        n_results=request.limit
+        n_results=max(request.limit, RERANK_CANDIDATES) if request.rerank else request.limit,
+        mode=request.mode
     )
 
+    rerank_info = None
+    if request.rerank:
+        results, rerank_info = await run_in_search(rerank_results, request.query, results, request.limit)
+
     if not results:
         results = [
             {
@@ -34,26 +54,31 @@ async def search(
 
     return SearchResponse(
         results=results,
-        total=len(results)
+        total=len(results),
+        rerank=rerank_info
     )
 
 @router.post("/search/directory")
 async def search_directory(
     request: DirectorySearchRequest,
-    token: str = Depends(verify_token)
+    token: str = Depends(verify_token),
+    chroma_service: ChromaService = Depends(get_chroma_service)
 ):
     """
     特定ディレクトリ内でのセマンティック検索
     """
     if request.directory:
-        results = chroma_service.search_by_directory(
+        results = await run_in_search(
+            chroma_service.search_by_directory,
             repo_name=request.repository,
             directory=request.directory,
             query=request.query,
-            n_results=request.limit
+            n_results=request.limit,
+            recursive=request.recursive
         )
     else:
-        results = chroma_service.search(
+        results = await run_in_search(
+            chroma_service.search,
             repo_name=request.repository,
             query=request.query,
             n_results=request.limit
@@ -62,4 +87,76 @@ async def search_directory(
     return SearchResponse(
         results=results,
         total=len(results)
-    )
\ No newline at end of file
+    )
+
+@router.post("/search/multi", response_model=SearchResponse)
+async def search_multi(
+    request: MultiSearchRequest,
+    token: str = Depends(verify_token),
+    chroma_service: ChromaService = Depends(get_chroma_service)
+):
+    """
+    複数リポジトリを横断して検索
+
+    クエリの埋め込みは1回だけ計算し、各リポジトリのコレクションを並列に検索して
+    スコア順に統合する（1リポジトリあたり per_repo_limit 件まで）
+    """
+    repositories = list(dict.fromkeys(request.repositories))
+    per_repo_limit = request.per_repo_limit or request.limit
+
+    query_embedding = None
+    if request.mode != "keyword":
+        query_embedding = await run_in_search(chroma_service.embed_query, request.query)
+
+    results_by_repo = await asyncio.gather(*(
+        run_in_search(
+            chroma_service.search,
+            repo_name=repository,
+            query=request.query,
+            n_results=per_repo_limit,
+            mode=request.mode,
+            query_embedding=query_embedding
+        )
+        for repository in repositories
+    ))
+
+    results = merge_repository_results(
+        dict(zip(repositories, results_by_repo)),
+        request.limit,
+        per_repo_limit
+    )
+
+    return SearchResponse(
+        results=results,
+        total=len(results)
+    )
+
+@router.post("/search/batch")
+async def search_batch(
+    request: BatchSearchRequest,
+    response: Response,
+    token: str = Depends(verify_token),
+    chroma_service: ChromaService = Depends(get_chroma_service)
+):
+    """
+    複数クエリを1リクエストでセマンティック検索
+
+    埋め込みとChromaDBへの問い合わせはそれぞれ1回にまとめる。
+    クエリごとの結果と所要時間、全体の段階別所要時間を返す
+    """
+    timer = StageTimer()
+    with timer.stage("total"):
+        items = await run_in_search(
+            chroma_service.search_batch,
+            repo_name=request.repository,
+            queries=request.queries,
+            n_results=request.limit,
+            timer=timer
+        )
+
+    response.headers["Server-Timing"] = format_server_timing(timer)
+    return {
+        "results": [{**item, "total": len(item["results"])} for item in items],
+        "total_queries": len(items),
+        "timings_ms": timings_ms(timer)
+    }
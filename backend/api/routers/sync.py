@@ -1,107 +1,52 @@
-from fastapi import APIRouter, Depends, BackgroundTasks
+from fastapi import APIRouter, Depends
 from models.requests import SyncRequest
 from core.auth import verify_token
-from services.github_service import GitHubService
-from services.chroma_service import ChromaService
-import uuid
-import time
+from core.dependencies import get_job_store, get_sync_worker
+from core.executor import run_in_io
+from services.job_store import SyncJobStore
 
 router = APIRouter(prefix="/api", tags=["sync"])
-github_service = GitHubService()
-chroma_service = ChromaService()
-
-# メモリベースのジョブ管理
-sync_jobs = {}  # job_id: {status, repository, files_synced, started_at, completed_at, error}
-
-def cleanup_old_jobs():
-    """1時間以上経過したジョブを削除"""
-    cutoff = time.time() - 3600
-    global sync_jobs
-    sync_jobs = {k: v for k, v in sync_jobs.items()
-                 if v.get("started_at", 0) > cutoff}
-
-def do_sync(job_id: str, repository: str):
-    """バックグラウンドで実行される同期処理"""
-    try:
-        files = github_service.get_markdown_files(repository)
-
-        if not files:
-            sync_jobs[job_id] = {
-                "status": "error",
-                "repository": repository,
-                "files_synced": 0,
-                "started_at": sync_jobs[job_id]["started_at"],
-                "completed_at": time.time(),
-                "error": "No markdown files found or repository not accessible"
-            }
-            return
-
-        chroma_service.add_documents(repository, files)
-
-        sync_jobs[job_id] = {
-            "status": "completed",
-            "repository": repository,
-            "files_synced": len(files),
-            "started_at": sync_jobs[job_id]["started_at"],
-            "completed_at": time.time(),
-            "message": f"Successfully synced {len(files)} files"
-        }
-
-    except Exception as e:
-        sync_jobs[job_id] = {
-            "status": "error",
-            "repository": repository,
-            "files_synced": 0,
-            "started_at": sync_jobs[job_id]["started_at"],
-            "completed_at": time.time(),
-            "error": str(e)
-        }
 
 @router.post("/sync")
 async def sync_repository(
     request: SyncRequest,
-    background_tasks: BackgroundTasks,
-    token: str = Depends(verify_token)
+    token: str = Depends(verify_token),
+    job_store: SyncJobStore = Depends(get_job_store)
 ):
     """
     GitHubリポジトリをChromaDBに同期（非同期）
-    ジョブIDを即座に返し、バックグラウンドで処理
-    """
-    # 古いジョブのクリーンアップ
-    cleanup_old_jobs()
+    ジョブIDを即座に返し、同期ワーカーがジョブストアから取り出して処理
+    通常は差分同期、force=true でコレクションを全件再構築
+    初回・強制同期はリポジトリのtarballを1回だけダウンロードして読む（source で指定も可能）
 
-    # ジョブIDを生成
-    job_id = str(uuid.uuid4())
-
-    # ジョブを登録
-    sync_jobs[job_id] = {
-        "status": "processing",
-        "repository": request.repository,
-        "started_at": time.time()
-    }
-
-    # バックグラウンドタスクとして実行
-    background_tasks.add_task(do_sync, job_id, request.repository)
+    同じリポジトリの未実行ジョブが既にあれば、新しいジョブは作らずそのジョブIDを返す
+    """
+    job, created = await run_in_io(
+        job_store.enqueue, request.repository, bool(request.force), source=request.source
+    )
+    get_sync_worker().wake()
 
     return {
-        "job_id": job_id,
-        "status": "processing",
+        "job_id": job["job_id"],
+        "status": job["status"],
         "repository": request.repository,
-        "message": "Sync started in background"
+        "message": "Sync queued" if created else "Sync already queued for this repository"
     }
 
 @router.get("/sync/status/{job_id}")
 async def get_sync_status(
     job_id: str,
-    token: str = Depends(verify_token)
+    token: str = Depends(verify_token),
+    job_store: SyncJobStore = Depends(get_job_store)
 ):
     """
-    同期ジョブのステータスを取得
+    同期ジョブのステータスを取得（どのワーカープロセスからでも参照可能）
     """
-    if job_id not in sync_jobs:
+    job = await run_in_io(job_store.get, job_id)
+    if job is None:
         return {
             "status": "not_found",
             "message": "Job ID not found or expired"
         }
 
-    return sync_jobs[job_id]
\ No newline at end of file
+    return job
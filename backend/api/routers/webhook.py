@@ -0,0 +1,89 @@
+import hashlib
+import hmac
+import json
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from core.dependencies import get_chroma_service, get_job_store, get_sync_worker
+from core.executor import run_in_io
+from services.chroma_service import ChromaService
+from services.job_store import SyncJobStore
+
+router = APIRouter(prefix="/api/webhooks", tags=["webhooks"])
+
+# 連続するpushを1回の同期にまとめるため、最後のpushからこの秒数待って同期する
+WEBHOOK_DEBOUNCE_SECONDS = float(os.getenv("WEBHOOK_DEBOUNCE_SECONDS", "5"))
+
+def verify_signature(body: bytes, signature: Optional[str]):
+    """X-Hub-Signature-256（本文の HMAC-SHA256）を GITHUB_WEBHOOK_SECRET で検証"""
+    secret = os.getenv("GITHUB_WEBHOOK_SECRET")
+    if not secret:
+        raise HTTPException(status_code=503, detail="Webhook secret is not configured")
+
+    expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    if not signature or not hmac.compare_digest(expected, signature):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+def changed_markdown_paths(payload: dict) -> List[str]:
+    """pushに含まれるコミットで追加・変更・削除された.mdファイルのパス"""
+    paths = set()
+    for commit in payload.get("commits") or []:
+        for key in ("added", "modified", "removed"):
+            paths.update(path for path in commit.get(key) or [] if path.endswith('.md'))
+    return sorted(paths)
+
+@router.post("/github")
+async def github_webhook(
+    request: Request,
+    x_github_event: Optional[str] = Header(None),
+    x_hub_signature_256: Optional[str] = Header(None),
+    job_store: SyncJobStore = Depends(get_job_store),
+    chroma_service: ChromaService = Depends(get_chroma_service)
+):
+    """
+    GitHubのpush Webhookを受けて、変更された.mdファイルだけを同期
+
+    デフォルトブランチへのpushのみ対象。同じリポジトリへの連続したpushは
+    WEBHOOK_DEBOUNCE_SECONDS 秒待つ間に1つのジョブにまとめる。
+    未同期のリポジトリ、force push の場合はリポジトリ全体の差分同期にする
+    """
+    body = await request.body()
+    verify_signature(body, x_hub_signature_256)
+
+    if x_github_event == "ping":
+        return {"status": "pong"}
+    if x_github_event != "push":
+        return {"status": "ignored", "message": f"Event {x_github_event} is not handled"}
+
+    try:
+        payload = json.loads(body)
+        repository = payload["repository"]["full_name"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid push payload")
+
+    default_branch = payload["repository"].get("default_branch")
+    if payload.get("ref") != f"refs/heads/{default_branch}" or payload.get("deleted"):
+        return {"status": "ignored", "repository": repository, "message": "Not a push to the default branch"}
+
+    paths = changed_markdown_paths(payload)
+    # 書き換えられた履歴はコミット一覧からは差分が分からないため全体を比較する
+    full_sync = payload.get("forced") or await run_in_io(chroma_service.get_index_version, repository) is None
+    if not paths and not full_sync:
+        return {"status": "ignored", "repository": repository, "message": "No markdown changes"}
+
+    job, created = await run_in_io(
+        job_store.enqueue,
+        repository,
+        paths=None if full_sync else paths,
+        delay=WEBHOOK_DEBOUNCE_SECONDS
+    )
+    get_sync_worker().wake()
+
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "repository": repository,
+        "paths": job.get("paths"),
+        "message": "Sync queued" if created else "Merged into the queued sync for this repository"
+    }
@@ -0,0 +1,139 @@
+"""チャット回答のセマンティックキャッシュ - 言い回しの違う同じ質問に過去の回答を返す"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    クエリ埋め込みのコサイン類似度で過去の回答を引くキャッシュ
+
+    エントリは (リポジトリ, インデックスバージョン, 回答条件) ごとに分かれ、
+    同期でバージョンが変わったリポジトリの古いエントリは次の参照時にまとめて破棄する。
+    件数上限を超えると最後に使われた時刻が古いものから追い出す（LRU）
+    """
+
+    def __init__(self, maxsize: int, ttl: float, threshold: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        # エントリID -> ((リポジトリ, バージョン, 回答条件), 正規化済み埋め込み, 期限, 値)
+        self._entries: "OrderedDict[int, Tuple[Tuple, np.ndarray, float, Any]]" = OrderedDict()
+        # リポジトリ -> 最後に参照したバージョン
+        self._versions: Dict[str, Hashable] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop_stale_versions(self, repository: str, version: Hashable):
+        """リポジトリのバージョンが変わっていたら旧バージョンのエントリを破棄（ロック内で呼ぶ）"""
+        if self._versions.get(repository) == version:
+            return
+        self._versions[repository] = version
+        stale = [
+            entry_id for entry_id, (scope, _, _, _) in self._entries.items()
+            if scope[0] == repository and scope[1] != version
+        ]
+        for entry_id in stale:
+            del self._entries[entry_id]
+        self._stats["invalidations"] += len(stale)
+
+    def get(
+        self,
+        repository: str,
+        version: Hashable,
+        embedding: List[float],
+        variant: Hashable = None
+    ) -> Optional[Tuple[Any, float]]:
+        """
+        同じリポジトリ・バージョン・回答条件（variant）のうち、類似度が閾値以上で最も近いエントリを返す
+
+        Returns:
+            (値, 類似度)。見つからなければ None
+        """
+        scope = (repository, version, variant)
+        query = self._normalize(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            self._drop_stale_versions(repository, version)
+
+            best_id, best_similarity = None, self.threshold
+            expired = []
+            for entry_id, (entry_scope, vector, expires_at, _) in self._entries.items():
+                if entry_scope != scope:
+                    continue
+                if expires_at < now:
+                    expired.append(entry_id)
+                    continue
+                similarity = float(np.dot(query, vector))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            for entry_id in expired:
+                del self._entries[entry_id]
+
+            if best_id is None:
+                self._stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self._stats["hits"] += 1
+            return self._entries[best_id][3], best_similarity
+
+    def set(
+        self,
+        repository: str,
+        version: Hashable,
+        embedding: List[float],
+        value: Any,
+        variant: Hashable = None
+    ):
+        if self.maxsize <= 0:
+            return
+        scope = (repository, version, variant)
+        with self._lock:
+            # 保存までの間に同期が走っていたら古いバージョンの回答は保存しない
+            if self._versions.get(repository, version) != version:
+                return
+            self._versions[repository] = version
+            self._entries[self._next_id] = (scope, self._normalize(embedding), time.monotonic() + self.ttl, value)
+            self._next_id += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["maxsize"] = self.maxsize
+        stats["ttl"] = self.ttl
+        stats["threshold"] = self.threshold
+        return stats
+
+
+# プロセス内で共有する回答キャッシュ
+# バージョンは (コレクションID, index_version)、回答条件は (context_limit, rerank)
+answer_cache = SemanticAnswerCache(
+    maxsize=int(os.getenv("ANSWER_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "86400")),
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+)
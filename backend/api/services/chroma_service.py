@@ -1,41 +1,242 @@
 """ChromaDB サービス - 高精度版"""
 import chromadb
-from chromadb.utils import embedding_functions
-from typing import List, Dict
-import os
+from typing import Any, Callable, List, Dict, Optional, Tuple
+from core.metrics import (
+    ADD_DOCUMENTS_SECONDS,
+    CHROMA_SECONDS,
+    INDEXED_CHUNKS,
+    SEARCH_CACHE,
+    SEARCH_SECONDS,
+    observe
+)
+from core.timing import StageTimer
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from services.chunker import MarkdownChunker
+from services.embedding_service import EmbeddingService, get_embedding_service
+from services.keyword_index import KeywordIndex, reciprocal_rank_fusion
+from services.query_cache import normalize_query, query_embedding_cache, search_result_cache
+from services.tokenizer import get_token_counter
+import copy
 import hashlib
+import json
+import logging
+import numpy as np
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# ハイブリッド検索で各検索方式から取得する候補数の下限
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# Reciprocal Rank Fusion の定数
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# 埋め込みモデルの次元数を記録していなかった頃は、どのモデルで作っても ada-002 と記録していた
+# （もう1つの選択肢だった distiluse は512次元のため、ベクトルの次元数で見分けられる）
+LEGACY_RECORDED_MODEL = "text-embedding-ada-002"
+LEGACY_SENTENCE_TRANSFORMERS_MODEL = "sentence-transformers/distiluse-base-multilingual-cased"
+LEGACY_SENTENCE_TRANSFORMERS_DIMENSIONS = 512
+
+class _TimeoutHTTPAdapter(HTTPAdapter):
+    """タイムアウト未指定のリクエストに既定のタイムアウトを付けるアダプター"""
+
+    def __init__(self, timeout: Tuple[float, float], **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def create_chroma_client():
+    """
+    CHROMA_MODE に応じたChromaDBクライアントを作成
+
+    embedded: プロセス内で CHROMA_PATH のファイルを直接開く（単一プロセス向け）
+    http: CHROMA_HOST:CHROMA_PORT のChromaサーバーに接続する（複数のAPIワーカーで1つのストアを共有）。
+    HTTPセッションはキープアライブのコネクションプールを使い、タイムアウトと、
+    接続エラー・5xx時のバックオフ付きリトライを設定する
+    """
+    mode = os.getenv("CHROMA_MODE", "embedded").lower()
+
+    if mode == "embedded":
+        path = os.getenv("CHROMA_PATH", "/data/chromadb")
+        logger.info("Using embedded ChromaDB (%s)", path)
+        return chromadb.PersistentClient(path=path)
+
+    if mode != "http":
+        raise ValueError(f"Unknown CHROMA_MODE: {mode}")
+
+    host = os.getenv("CHROMA_HOST", "localhost")
+    port = os.getenv("CHROMA_PORT", "8000")
+    logger.info("Using ChromaDB server (%s:%s)", host, port)
+    client = chromadb.HttpClient(
+        host=host,
+        port=port,
+        ssl=os.getenv("CHROMA_SSL", "false").lower() == "true"
+    )
+
+    # chromadb のHTTPクライアントは requests.Session を使うが、タイムアウト・リトライの設定がないため差し替える
+    # （このサービスの書き込みは upsert / delete / ID指定の更新のみで、再送しても結果は変わらない）。
+    # 公開APIではない client._server._session を使うため、構造が違うバージョンでは差し替えずに既定のまま使う
+    session = getattr(getattr(client, "_server", None), "_session", None)
+    if not isinstance(session, requests.Session):
+        logger.warning(
+            "chromadb %s HTTP client has no requests session; "
+            "CHROMA_POOL_SIZE / timeouts / retries are not applied", chromadb.__version__
+        )
+        return client
+
+    pool_size = int(os.getenv("CHROMA_POOL_SIZE", "16"))
+    max_retries = int(os.getenv("CHROMA_MAX_RETRIES", "3"))
+    adapter = _TimeoutHTTPAdapter(
+        timeout=(
+            float(os.getenv("CHROMA_CONNECT_TIMEOUT", "5")),
+            float(os.getenv("CHROMA_READ_TIMEOUT", "60"))
+        ),
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=None,
+            raise_on_status=False
+        )
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return client
+
+
+def _version_stamp(version: Tuple[str, str]) -> str:
+    """(コレクションID, index_version) をキーワードインデックスに記録する文字列に"""
+    return ":".join(version)
+
+
+def ancestor_metadata(directory: str) -> Dict[str, str]:
+    """
+    ディレクトリとその祖先をメタデータに展開（docs/backup -> dir_0: docs, dir_1: docs/backup）
+
+    dir_{階層} の完全一致でサブツリー全体を1回の where 条件で絞り込めるようにする
+    """
+    parts = [part for part in directory.split('/') if part]
+    return {f"dir_{level}": '/'.join(parts[:level + 1]) for level in range(len(parts))}
+
+
+def subtree_filter(directory: str, recursive: bool = True) -> Optional[Dict]:
+    """ディレクトリ配下（recursive=False なら直下のみ）に絞り込む where 条件"""
+    directory = '/'.join(part for part in directory.split('/') if part)
+    if not directory:
+        return None
+    if not recursive:
+        return {"directory": {"$eq": directory}}
+    return {f"dir_{directory.count('/')}": {"$eq": directory}}
+
+
+def merge_repository_results(
+    results_by_repo: Dict[str, List[Dict]],
+    n_results: int,
+    per_repo_limit: int
+) -> List[Dict]:
+    """
+    リポジトリごとの検索結果をスコア順に統合
+
+    1リポジトリから採用する件数は per_repo_limit まで。各結果には repository を付ける
+    """
+    candidates = [
+        {**result, 'repository': repo_name}
+        for repo_name, results in results_by_repo.items()
+        for result in results[:per_repo_limit]
+    ]
+    candidates.sort(key=lambda result: result['score'], reverse=True)
+    return candidates[:n_results]
+
+
+class EmbeddingModelMismatch(ValueError):
+    """コレクションを作ったモデルと同じ埋め込みを計算できない（force=true での再同期が必要）"""
+
 
 class ChromaService:
     def __init__(self):
-        # ChromaDBクライアント初期化
-        self.client = chromadb.PersistentClient(
-            path="/data/chromadb"
+        # ChromaDBクライアント初期化（プロセス内の埋め込みモード、またはChromaサーバー）
+        self.client = create_chroma_client()
+
+        # キャッシュ付きEmbedding（プロセス内で共有、モデルは環境変数で選択）
+        self.embedding_function = get_embedding_service()
+
+        # 埋め込みモデルのトークナイザーで長さを測るMarkdownチャンカー
+        self.chunker = MarkdownChunker(
+            get_token_counter(self.embedding_function.model_name),
+            max_tokens=int(os.getenv("CHUNK_MAX_TOKENS", "300")),
+            overlap_tokens=int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
         )
 
-        # 高精度なEmbedding関数を設定
-        openai_api_key = os.getenv("OPENAI_API_KEY")
-        if openai_api_key:
-            # OpenAI Embedding（1536次元、多言語対応）
-            self.embedding_function = embedding_functions.OpenAIEmbeddingFunction(
-                api_key=openai_api_key,
-                model_name="text-embedding-ada-002"
-            )
-            print("Using OpenAI Embedding (text-embedding-ada-002)")
-        else:
-            # フォールバック: 多言語対応モデル
-            self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-                model_name="sentence-transformers/distiluse-base-multilingual-cased"
-            )
-            print("Using Multilingual Sentence Transformer")
+        # キーワード検索（BM25）用の転置インデックス。チャンクの書き込み・削除と同時に更新する
+        self.keyword_index = KeywordIndex(os.getenv("KEYWORD_INDEX_PATH", "/data/keyword_index.sqlite3"))
+        self._keyword_index_lock = threading.Lock()
+        # 祖先ディレクトリのメタデータを確認済みのコレクション
+        self._ancestor_metadata_ready = set()
+        self._ancestor_metadata_lock = threading.Lock()
+
+        # コレクションハンドルのキャッシュ（コレクション名 -> Collection）
+        self._collections: Dict[str, Any] = {}
+        self._collections_lock = threading.Lock()
+        # コレクション名 -> そのコレクションを作ったモデルの埋め込みサービス
+        self._collection_embedders: Dict[str, EmbeddingService] = {}
 
         # デバッグ用
-        print(f"Embedding function: {type(self.embedding_function).__name__}")
+        logger.info("Embedding function: %s", type(self.embedding_function.embedding_function).__name__)
+
+    def get_collection_name(self, repo_name: str) -> str:
+        """リポジトリ名をハッシュ化してコレクション名に"""
+        return f"repo_{hashlib.md5(repo_name.encode()).hexdigest()[:8]}"
 
     def get_or_create_collection(self, repo_name: str):
-        """コレクション取得または作成"""
-        # リポジトリ名をハッシュ化してコレクション名に
-        collection_name = f"repo_{hashlib.md5(repo_name.encode()).hexdigest()[:8]}"
+        """コレクション取得または作成（取得したハンドルはキャッシュする）"""
+        collection_name = self.get_collection_name(repo_name)
+
+        collection = self._collections.get(collection_name)
+        if collection is not None:
+            return collection
 
+        with self._collections_lock:
+            collection = self._collections.get(collection_name)
+            if collection is None:
+                collection = self._open_collection(repo_name, collection_name)
+                self._collections[collection_name] = collection
+            return collection
+
+    def forget_collection(self, repo_name: str = None, collection_name: str = None):
+        """キャッシュしたコレクションハンドルを破棄（削除・再作成後に呼ぶ）"""
+        collection_name = collection_name or self.get_collection_name(repo_name)
+        with self._collections_lock:
+            self._collections.pop(collection_name, None)
+            self._collection_embedders.pop(collection_name, None)
+
+    def _with_collection(self, repo_name: str, operation: Callable[[Any], Any]) -> Any:
+        """
+        コレクションに対する操作を実行
+
+        別プロセスでコレクションが作り直されるとキャッシュしたハンドルが無効になるため、
+        失敗時はハンドルを取り直して1回だけ再試行する
+        """
+        try:
+            return operation(self.get_or_create_collection(repo_name))
+        except Exception:
+            self.forget_collection(repo_name)
+            return operation(self.get_or_create_collection(repo_name))
+
+    def _open_collection(self, repo_name: str, collection_name: str):
         try:
             return self.client.get_collection(
                 name=collection_name,
@@ -44,62 +245,187 @@ class ChromaService:
         except:
             # コレクション作成時にメタデータを追加
             from datetime import datetime
-            return self.client.create_collection(
+            collection = self.client.create_collection(
                 name=collection_name,
                 embedding_function=self.embedding_function,
                 metadata={
                     "repository_name": repo_name,
                     "created_at": datetime.now().isoformat(),
-                    "embedding_model": "text-embedding-ada-002"
+                    "embedding_model": self.embedding_function.model_name,
+                    "embedding_dimensions": self.embedding_function.dimensions
                 }
             )
+            # 空のコレクションと空の索引は一致している（同じ名前で削除済みのコレクションの索引は捨てる）
+            self.keyword_index.drop(collection_name)
+            self.keyword_index.set_version(collection_name, _version_stamp((str(collection.id), "0")))
+            return collection
+
+    def _resolve_embedder(self, repo_name: str) -> EmbeddingService:
+        """
+        コレクションのメタデータに記録されたモデルに対応する埋め込みサービスを決める
+
+        記録が現在のモデルと同じならそのまま、違えばそのモデルのバックエンドを作って使う。
+        次元数の記録がないコレクション（モデル名が固定値で記録されていた頃のもの）は記録されたモデルを信じ、
+        保存済みベクトルの次元数を記録する。ただし ada-002 と記録された512次元のコレクションは
+        当時のもう1つのモデル（distiluse）で作られたものとして記録し直す
+        """
+        collection = self.get_or_create_collection(repo_name)
+        metadata = collection.metadata or {}
+        model_name = metadata.get("embedding_model")
+        dimensions = metadata.get("embedding_dimensions")
+        current = self.embedding_function
+
+        if dimensions is None:
+            stored = collection.get(limit=1, include=["embeddings"])
+            dimensions = len(stored['embeddings'][0]) if stored['embeddings'] else None
+            if dimensions is None:
+                # まだ何も書き込まれていなければ現在のモデルで作る
+                model_name, dimensions = current.model_name, current.dimensions
+            elif model_name == LEGACY_RECORDED_MODEL and dimensions == LEGACY_SENTENCE_TRANSFORMERS_DIMENSIONS:
+                model_name = LEGACY_SENTENCE_TRANSFORMERS_MODEL
+            elif model_name is None and dimensions == current.dimensions:
+                model_name = current.model_name
+            collection.modify(metadata={
+                **metadata,
+                "embedding_model": model_name,
+                "embedding_dimensions": dimensions
+            })
+
+        if model_name == current.model_name and dimensions == current.dimensions:
+            return current
+
+        try:
+            embedder = get_embedding_service(model_name) if model_name else None
+            # 次元数を調べるときに初めてモデル（API）を呼ぶため、ここまでを利用可否の判定に含める
+            embedder_dimensions = embedder.dimensions if embedder else None
+        except Exception as e:
+            logger.warning("Embedding backend for %s unavailable: %s", model_name, e)
+            embedder, embedder_dimensions = None, None
+        if embedder is None or embedder_dimensions != dimensions:
+            raise EmbeddingModelMismatch(
+                f"Repository {repo_name} was indexed with {model_name} ({dimensions} dims), "
+                f"which is not available (current model: {current.model_name}). "
+                "Re-sync with force=true to rebuild it."
+            )
+        logger.info("Routing %s to %s (current model: %s)", repo_name, model_name, current.model_name)
+        return embedder
+
+    def collection_embedder(self, repo_name: str) -> EmbeddingService:
+        """
+        コレクションを作ったモデルの埋め込みサービス（コレクションごとにキャッシュ）
 
-    def split_into_chunks(self, text: str, chunk_size: int = 500) -> List[str]:
-        """テキストをチャンクに分割"""
-        if not text:
+        別のモデルのベクトルで検索・追記しないよう、クエリ・チャンクの埋め込みはこれで計算する。
+        使えるバックエンドがなければ EmbeddingModelMismatch
+        """
+        collection_name = self.get_collection_name(repo_name)
+        embedder = self._collection_embedders.get(collection_name)
+        if embedder is None:
+            embedder = self._resolve_embedder(repo_name)
+            self._collection_embedders[collection_name] = embedder
+        return embedder
+
+    def split_into_chunks(self, text: str) -> List[Dict]:
+        """テキストを見出し・コードブロック単位でトークン数上限のチャンクに分割"""
+        if not text or not text.strip():
             return []
+        return self.chunker.split(text)
 
-        words = text.split()
-        chunks = []
-        current_chunk = []
-        current_size = 0
+    def reset_collection(self, repo_name: str):
+        """コレクションを削除して空の状態から作り直す（強制再構築用）"""
+        try:
+            self.client.delete_collection(name=self.get_collection_name(repo_name))
+        except Exception:
+            pass  # 未作成の場合は何もしない
+        self.forget_collection(repo_name)
+        self.keyword_index.drop(self.get_collection_name(repo_name))
+        self.invalidate_search_cache(repo_name)
+        return self.get_or_create_collection(repo_name)
 
-        for word in words:
-            word_len = len(word) + 1  # スペース分を含む
+    def get_index_version(self, repo_name: str) -> Optional[Tuple[str, str]]:
+        """
+        コレクションの現在のバージョン (コレクションID, index_version) を返す
 
-            if current_size + word_len > chunk_size and current_chunk:
-                # 現在のチャンクを保存
-                chunks.append(' '.join(current_chunk))
-                current_chunk = [word]
-                current_size = word_len
-            else:
-                current_chunk.append(word)
-                current_size += word_len
+        別プロセスの同期も反映されるよう、キャッシュしたハンドルではなく毎回ChromaDBから読む。
+        コレクションが存在しなければ None
+        """
+        try:
+            collection = self.client.get_collection(
+                name=self.get_collection_name(repo_name),
+                embedding_function=self.embedding_function
+            )
+        except Exception:
+            return None
+        return str(collection.id), (collection.metadata or {}).get("index_version", "0")
 
-        # 最後のチャンクを追加
-        if current_chunk:
-            chunks.append(' '.join(current_chunk))
+    def bump_index_version(self, repo_name: str):
+        """
+        書き込みのたびにバージョンを更新し、旧バージョンに紐づく回答キャッシュを使われなくする
 
-        return chunks if chunks else [text]  # 空の場合は元のテキストを返す
+        書き込みをキーワードインデックスに反映した後に呼ぶ。索引が直前のバージョンと一致していれば、新しいバージョンに進める
+        """
+        previous = self.get_index_version(repo_name)
+        index_version = uuid.uuid4().hex
+        self._with_collection(repo_name, lambda collection: collection.modify(metadata={
+            **(collection.metadata or {}),
+            "index_version": index_version
+        }))
+        if previous is not None:
+            self.keyword_index.advance_version(
+                self.get_collection_name(repo_name),
+                _version_stamp(previous),
+                _version_stamp((previous[0], index_version))
+            )
 
-    def add_documents(self, repo_name: str, documents: List[Dict]):
-        """階層情報を含むメタデータでドキュメントを追加"""
-        collection = self.get_or_create_collection(repo_name)
+    def get_indexed_files(self, repo_name: str, paths: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """
+        コレクションに登録済みのファイル一覧を取得（paths を渡すとそのファイルだけ）
 
-        if not documents:
+        Returns:
+            {path: {'sha': blob SHA, 'ids': [チャンクID, ...]}}
+        """
+        if paths is not None and not paths:
+            return {}
+        where = {"path": {"$in": list(paths)}} if paths else None
+        stored = self._with_collection(
+            repo_name, lambda collection: collection.get(where=where, include=["metadatas"])
+        )
+
+        indexed = {}
+        for chunk_id, meta in zip(stored['ids'], stored['metadatas']):
+            path = (meta or {}).get('path')
+            if not path:
+                continue
+            entry = indexed.setdefault(path, {'sha': meta.get('sha'), 'ids': []})
+            entry['ids'].append(chunk_id)
+
+        return indexed
+
+    def delete_chunks(self, repo_name: str, ids: List[str], timer: Optional[StageTimer] = None):
+        """チャンクをID指定で削除"""
+        if not ids:
             return
+        timer = timer or StageTimer()
+        with timer.stage("write"), observe(CHROMA_SECONDS, operation="delete"):
+            self._with_collection(repo_name, lambda collection: collection.delete(ids=ids))
+            self.keyword_index.delete(self.get_collection_name(repo_name), ids)
+            self.bump_index_version(repo_name)
+        self.invalidate_search_cache(repo_name)
+        logger.info("Deleted %d stale chunks", len(ids))
 
-        texts = []
-        metadatas = []
-        ids = []
+    def _chunk_id(self, doc: Dict, index: int) -> str:
+        """同一内容のファイルが複数パスにあっても衝突しないようパスを含める"""
+        path_hash = hashlib.md5(doc['path'].encode()).hexdigest()[:8]
+        return f"{doc['sha']}_{path_hash}_{index}"
 
-        for doc in documents:
-            # チャンク分割
-            chunks = self.split_into_chunks(doc['content'], 500)
+    def build_chunks(self, doc: Dict) -> List[Tuple[str, str, Dict]]:
+        """1ファイルをチャンク分割し、(ID, テキスト, メタデータ) のリストを返す"""
+        chunks = self.split_into_chunks(doc['content'])
 
-            for i, chunk in enumerate(chunks):
-                texts.append(chunk)
-                metadatas.append({
+        return [
+            (
+                self._chunk_id(doc, i),
+                chunk['text'],
+                {
                     'path': doc['path'],
                     'name': doc['name'],
                     'sha': doc['sha'],
@@ -108,81 +434,499 @@ class ChromaService:
                     'chunk_index': i,
                     'total_chunks': len(chunks),
                     'file_type': 'markdown',
-                    'file_size': doc.get('size', 0)
+                    'file_size': doc.get('size', 0),
+                    'heading_path': chunk['heading_path'],
+                    'token_count': chunk['token_count'],
+                    **ancestor_metadata(doc.get('directory', ''))
+                }
+            )
+            for i, chunk in enumerate(chunks)
+        ]
+
+    def embed_texts(self, texts: List[str], repo_name: Optional[str] = None) -> List[List[float]]:
+        """
+        テキストの埋め込みを計算（キャッシュ済みの内容はモデルに送らない）
+
+        repo_name を渡すとそのコレクションを作ったモデルで計算する
+        """
+        embedder = self.collection_embedder(repo_name) if repo_name else self.embedding_function
+        return embedder.embed(texts)
+
+    def upsert_chunks(
+        self,
+        repo_name: str,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[Dict],
+        embeddings: List[List[float]]
+    ):
+        """埋め込み済みチャンクを書き込む（再同期で同じIDが来ても失敗しないようupsert）"""
+        if not ids:
+            return
+        with observe(CHROMA_SECONDS, operation="upsert"):
+            self._with_collection(repo_name, lambda collection: collection.upsert(
+                documents=texts,
+                embeddings=embeddings,
+                metadatas=metadatas,
+                ids=ids
+            ))
+        INDEXED_CHUNKS.inc(len(ids))
+        self.keyword_index.add(self.get_collection_name(repo_name), ids, texts)
+        self.bump_index_version(repo_name)
+        self.invalidate_search_cache(repo_name)
+
+    def add_documents(
+        self,
+        repo_name: str,
+        documents: List[Dict],
+        timer: Optional[StageTimer] = None,
+        batch_size: int = 64
+    ):
+        """
+        階層情報を含むメタデータでドキュメントを追加
+
+        batch_size チャンクごとに埋め込み・書き込みを行う。
+        timer を渡すと chunk / embed / write の各段階の所要時間を積算する
+        """
+        timer = timer or StageTimer()
+
+        if not documents:
+            return
+
+        with observe(ADD_DOCUMENTS_SECONDS):
+            with timer.stage("chunk"):
+                chunks = [chunk for doc in documents for chunk in self.build_chunks(doc)]
+
+            for start in range(0, len(chunks), batch_size):
+                ids, texts, metadatas = (list(column) for column in zip(*chunks[start:start + batch_size]))
+
+                # 埋め込みを明示的に計算（書き込み時間と分けて計測するため）
+                with timer.stage("embed"):
+                    embeddings = self.embed_texts(texts, repo_name)
+
+                with timer.stage("write"):
+                    self.upsert_chunks(repo_name, ids, texts, metadatas, embeddings)
+
+        logger.info("Added %d chunks from %d files", len(chunks), len(documents))
+
+    def embed_query(self, query: str, embedder: Optional[EmbeddingService] = None) -> List[float]:
+        """クエリの埋め込み（同じクエリはキャッシュから返す）"""
+        return self.embed_queries([query], embedder)[0]
+
+    def embed_queries(self, queries: List[str], embedder: Optional[EmbeddingService] = None) -> List[List[float]]:
+        """
+        複数クエリの埋め込み（キャッシュにないクエリだけを1回の呼び出しでまとめて計算）
+
+        embedder を省略すると現在のモデルで計算する
+        """
+        embedder = embedder or self.embedding_function
+        keys = [(embedder.model_name, normalize_query(query)) for query in queries]
+        embeddings = [query_embedding_cache.get(key) for key in keys]
+
+        missing = list(dict.fromkeys(key for key, embedding in zip(keys, embeddings) if embedding is None))
+        if missing:
+            computed = dict(zip(missing, embedder.embed([query for _, query in missing])))
+            for key, embedding in computed.items():
+                query_embedding_cache.set(key, embedding)
+            embeddings = [computed[key] if embedding is None else embedding for key, embedding in zip(keys, embeddings)]
+        return embeddings
+
+    def invalidate_search_cache(self, repo_name: str = None, collection_name: str = None):
+        """
+        コレクションへの書き込み後、そのコレクションの検索結果キャッシュを破棄
+
+        他プロセスのキャッシュはキーのバージョンが変わることで使われなくなる。ここでは古いエントリを早めに捨てる
+        """
+        collection_name = collection_name or self.get_collection_name(repo_name)
+        search_result_cache.invalidate(lambda key: key[0] == collection_name)
+
+    def _format_results(self, results: Dict, n_results: int, index: int = 0) -> List[Dict]:
+        """ChromaDBのクエリ結果（index 番目のクエリ分）を検索結果のリストに整形"""
+        search_results = []
+        if results['documents'] and len(results['documents']) > index:
+            for doc, meta, distance in zip(
+                results['documents'][index][:n_results],
+                results['metadatas'][index][:n_results],
+                results['distances'][index][:n_results]
+            ):
+                search_results.append({
+                    'content': doc,
+                    'metadata': meta,
+                    'score': 1 - (distance / 2)  # スコアに変換
                 })
-                ids.append(f"{doc['sha']}_{i}")
+        return search_results
+
+    def _ensure_keyword_index(self, repo_name: str, version: Optional[Tuple[str, str]] = None):
+        """
+        キーワードインデックスがコレクションの現在のバージョンと一致していなければ、保存済みのチャンクから作り直す
+
+        別のホストが同期した場合や、キーワードインデックス導入前に同期したコレクションが対象
+        """
+        version = version or self.get_index_version(repo_name)
+        if version is None:
+            return
+        collection_name = self.get_collection_name(repo_name)
+        stamp = _version_stamp(version)
+        if self.keyword_index.get_version(collection_name) == stamp:
+            return
+
+        with self._keyword_index_lock:
+            if self.keyword_index.get_version(collection_name) == stamp:
+                return
+            # バージョンを読んだ後に取得するため、チャンクは記録するバージョン以降の内容になる
+            stored = self._with_collection(
+                repo_name, lambda collection: collection.get(include=["documents"])
+            )
+            self.keyword_index.rebuild(collection_name, stored['ids'], stored['documents'], stamp)
+            logger.info("Rebuilt keyword index for %s: %d chunks", repo_name, len(stored['ids']))
+
+    def _get_chunks(self, repo_name: str, ids: List[str]) -> Dict[str, Dict]:
+        """チャンクIDから本文・メタデータを取得"""
+        if not ids:
+            return {}
+        stored = self._with_collection(repo_name, lambda collection: collection.get(
+            ids=ids,
+            include=["documents", "metadatas"]
+        ))
+        return {
+            chunk_id: {'content': doc, 'metadata': meta}
+            for chunk_id, doc, meta in zip(stored['ids'], stored['documents'], stored['metadatas'])
+        }
+
+    def _vector_query(
+        self,
+        repo_name: str,
+        query: str,
+        n_results: int,
+        where: Optional[Dict] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> Dict:
+        # 渡された埋め込みは現在のモデルで計算したもの。コレクションのモデルが違えば計算し直す
+        embedder = self.collection_embedder(repo_name)
+        if query_embedding is None or embedder is not self.embedding_function:
+            query_embedding = self.embed_query(query, embedder)
+        with observe(CHROMA_SECONDS, operation="query"):
+            try:
+                return self._with_collection(repo_name, lambda collection: collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=n_results,
+                    where=where
+                ))
+            except RuntimeError as e:
+                # 絞り込んだチャンクが少ないと、HNSWのグラフ探索で n_results 件に届かず失敗する（chromadb 0.4系）
+                if where is None or "contigious" not in str(e):
+                    raise
+                return self._exact_query(repo_name, query_embedding, n_results, where)
+
+    def _exact_query(self, repo_name: str, query_embedding: List[float], n_results: int, where: Dict) -> Dict:
+        """where に該当するチャンクすべてとの距離（ChromaDBの既定と同じ二乗L2）を計算し、query と同じ形で返す"""
+        stored = self._with_collection(repo_name, lambda collection: collection.get(
+            where=where,
+            include=["embeddings", "documents", "metadatas"]
+        ))
+        if not stored['ids']:
+            return {'ids': [[]], 'documents': [[]], 'metadatas': [[]], 'distances': [[]]}
+
+        vectors = np.asarray(stored['embeddings'], dtype=np.float32)
+        distances = ((vectors - np.asarray(query_embedding, dtype=np.float32)) ** 2).sum(axis=1)
+        order = np.argsort(distances)[:n_results]
+        return {
+            'ids': [[stored['ids'][i] for i in order]],
+            'documents': [[stored['documents'][i] for i in order]],
+            'metadatas': [[stored['metadatas'][i] for i in order]],
+            'distances': [[float(distances[i]) for i in order]]
+        }
+
+    def _keyword_search(
+        self,
+        repo_name: str,
+        query: str,
+        n_results: int,
+        version: Optional[Tuple[str, str]] = None
+    ) -> List[Dict]:
+        """BM25によるキーワード検索"""
+        self._ensure_keyword_index(repo_name, version)
+        ranked = self.keyword_index.search(self.get_collection_name(repo_name), query, n_results)
+        chunks = self._get_chunks(repo_name, [chunk_id for chunk_id, _ in ranked])
+
+        return [
+            {**chunks[chunk_id], 'score': score}
+            for chunk_id, score in ranked
+            if chunk_id in chunks
+        ]
+
+    def _hybrid_search(
+        self,
+        repo_name: str,
+        query: str,
+        n_results: int,
+        query_embedding: Optional[List[float]] = None,
+        version: Optional[Tuple[str, str]] = None
+    ) -> List[Dict]:
+        """
+        ベクトル検索とBM25の結果を Reciprocal Rank Fusion で統合
 
-        # 一括追加
-        collection.add(
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids
+        両方から候補を多めに取り、順位だけを使って統合する（スコアの尺度を揃える必要がない）
+        """
+        candidates = max(n_results * 2, HYBRID_CANDIDATES)
+
+        self._ensure_keyword_index(repo_name, version)
+        keyword_ranked = self.keyword_index.search(self.get_collection_name(repo_name), query, candidates)
+
+        results = self._vector_query(repo_name, query, candidates, query_embedding=query_embedding)
+        vector_ids = results['ids'][0] if results['ids'] else []
+        chunks = {
+            chunk_id: item
+            for chunk_id, item in zip(vector_ids, self._format_results(results, candidates))
+        }
+
+        fused = reciprocal_rank_fusion(
+            [vector_ids, [chunk_id for chunk_id, _ in keyword_ranked]],
+            k=RRF_K
+        )[:n_results]
+
+        # キーワード検索でのみ見つかったチャンクの本文を取得
+        chunks.update(self._get_chunks(repo_name, [chunk_id for chunk_id, _ in fused if chunk_id not in chunks]))
+
+        return [
+            {**chunks[chunk_id], 'score': score}
+            for chunk_id, score in fused
+            if chunk_id in chunks
+        ]
+
+    def _search_cache_key(
+        self,
+        repo_name: str,
+        version: Tuple[str, str],
+        query: str,
+        n_results: int,
+        where: Optional[Dict] = None,
+        mode: str = "vector"
+    ) -> Tuple:
+        """
+        検索結果キャッシュのキー
+
+        コレクションのバージョン（コレクションID・index_version）を含めるため、
+        別プロセス・別ホストの同期で書き込まれた後は、このプロセスのキャッシュも使われない
+        """
+        return (
+            self.get_collection_name(repo_name),
+            version,
+            normalize_query(query),
+            n_results,
+            json.dumps(where, sort_keys=True, ensure_ascii=False) if where else None,
+            mode
         )
 
-        print(f"Added {len(texts)} chunks from {len(documents)} files")
+    def _cached_query(
+        self,
+        repo_name: str,
+        query: str,
+        n_results: int,
+        where: Optional[Dict] = None,
+        mode: str = "vector",
+        query_embedding: Optional[List[float]] = None,
+        index_version: Optional[Tuple[str, str]] = None
+    ) -> List[Dict]:
+        """
+        クエリ埋め込み・検索結果の両キャッシュを通して検索
 
-    def search(self, repo_name: str, query: str, n_results: int = 5) -> List[Dict]:
-        """セマンティック検索"""
-        try:
-            collection = self.get_or_create_collection(repo_name)
+        mode が keyword / hybrid の場合 where は使えない。
+        query_embedding を渡すとクエリの埋め込みを計算しない（複数コレクションの検索で使い回す）。
+        index_version を渡すとそのバージョンの検索結果キャッシュを使う（回答キャッシュと同じバージョンに揃える）
+        """
+        # バージョンは毎回ChromaDBから読む（コレクションがまだなければキャッシュしない）
+        version = index_version or self.get_index_version(repo_name)
+        cache_key = self._search_cache_key(repo_name, version, query, n_results, where, mode) if version else None
 
-            # 検索実行
-            results = collection.query(
-                query_texts=[query],
-                n_results=n_results
-            )
+        cached = search_result_cache.get(cache_key) if cache_key else None
+        SEARCH_CACHE.labels("miss" if cached is None else "hit").inc()
+        if cached is not None:
+            return copy.deepcopy(cached)
 
-            # 結果整形
-            search_results = []
-            if results['documents'] and len(results['documents']) > 0:
-                for doc, meta, distance in zip(
-                    results['documents'][0],
-                    results['metadatas'][0],
-                    results['distances'][0]
-                ):
-                    search_results.append({
-                        'content': doc,
-                        'metadata': meta,
-                        'score': 1 - (distance / 2)  # スコアに変換
-                    })
-
-            return search_results
+        if mode == "keyword":
+            search_results = self._keyword_search(repo_name, query, n_results, version)
+        elif mode == "hybrid":
+            search_results = self._hybrid_search(repo_name, query, n_results, query_embedding, version)
+        else:
+            results = self._vector_query(repo_name, query, n_results, where, query_embedding)
+            search_results = self._format_results(results, n_results)
+
+        if cache_key:
+            search_result_cache.set(cache_key, copy.deepcopy(search_results))
+        return search_results
+
+    def search(
+        self,
+        repo_name: str,
+        query: str,
+        n_results: int = 5,
+        mode: str = "vector",
+        query_embedding: Optional[List[float]] = None,
+        index_version: Optional[Tuple[str, str]] = None
+    ) -> List[Dict]:
+        """
+        検索
+
+        mode: vector（セマンティック検索）/ keyword（BM25）/ hybrid（両者をRRFで統合）
+        index_version: 呼び出し側で読んだコレクションのバージョン（省略時はここで読む）
+        """
+        try:
+            with observe(SEARCH_SECONDS, operation="search", mode=mode):
+                return self._cached_query(
+                    repo_name, query, n_results, mode=mode,
+                    query_embedding=query_embedding, index_version=index_version
+                )
 
+        except EmbeddingModelMismatch:
+            raise
         except Exception as e:
-            print(f"Search error: {e}")
+            logger.exception("Search error: %s", e)
             return []
 
 
-    def search_by_directory(self, repo_name: str, directory: str, query: str, n_results: int = 5) -> List[Dict]:
-        """特定ディレクトリ内での検索"""
-        try:
-            collection = self.get_or_create_collection(repo_name)
+    def search_batch(
+        self,
+        repo_name: str,
+        queries: List[str],
+        n_results: int = 5,
+        timer: Optional[StageTimer] = None
+    ) -> List[Dict]:
+        """
+        複数クエリをまとめてセマンティック検索
 
-            # ディレクトリフィルタ付き検索
-            where_filter = {"directory": {"$eq": directory}} if directory else None
+        キャッシュにないクエリは埋め込みを1回の呼び出しで計算し、
+        ChromaDBにも1回の query でまとめて問い合わせる。
 
-            results = collection.query(
-                query_texts=[query],
-                n_results=n_results * 2,  # 多めに取得してフィルタ
-                where=where_filter
-            )
+        Returns:
+            [{'query': クエリ, 'results': 検索結果, 'cached': キャッシュヒットか, 'time_ms': 所要時間}, ...]
+            まとめて処理したクエリの time_ms は埋め込み・検索時間の按分
+        """
+        with observe(SEARCH_SECONDS, operation="search_batch", mode="vector"):
+            return self._search_batch(repo_name, queries, n_results, timer or StageTimer())
 
-            # 結果整形
-            search_results = []
-            if results['documents'] and len(results['documents']) > 0:
-                for doc, meta, distance in zip(
-                    results['documents'][0][:n_results],
-                    results['metadatas'][0][:n_results],
-                    results['distances'][0][:n_results]
-                ):
-                    search_results.append({
-                        'content': doc,
-                        'metadata': meta,
-                        'score': 1 - (distance / 2)
-                    })
-
-            return search_results
+    def _search_batch(
+        self,
+        repo_name: str,
+        queries: List[str],
+        n_results: int,
+        timer: StageTimer
+    ) -> List[Dict]:
+        items: List[Optional[Dict]] = [None] * len(queries)
 
+        pending: Dict[str, List[int]] = {}
+        with timer.stage("cache"):
+            version = self.get_index_version(repo_name)
+            for i, query in enumerate(queries):
+                start = time.perf_counter()
+                cached = search_result_cache.get(
+                    self._search_cache_key(repo_name, version, query, n_results)
+                ) if version else None
+                SEARCH_CACHE.labels("miss" if cached is None else "hit").inc()
+                if cached is None:
+                    pending.setdefault(normalize_query(query), []).append(i)
+                    continue
+                items[i] = {
+                    'query': query,
+                    'results': copy.deepcopy(cached),
+                    'cached': True,
+                    'time_ms': round((time.perf_counter() - start) * 1000, 2)
+                }
+
+        if pending:
+            unique_queries = list(pending)
+            start = time.perf_counter()
+            with timer.stage("embed"):
+                embeddings = self.embed_queries(unique_queries, self.collection_embedder(repo_name))
+            with timer.stage("search"), observe(CHROMA_SECONDS, operation="query"):
+                results = self._with_collection(repo_name, lambda collection: collection.query(
+                    query_embeddings=embeddings,
+                    n_results=n_results
+                ))
+            amortized_ms = round((time.perf_counter() - start) * 1000 / len(unique_queries), 2)
+
+            for index, query in enumerate(unique_queries):
+                search_results = self._format_results(results, n_results, index)
+                if version:
+                    search_result_cache.set(
+                        self._search_cache_key(repo_name, version, query, n_results),
+                        copy.deepcopy(search_results)
+                    )
+                for i in pending[query]:
+                    items[i] = {
+                        'query': queries[i],
+                        'results': copy.deepcopy(search_results),
+                        'cached': False,
+                        'time_ms': amortized_ms
+                    }
+
+        return items
+
+    def _ensure_ancestor_metadata(self, repo_name: str):
+        """
+        祖先ディレクトリのメタデータ導入前に同期したチャンクにメタデータを追加
+
+        埋め込みは再計算せず、メタデータだけを更新する
+        """
+        collection_name = self.get_collection_name(repo_name)
+        if collection_name in self._ancestor_metadata_ready:
+            return
+
+        with self._ancestor_metadata_lock:
+            if collection_name in self._ancestor_metadata_ready:
+                return
+
+            stored = self._with_collection(repo_name, lambda collection: collection.get(
+                where={"depth": {"$gt": 0}},
+                include=["metadatas"]
+            ))
+            ids = []
+            metadatas = []
+            for chunk_id, meta in zip(stored['ids'], stored['metadatas']):
+                if 'dir_0' not in meta:
+                    ids.append(chunk_id)
+                    metadatas.append({**meta, **ancestor_metadata(meta.get('directory', ''))})
+
+            for start in range(0, len(ids), 500):
+                self._with_collection(repo_name, lambda collection: collection.update(
+                    ids=ids[start:start + 500],
+                    metadatas=metadatas[start:start + 500]
+                ))
+            if ids:
+                self.bump_index_version(repo_name)
+                self.invalidate_search_cache(repo_name)
+                logger.info("Added ancestor directory metadata to %d chunks of %s", len(ids), repo_name)
+
+            self._ancestor_metadata_ready.add(collection_name)
+
+    def search_by_directory(
+        self,
+        repo_name: str,
+        directory: str,
+        query: str,
+        n_results: int = 5,
+        recursive: bool = True
+    ) -> List[Dict]:
+        """
+        特定ディレクトリ内での検索
+
+        recursive=True ならサブディレクトリを含むサブツリー全体、False なら直下のファイルのみ。
+        絞り込みはChromaDBの where 条件で行うため、取得件数は n_results のまま
+        """
+        try:
+            if recursive:
+                self._ensure_ancestor_metadata(repo_name)
+
+            with observe(SEARCH_SECONDS, operation="search_by_directory", mode="vector"):
+                return self._cached_query(
+                    repo_name,
+                    query,
+                    n_results,
+                    where=subtree_filter(directory, recursive)
+                )
+
+        except EmbeddingModelMismatch:
+            raise
         except Exception as e:
-            print(f"Directory search error: {e}")
-            return []
\ No newline at end of file
+            logger.exception("Directory search error: %s", e)
+            return []
@@ -0,0 +1,248 @@
+"""Markdown構造を考慮したチャンク分割 - 見出し・コードブロック・リストを壊さずトークン数で区切る"""
+import re
+from typing import Callable, Dict, Iterator, List, Tuple
+
+_FENCE = re.compile(r"^\s{0,3}(`{3,}|~{3,})")
+_HEADING = re.compile(r"^\s{0,3}(#{1,6})\s+(.*?)\s*#*\s*$")
+_LIST_ITEM = re.compile(r"^\s{0,3}(?:[-*+]|\d+[.)])\s+")
+# 文末（日本語の句点・感嘆符、英文のピリオド+空白）で区切る
+_SENTENCE_END = re.compile(r"(?<=[。．！？!?])|(?<=\.)(?=\s)")
+
+BLOCK_SEPARATOR = "\n\n"
+
+
+def _iter_blocks(text: str) -> Iterator[Tuple[str, str, int]]:
+    """
+    Markdownを1行ずつ走査してブロック単位で返す
+
+    Yields:
+        (種類, ブロックのテキスト, 見出しレベル)
+        種類は heading / code / list / paragraph
+    """
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+
+        if not line.strip():
+            i += 1
+            continue
+
+        fence = _FENCE.match(line)
+        if fence:
+            # 閉じフェンスまでを1ブロックに（閉じていなければ末尾まで）
+            marker = fence.group(1)
+            block = [line]
+            i += 1
+            while i < len(lines):
+                block.append(lines[i])
+                i += 1
+                if block[-1].strip().startswith(marker):
+                    break
+            yield "code", "\n".join(block), 0
+            continue
+
+        heading = _HEADING.match(line)
+        if heading:
+            yield "heading", line.strip(), len(heading.group(1))
+            i += 1
+            continue
+
+        if _LIST_ITEM.match(line):
+            # 連続するリスト項目とインデントされた継続行
+            block = [line]
+            i += 1
+            while i < len(lines) and lines[i].strip() and (
+                _LIST_ITEM.match(lines[i]) or lines[i].startswith((" ", "\t"))
+            ):
+                block.append(lines[i])
+                i += 1
+            yield "list", "\n".join(block), 0
+            continue
+
+        block = [line]
+        i += 1
+        while i < len(lines) and lines[i].strip() and not (
+            _FENCE.match(lines[i]) or _HEADING.match(lines[i]) or _LIST_ITEM.match(lines[i])
+        ):
+            block.append(lines[i])
+            i += 1
+        yield "paragraph", "\n".join(block), 0
+
+
+class MarkdownChunker:
+    """
+    見出し・コードブロック・リストの境界を優先してトークン数上限でチャンクを作る
+
+    - 見出しの手前で区切る（直前のチャンクが min_tokens 未満なら同じチャンクに続ける）
+    - 上限を超えるブロックだけを行・項目・文・文字の順に細かく分割する
+    - 同じセクション内で続くチャンクには、直前のチャンク末尾を overlap_tokens まで重ねる
+    - 各チャンクには見出しの階層（heading_path）を記録する
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int],
+        max_tokens: int = 300,
+        overlap_tokens: int = 40,
+        min_tokens: int = 50
+    ):
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+        self.min_tokens = min_tokens
+
+    # 以下の分割メソッドは上限を引数 max_tokens で受け取る（チャンカーは複数の同期スレッドで共有するため、
+    # 見出しやフェンスの分を差し引いた上限をインスタンスの属性に書き込まない）
+
+    def _hard_split(self, text: str, max_tokens: int) -> List[str]:
+        """区切りのない長い文字列（スペースのない日本語など）を文字数で分割"""
+        tokens = self.count_tokens(text)
+        if tokens <= max_tokens or len(text) <= 1:
+            return [text]
+        size = max(1, int(len(text) * max_tokens / tokens))
+        pieces = []
+        for start in range(0, len(text), size):
+            pieces.extend(self._hard_split(text[start:start + size], max_tokens))
+        return pieces
+
+    def _pack(
+        self,
+        parts: List[str],
+        separator: str,
+        split_part: Callable[[str, int], List[str]],
+        max_tokens: int
+    ) -> List[str]:
+        """部品を上限まで詰めてまとめる（1つで上限を超える部品は split_part で分割）"""
+        pieces = []
+        current = []
+        for part in parts:
+            for sub in ([part] if self.count_tokens(part) <= max_tokens else split_part(part, max_tokens)):
+                candidate = separator.join(current + [sub])
+                if current and self.count_tokens(candidate) > max_tokens:
+                    pieces.append(separator.join(current))
+                    current = [sub]
+                else:
+                    current.append(sub)
+        if current:
+            pieces.append(separator.join(current))
+        return [piece.strip() for piece in pieces if piece.strip()]
+
+    def _split_sentences(self, text: str, max_tokens: int) -> List[str]:
+        sentences = [s for s in _SENTENCE_END.split(text) if s.strip()]
+        return self._pack(sentences, "", self._hard_split, max_tokens)
+
+    def _split_block(self, kind: str, block: str, max_tokens: int) -> List[str]:
+        """上限を超えるブロックを構造を保ったまま分割"""
+        if self.count_tokens(block) <= max_tokens:
+            return [block]
+
+        if kind == "code":
+            # コードは行単位で分け、各断片をフェンスで閉じ直す
+            lines = block.split("\n")
+            opening = lines[0]
+            if len(lines) > 1 and _FENCE.match(lines[-1]):
+                closing, body = lines[-1], lines[1:-1]
+            else:
+                closing, body = _FENCE.match(opening).group(1), lines[1:]
+            fence_tokens = self.count_tokens(opening + "\n" + closing)
+            pieces = self._pack(body, "\n", self._hard_split, max(1, max_tokens - fence_tokens))
+            return [f"{opening}\n{piece}\n{closing}" for piece in pieces]
+
+        if kind == "list":
+            # リストは項目単位で分ける
+            items = []
+            for line in block.split("\n"):
+                if _LIST_ITEM.match(line) or not items:
+                    items.append(line)
+                else:
+                    items[-1] += "\n" + line
+            return self._pack(items, "\n", self._split_sentences, max_tokens)
+
+        return self._pack(block.split("\n"), "\n", self._split_sentences, max_tokens)
+
+    def _tail(self, kind: str, unit: str, budget: int) -> str:
+        """直前のチャンクの末尾から budget トークン以内の文を取り出す（重なり部分）"""
+        if kind in ("heading", "code") or budget <= 0:
+            return ""
+        tail = ""
+        for sentence in reversed([s for s in _SENTENCE_END.split(unit) if s.strip()]):
+            candidate = sentence + tail
+            if self.count_tokens(candidate.strip()) > budget:
+                break
+            tail = candidate
+        return tail.strip()
+
+    def split(self, text: str) -> List[Dict]:
+        """
+        テキストをチャンクに分割
+
+        Returns:
+            [{'text': チャンク本文, 'heading_path': "見出し1 > 見出し2", 'token_count': トークン数}, ...]
+        """
+        chunks: List[Dict] = []
+        headings: List[Tuple[int, str]] = []
+        # 現在のチャンクを構成する (種類, テキスト, トークン数)
+        current: List[Tuple[str, str, int]] = []
+        current_path = ""
+        separator_tokens = self.count_tokens(BLOCK_SEPARATOR)
+
+        def current_tokens() -> int:
+            return sum(tokens for _, _, tokens in current) + separator_tokens * max(0, len(current) - 1)
+
+        def flush(overlap: bool):
+            nonlocal current
+            if not current:
+                return
+            chunks.append({
+                'text': BLOCK_SEPARATOR.join(unit for _, unit, _ in current),
+                'heading_path': current_path,
+                'token_count': current_tokens()
+            })
+
+            # 同じセクションの続きには直前のチャンク末尾の文を重ねる
+            carried = []
+            if overlap and self.overlap_tokens > 0:
+                kind, unit, _ = current[-1]
+                tail = self._tail(kind, unit, self.overlap_tokens)
+                if tail:
+                    carried.append(("overlap", tail, self.count_tokens(tail)))
+            current = carried
+
+        for kind, block, level in _iter_blocks(text):
+            if kind == "heading":
+                # 重ねた部分を除いた本文が短すぎる場合は次のセクションと同じチャンクにまとめる
+                own_tokens = sum(tokens for unit_kind, _, tokens in current if unit_kind != "overlap")
+                if own_tokens >= self.min_tokens:
+                    flush(overlap=False)
+                elif own_tokens == 0:
+                    current = []
+                while headings and headings[-1][0] >= level:
+                    headings.pop()
+                headings.append((level, block.lstrip("#").strip()))
+
+            path = " > ".join(title for _, title in headings)
+
+            # 見出しだけのチャンクを作らないよう、見出しの直後のブロックは見出しと同じチャンクに収まる大きさで分割する
+            reserved = 0
+            if current and all(unit_kind == "heading" for unit_kind, _, _ in current):
+                reserved = current_tokens() + separator_tokens
+            if kind != "code" and self.overlap_tokens > 0 and self.count_tokens(block) > self.max_tokens:
+                # 分割した断片にも直前の断片の末尾を重ねられるよう、重なり分の余裕を残す
+                reserved = max(reserved, self.overlap_tokens + separator_tokens)
+            units = self._split_block(kind, block, max(1, self.max_tokens - reserved))
+
+            for unit in units:
+                tokens = self.count_tokens(unit)
+                if current and current_tokens() + separator_tokens + tokens > self.max_tokens:
+                    flush(overlap=True)
+                    # 重ねた部分を含めて上限を超える場合は重ねない
+                    if current and current_tokens() + separator_tokens + tokens > self.max_tokens:
+                        current = []
+                    current_path = path
+                if not current:
+                    current_path = path
+                current.append((kind, unit, tokens))
+
+        flush(overlap=False)
+        return chunks
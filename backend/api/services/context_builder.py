@@ -0,0 +1,149 @@
+"""チャット用コンテキストの組み立て - 検索結果をトークン予算内に詰める"""
+import hashlib
+import heapq
+from typing import Callable, Dict, List, Tuple
+
+# 隣接チャンクの重なり（チャンカーのオーバーラップ）を探す最大文字数
+_MAX_OVERLAP_CHARS = 2000
+
+
+def _join_overlapping(first: str, second: str) -> str:
+    """first の末尾と second の先頭が重なっていれば重なりを除いて連結"""
+    limit = min(len(first), len(second), _MAX_OVERLAP_CHARS)
+    for size in range(limit, 0, -1):
+        if second[size - 1] == first[-1] and first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n\n" + second
+
+
+class ContextBuilder:
+    """
+    検索結果をトークン予算内のコンテキストにまとめる
+
+    1. 同じチャンク・同じ内容のチャンクを除く
+    2. 同じファイルで chunk_index が連続するチャンクを1つの区間にまとめる
+    3. スコア / トークン数 の高い区間から予算に収まるだけ採用する
+       （収まらない区間はチャンク単位に戻して再検討する）
+    チャンクの途中で切ることはしない
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int], token_budget: int = 2000):
+        self.count_tokens = count_tokens
+        self.token_budget = token_budget
+
+    def _dedupe(self, results: List[Dict]) -> List[Dict]:
+        seen = set()
+        unique = []
+        for result in results:
+            metadata = result.get('metadata') or {}
+            content = result.get('content', '')
+            keys = (
+                ('chunk', metadata.get('path'), metadata.get('chunk_index')),
+                ('content', hashlib.sha256(content.encode()).hexdigest())
+            )
+            if any(key in seen for key in keys):
+                continue
+            seen.update(keys)
+            unique.append(result)
+        return unique
+
+    def _segments(self, results: List[Dict]) -> List[List[Dict]]:
+        """同じファイルの連続するチャンクをまとめた区間のリスト"""
+        by_path: Dict[str, List[Dict]] = {}
+        for result in results:
+            path = (result.get('metadata') or {}).get('path', 'Unknown')
+            by_path.setdefault(path, []).append(result)
+
+        segments = []
+        for chunks in by_path.values():
+            chunks.sort(key=lambda chunk: (chunk.get('metadata') or {}).get('chunk_index', 0))
+            segment = [chunks[0]]
+            for chunk in chunks[1:]:
+                previous_index = (segment[-1].get('metadata') or {}).get('chunk_index', 0)
+                if (chunk.get('metadata') or {}).get('chunk_index', 0) == previous_index + 1:
+                    segment.append(chunk)
+                else:
+                    segments.append(segment)
+                    segment = [chunk]
+            segments.append(segment)
+        return segments
+
+    def _render(self, segment: List[Dict]) -> Tuple[str, str]:
+        """区間の (見出し行, 本文)"""
+        metadata = segment[0].get('metadata') or {}
+        header = metadata.get('path', 'Unknown')
+        if metadata.get('heading_path'):
+            header += f" ({metadata['heading_path']})"
+
+        text = segment[0].get('content', '')
+        for chunk in segment[1:]:
+            text = _join_overlapping(text, chunk.get('content', ''))
+        return header, text
+
+    def build(self, results: List[Dict]) -> Tuple[str, Dict]:
+        """
+        コンテキストを組み立てる
+
+        Returns:
+            (コンテキスト文字列, {'tokens': 使用トークン数, 'chunks': 採用チャンク数, 'segments': [...]})
+        """
+        candidates = []
+        for order, segment in enumerate(self._segments(self._dedupe(results))):
+            header, text = self._render(segment)
+            tokens = self.count_tokens(f"--- ドキュメント 00: {header} ---\n{text}")
+            score = max(chunk.get('score', 0) for chunk in segment)
+            # スコア / トークン数 の降順（同点は検索順）
+            heapq.heappush(candidates, (-score / max(tokens, 1), order, segment, header, text, tokens, score))
+
+        remaining = self.token_budget
+        separator_tokens = self.count_tokens("\n\n")
+        selected = []
+        order = len(candidates)
+        while candidates and remaining > 0:
+            _, _, segment, header, text, tokens, score = heapq.heappop(candidates)
+            cost = tokens + (separator_tokens if selected else 0)
+            if cost <= remaining:
+                selected.append((score, segment, header, text, tokens))
+                remaining -= cost
+            elif len(segment) > 1:
+                # まとめた区間が入らなければ、チャンク単位で入るものだけを採る
+                for chunk in segment:
+                    order += 1
+                    chunk_header, chunk_text = self._render([chunk])
+                    chunk_tokens = self.count_tokens(f"--- ドキュメント 00: {chunk_header} ---\n{chunk_text}")
+                    chunk_score = chunk.get('score', 0)
+                    heapq.heappush(candidates, (
+                        -chunk_score / max(chunk_tokens, 1), order, [chunk],
+                        chunk_header, chunk_text, chunk_tokens, chunk_score
+                    ))
+
+        # チャンク単位で採用したものが隣り合っていれば、改めて1つの区間にまとめる（重なり分だけ短くなる）
+        chosen = [chunk for _, segment, _, _, _ in selected for chunk in segment]
+        selected = []
+        for segment in self._segments(chosen):
+            header, text = self._render(segment)
+            tokens = self.count_tokens(f"--- ドキュメント 00: {header} ---\n{text}")
+            selected.append((max(chunk.get('score', 0) for chunk in segment), segment, header, text, tokens))
+        used = sum(tokens for _, _, _, _, tokens in selected) + separator_tokens * max(0, len(selected) - 1)
+
+        # プロンプト内はスコアの高い順に並べる
+        selected.sort(key=lambda item: item[0], reverse=True)
+        context = "\n\n".join(
+            f"--- ドキュメント {i}: {header} ---\n{text}"
+            for i, (_, _, header, text, _) in enumerate(selected, 1)
+        )
+
+        return context, {
+            'tokens': used,
+            'budget': self.token_budget,
+            'chunks': sum(len(segment) for _, segment, _, _, _ in selected),
+            'segments': [
+                {
+                    'path': (segment[0].get('metadata') or {}).get('path', 'Unknown'),
+                    'chunk_indexes': [(chunk.get('metadata') or {}).get('chunk_index', 0) for chunk in segment],
+                    'score': round(score, 3),
+                    'tokens': tokens
+                }
+                for score, segment, _, _, tokens in selected
+            ]
+        }
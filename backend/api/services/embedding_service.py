@@ -0,0 +1,416 @@
+"""埋め込みサービス - 内容ハッシュをキーにした永続キャッシュ付き"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from chromadb.utils import embedding_functions
+
+from core.metrics import EMBEDDING_RETRIES, EMBEDDING_SECONDS, EMBEDDING_TEXTS, EMBEDDING_TOKENS, observe
+from services.tokenizer import TOKEN_PATTERN, get_token_counter
+
+logger = logging.getLogger(__name__)
+
+
+class FakeEmbeddingFunction:
+    """
+    テスト用の決定的な埋め込み関数（ネットワーク・モデル不要）
+
+    単語（CJKは1文字単位）をハッシュして次元に割り当てるため、
+    共通の語を含むテキストほど類似度が高くなる
+    """
+
+    def __init__(self, dimensions: int = 64):
+        self.dimensions = dimensions
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        embeddings = []
+        for text in input:
+            vector = np.zeros(self.dimensions, dtype=np.float32)
+            for token in TOKEN_PATTERN.findall(text.lower()):
+                digest = hashlib.sha256(token.encode()).digest()
+                index = int.from_bytes(digest[:4], "little") % self.dimensions
+                vector[index] += 1.0 if digest[4] % 2 == 0 else -1.0
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector /= norm
+            embeddings.append(vector.tolist())
+        return embeddings
+
+
+class OnnxEmbeddingFunction:
+    """
+    ONNX Runtime によるCPU向けの埋め込み関数（PyTorch不要）
+
+    量子化済みモデル（model_quantized.onnx 等）を想定。tokenizer.json でトークン化し、
+    attention mask を考慮した平均プーリング + L2正規化でベクトルにする
+    """
+
+    def __init__(self, model_path: str, tokenizer_path: str, batch_size: int = 32, threads: int = 0, max_length: int = 512):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+        }
+        output = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0]
+
+        if output.ndim == 3:
+            # (batch, seq, dim) -> パディングを除いた平均
+            mask = inputs["attention_mask"][:, :, None].astype(np.float32)
+            output = (output * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        return output / np.clip(norms, 1e-12, None)
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        embeddings = []
+        for start in range(0, len(input), self.batch_size):
+            embeddings.extend(self._embed_batch(input[start:start + self.batch_size]).tolist())
+        return embeddings
+
+
+def quantize_onnx_model(model_path: str) -> str:
+    """
+    float32のONNXモデルを動的量子化（int8）したファイルを隣に作り、そのパスを返す
+
+    作成済みならそのまま使う
+    """
+    root, extension = os.path.splitext(model_path)
+    quantized_path = f"{root}.int8{extension}"
+    if not os.path.exists(quantized_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        logger.info("Quantizing %s -> %s", model_path, quantized_path)
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
+
+
+def onnx_model_name() -> str:
+    """ONNXバックエンドのモデル名（コレクションのメタデータに記録する）"""
+    model_dir = os.getenv("ONNX_MODEL_PATH", "/data/models/multilingual-e5-small")
+    return "onnx:" + os.getenv("ONNX_MODEL_NAME", os.path.basename(os.path.normpath(model_dir)))
+
+
+# バックエンド名 -> (モデル名を受け取り (埋め込み関数, モデル名) を返す関数)
+EMBEDDING_BACKENDS: Dict[str, Callable[[Optional[str]], Tuple[Any, str]]] = {}
+
+# モデル名の接頭辞 -> バックエンド名（コレクションを作ったモデルから埋め込み関数を選ぶため）
+MODEL_PREFIXES = {
+    "fake-": "fake",
+    "text-embedding-": "openai",
+    "sentence-transformers/": "sentence-transformers",
+    "onnx:": "onnx"
+}
+
+
+def register_backend(name: str):
+    """埋め込みバックエンドを登録するデコレーター"""
+    def decorator(builder: Callable[[Optional[str]], Tuple[Any, str]]):
+        EMBEDDING_BACKENDS[name] = builder
+        return builder
+    return decorator
+
+
+@register_backend("fake")
+def _fake_backend(model_name: Optional[str] = None):
+    if model_name:
+        dimensions = int(model_name.split("-", 1)[1])
+    else:
+        dimensions = int(os.getenv("FAKE_EMBEDDING_DIMENSIONS", "64"))
+    logger.info("Using fake embedding (%d dims)", dimensions)
+    return FakeEmbeddingFunction(dimensions), f"fake-{dimensions}"
+
+
+@register_backend("openai")
+def _openai_backend(model_name: Optional[str] = None):
+    # OpenAI Embedding（1536次元、多言語対応）
+    model_name = model_name or os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+    logger.info("Using OpenAI Embedding (%s)", model_name)
+    return embedding_functions.OpenAIEmbeddingFunction(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        model_name=model_name
+    ), model_name
+
+
+@register_backend("sentence-transformers")
+def _sentence_transformers_backend(model_name: Optional[str] = None):
+    # 多言語対応モデル（PyTorch）
+    model_name = model_name or "sentence-transformers/distiluse-base-multilingual-cased"
+    logger.info("Using Multilingual Sentence Transformer")
+    return embedding_functions.SentenceTransformerEmbeddingFunction(
+        model_name=model_name
+    ), model_name
+
+
+@register_backend("onnx")
+def _onnx_backend(model_name: Optional[str] = None):
+    configured = onnx_model_name()
+    if model_name and model_name != configured:
+        raise ValueError(f"ONNX model {model_name} is not configured (ONNX_MODEL_PATH is {configured})")
+
+    model_dir = os.getenv("ONNX_MODEL_PATH", "/data/models/multilingual-e5-small")
+    model_path = os.path.join(model_dir, os.getenv("ONNX_MODEL_FILE", "model_quantized.onnx"))
+    if os.getenv("ONNX_QUANTIZE", "false").lower() == "true":
+        model_path = quantize_onnx_model(model_path)
+
+    logger.info("Using ONNX Runtime embedding (%s)", model_path)
+    return OnnxEmbeddingFunction(
+        model_path,
+        os.path.join(model_dir, "tokenizer.json"),
+        batch_size=int(os.getenv("ONNX_BATCH_SIZE", "32")),
+        threads=int(os.getenv("ONNX_THREADS", "0")),
+        max_length=int(os.getenv("ONNX_MAX_LENGTH", "512"))
+    ), configured
+
+
+def backend_for_model(model_name: str) -> Optional[str]:
+    """モデル名から対応するバックエンド名を返す（不明なら None）"""
+    for prefix, backend in MODEL_PREFIXES.items():
+        if model_name.startswith(prefix):
+            return backend
+    return None
+
+
+def create_embedding_function(model_name: Optional[str] = None):
+    """
+    埋め込み関数を作成
+
+    model_name を省略すると EMBEDDING_BACKEND（空ならOPENAI_API_KEYの有無で自動選択）のバックエンド、
+    指定するとそのモデルに対応するバックエンドを使う
+
+    Returns:
+        (埋め込み関数, モデル名)
+    """
+    if model_name:
+        backend = backend_for_model(model_name)
+    else:
+        backend = os.getenv("EMBEDDING_BACKEND", "").lower()
+        if not backend:
+            backend = "openai" if os.getenv("OPENAI_API_KEY") else "sentence-transformers"
+
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend for {model_name or backend}")
+    return EMBEDDING_BACKENDS[backend](model_name)
+
+
+class EmbeddingCache:
+    """(モデル名, sha256(テキスト)) をキーに埋め込みベクトルを保存するSQLiteストア"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """ヒットしたハッシュのみを含む辞書を返す"""
+        found = {}
+        # SQLiteのプレースホルダ上限を超えないよう分割して問い合わせ
+        for start in range(0, len(hashes), 500):
+            part = hashes[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *part]
+                ).fetchall()
+            for text_hash, vector in rows:
+                found[text_hash] = np.frombuffer(vector, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        now = time.time()
+        rows = [
+            (model, text_hash, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text_hash, vector in items.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, created_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def count(self, model: Optional[str] = None) -> int:
+        with self._lock:
+            if model:
+                return self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", [model]).fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class EmbeddingService:
+    """
+    キャッシュ付きの埋め込み計算
+
+    キャッシュにないテキストだけをバッチに分けてモデルへ送り、
+    失敗時は指数バックオフでリトライする。
+    ChromaDBの embedding_function としてもそのまま渡せる。
+    """
+
+    def __init__(self, embedding_function, model_name: str, cache: Optional[EmbeddingCache] = None):
+        self.embedding_function = embedding_function
+        self.model_name = model_name
+        self.cache = cache
+        self.count_tokens = get_token_counter(model_name)
+        self.batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+        self.max_retries = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+        self.max_backoff = float(os.getenv("EMBEDDING_MAX_BACKOFF", "30"))
+        self._dimensions: Optional[int] = None
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "texts": 0,
+            "hits": 0,
+            "misses": 0,
+            "batches": 0,
+            "retries": 0,
+            "tokens_embedded": 0,
+            "tokens_saved": 0
+        }
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.embed(input)
+
+    @property
+    def dimensions(self) -> int:
+        """ベクトルの次元数（初回のみ短いテキストを埋め込んで調べる）"""
+        if self._dimensions is None:
+            self._dimensions = len(self.embed(["dimensions"])[0])
+        return self._dimensions
+
+    def _record(self, **counts):
+        with self._stats_lock:
+            for key, value in counts.items():
+                self._stats[key] += value
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """1バッチ分をモデルに送信（失敗時はバックオフしてリトライ）"""
+        attempt = 0
+        with observe(EMBEDDING_SECONDS, model=self.model_name):
+            while True:
+                try:
+                    embeddings = self.embedding_function(texts)
+                    self._record(batches=1)
+                    return [list(map(float, vector)) for vector in embeddings]
+                except Exception as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    wait = min(2 ** attempt, self.max_backoff)
+                    logger.warning("Embedding batch failed (%s), retrying in %.1fs", e, wait)
+                    self._record(retries=1)
+                    EMBEDDING_RETRIES.labels(self.model_name).inc()
+                    time.sleep(wait)
+                    attempt += 1
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """テキストの埋め込みを返す（入力と同じ順序）"""
+        if not texts:
+            return []
+
+        hashes = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+        vectors = self.cache.get_many(self.model_name, list(set(hashes))) if self.cache else {}
+
+        # キャッシュミスを重複排除してからモデルへ
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in vectors and text_hash not in missing:
+                missing[text_hash] = text
+
+        hits = sum(1 for text_hash in hashes if text_hash in vectors)
+
+        missing_items = list(missing.items())
+        for start in range(0, len(missing_items), self.batch_size):
+            batch = missing_items[start:start + self.batch_size]
+            embeddings = self._embed_batch([text for _, text in batch])
+            computed = {text_hash: vector for (text_hash, _), vector in zip(batch, embeddings)}
+            if self.cache:
+                self.cache.put_many(self.model_name, computed)
+            vectors.update(computed)
+
+        # キャッシュヒットと入力内の重複はモデルに送らずに済んだ分
+        tokens_embedded = sum(self.count_tokens(text) for text in missing.values())
+        self._record(
+            texts=len(texts),
+            hits=hits,
+            misses=len(missing),
+            tokens_embedded=tokens_embedded,
+            tokens_saved=sum(self.count_tokens(text) for text in texts) - tokens_embedded
+        )
+        EMBEDDING_TEXTS.labels(self.model_name, "hit").inc(hits)
+        EMBEDDING_TEXTS.labels(self.model_name, "miss").inc(len(missing))
+        EMBEDDING_TOKENS.labels(self.model_name).inc(tokens_embedded)
+
+        return [vectors[text_hash] for text_hash in hashes]
+
+    def stats(self) -> Dict:
+        """キャッシュのヒット率と節約トークン数"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["model"] = self.model_name
+        stats["cached_vectors"] = self.cache.count(self.model_name) if self.cache else 0
+        return stats
+
+
+# プロセス内で共有する埋め込みサービス（遅延初期化、モデル名ごと）
+_embedding_services: Dict[Optional[str], EmbeddingService] = {}
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_service_lock = threading.Lock()
+
+
+def get_embedding_service(model_name: Optional[str] = None) -> EmbeddingService:
+    """
+    埋め込みサービスの遅延初期化
+
+    model_name を省略すると設定（EMBEDDING_BACKEND）のサービス、
+    指定するとそのモデルのサービス（既存コレクションのクエリ用）を返す
+    """
+    global _embedding_cache
+    with _embedding_service_lock:
+        if model_name not in _embedding_services:
+            default = _embedding_services.get(None)
+            if default is not None and default.model_name == model_name:
+                _embedding_services[model_name] = default
+                return default
+
+            embedding_function, resolved_name = create_embedding_function(model_name)
+            if _embedding_cache is None and os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() != "false":
+                _embedding_cache = EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH", "/data/embedding_cache.sqlite3"))
+            _embedding_services[model_name] = EmbeddingService(embedding_function, resolved_name, _embedding_cache)
+        return _embedding_services[model_name]
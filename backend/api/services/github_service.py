@@ -1,101 +1,379 @@
 """GitHub API サービス - シンプル版"""
-from github import Github
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Iterable, Iterator, List, Dict, Optional
+from core.metrics import GITHUB_RATE_LIMIT_REMAINING, GITHUB_REQUEST_SECONDS, GITHUB_REQUESTS, observe
+from services.http_cache import HTTPResponseCache
+from services.repository_source import ResponseStream, iter_tar_documents, markdown_entry, select_markdown_files
+import logging
 import os
-import base64
+import re
+import threading
+import time
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# レート制限の残量として記録するレスポンスヘッダー
+RATE_LIMIT_HEADERS = {
+    "X-RateLimit-Limit": "limit",
+    "X-RateLimit-Remaining": "remaining",
+    "X-RateLimit-Used": "used",
+    "X-RateLimit-Reset": "reset"
+}
+
+# メトリクスのラベル用にURLをリクエストの種類に分類する（パスをそのままラベルにしない）
+REQUEST_KINDS = [
+    (re.compile(r"^/repos/[^/]+/[^/]+/git/blobs/"), "blob"),
+    (re.compile(r"^/repos/[^/]+/[^/]+/git/trees/"), "tree"),
+    (re.compile(r"^/repos/[^/]+/[^/]+/tarball/"), "archive"),
+    (re.compile(r"^/repos/[^/]+/[^/]+$"), "repository")
+]
+
+def request_kind(url: str) -> str:
+    path = url.split('?', 1)[0]
+    for pattern, kind in REQUEST_KINDS:
+        if pattern.match(path):
+            return kind
+    return "other"
 
 class GitHubService:
     def __init__(self):
         token = os.getenv("GITHUB_TOKEN")
+        # GitHub Enterprise やローカルのフェイクサーバーを使う場合に上書き
+        base_url = os.getenv("GITHUB_API_URL", "https://api.github.com")
         if token and token.strip():
-            print("Using GitHub token for authentication")
-            self.github = Github(token)
+            logger.info("Using GitHub token for authentication")
         else:
-            print("No GitHub token found, using anonymous access")
-            self.github = Github()
+            logger.info("No GitHub token found, using anonymous access")
+
+        # GitHub APIの読み取りは全てこのコネクションプール付きHTTPクライアントで行う
+        self.fetch_concurrency = int(os.getenv("GITHUB_FETCH_CONCURRENCY", "8"))
+        self.max_retries = int(os.getenv("GITHUB_MAX_RETRIES", "5"))
+        self.max_backoff = float(os.getenv("GITHUB_MAX_BACKOFF", "60"))
+
+        headers = {
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28"
+        }
+        if token and token.strip():
+            headers["Authorization"] = f"Bearer {token.strip()}"
+
+        self.http = httpx.Client(
+            base_url=base_url.rstrip('/'),
+            headers=headers,
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=self.fetch_concurrency,
+                max_keepalive_connections=self.fetch_concurrency
+            )
+        )
+
+        # レート制限に当たった場合、全スレッドでこの時刻まで待機する
+        self._rate_limited_until = 0.0
+        self._rate_limit_lock = threading.Lock()
 
-    def get_all_markdown_files(self, repo_name: str, path: str = "", depth: int = 0, max_depth: int = 5) -> List[Dict]:
+        # ETag付きレスポンスの永続キャッシュ（304はレート制限を消費しない）
+        self.cache = None
+        if os.getenv("GITHUB_CACHE_ENABLED", "true").lower() != "false":
+            self.cache = HTTPResponseCache(
+                os.getenv("GITHUB_CACHE_PATH", "/data/github_cache.sqlite3"),
+                max_bytes=int(float(os.getenv("GITHUB_CACHE_MAX_MB", "512")) * 1024 * 1024),
+                max_age=float(os.getenv("GITHUB_CACHE_MAX_AGE_DAYS", "30")) * 86400
+            )
+
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "not_modified": 0, "fetched": 0, "immutable_hits": 0}
+        # リソース（core 等）ごとの直近のレート制限ヘッダー
+        self._rate_limits: Dict[str, Dict] = {}
+
+    def close(self):
+        """コネクションプールを閉じる"""
+        self.http.close()
+
+    def _wait_for_rate_limit(self):
+        """他スレッドが検知したレート制限の解除を待つ"""
+        with self._rate_limit_lock:
+            wait = self._rate_limited_until - time.time()
+        if wait > 0:
+            time.sleep(wait)
+
+    def _backoff_seconds(self, response: httpx.Response, attempt: int) -> Optional[float]:
         """
-        リポジトリから全ての.mdファイルを再帰的に取得
+        リトライまでの待機秒数を返す（リトライ不要ならNone）
+
+        Retry-After / X-RateLimit-Reset ヘッダーを優先し、
+        ない場合は指数バックオフ
         """
-        if depth > max_depth:
-            print(f"Max depth {max_depth} reached for path: {path}")
-            return []
+        if response.status_code in (403, 429):
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                return min(float(retry_after), self.max_backoff)
+            if response.headers.get("X-RateLimit-Remaining") == "0":
+                reset_at = float(response.headers.get("X-RateLimit-Reset", "0"))
+                return min(max(reset_at - time.time(), 1.0), self.max_backoff)
+            if response.status_code == 403:
+                return None  # 権限エラーはリトライしない
+            return min(2 ** attempt, self.max_backoff)
+
+        if response.status_code >= 500:
+            return min(2 ** attempt, self.max_backoff)
+
+        return None
+
+    def _record(self, **counts):
+        with self._stats_lock:
+            for key, value in counts.items():
+                self._stats[key] += value
 
+    def _record_rate_limit(self, response: httpx.Response):
+        """レスポンスヘッダーからレート制限の残量を記録"""
+        if "X-RateLimit-Remaining" not in response.headers:
+            return
+        values = {
+            key: int(response.headers[header])
+            for header, key in RATE_LIMIT_HEADERS.items()
+            if response.headers.get(header, "").isdigit()
+        }
+        values["checked_at"] = time.time()
+        resource = response.headers.get("X-RateLimit-Resource", "core")
+        with self._stats_lock:
+            self._rate_limits[resource] = values
+        if "remaining" in values:
+            GITHUB_RATE_LIMIT_REMAINING.labels(resource).set(values["remaining"])
+
+    def _cached_response(self, url: str, cached: Dict) -> httpx.Response:
+        """キャッシュした本文から 200 のレスポンスを組み立てる"""
+        return httpx.Response(
+            200,
+            headers=cached['headers'],
+            content=cached['body'],
+            request=httpx.Request("GET", self.http.base_url.join(url))
+        )
+
+    def _store(self, cache_key: str, response: httpx.Response, immutable: bool):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if self.cache is None or not (immutable or etag or last_modified):
+            return
+        headers = {
+            name: response.headers[name]
+            for name in ("Content-Type", "ETag", "Last-Modified")
+            if name in response.headers
+        }
+        self.cache.put(cache_key, response.content, headers, etag, last_modified)
+
+    def _request(self, url: str, headers: Optional[Dict] = None, immutable: bool = False) -> httpx.Response:
+        """
+        レート制限・一時的なエラー時にバックオフしながらGETする
+
+        キャッシュ済みのURLには If-None-Match / If-Modified-Since を付け、304 なら保存済みの本文を返す。
+        immutable=True（SHA指定のblob）は内容が変わらないため、キャッシュがあればリクエスト自体を送らない
+        """
+        cache_key = f"{(headers or {}).get('Accept', self.http.headers.get('Accept'))} {url}"
+        kind = request_kind(url)
+        cached = self.cache.get(cache_key) if self.cache else None
+        if cached is not None and immutable:
+            self._record(immutable_hits=1)
+            GITHUB_REQUESTS.labels(kind, "cached").inc()
+            return self._cached_response(url, cached)
+
+        request_headers = dict(headers or {})
+        if cached is not None:
+            if cached['etag']:
+                request_headers["If-None-Match"] = cached['etag']
+            if cached['last_modified']:
+                request_headers["If-Modified-Since"] = cached['last_modified']
+
+        attempt = 0
+        while True:
+            self._wait_for_rate_limit()
+            with observe(GITHUB_REQUEST_SECONDS, kind=kind):
+                response = self.http.get(url, headers=request_headers)
+            self._record(requests=1)
+            GITHUB_REQUESTS.labels(kind, str(response.status_code)).inc()
+            self._record_rate_limit(response)
+
+            if response.status_code == 304 and cached is not None:
+                self._record(not_modified=1)
+                return self._cached_response(url, cached)
+
+            wait = self._backoff_seconds(response, attempt)
+            if wait is None or attempt == self.max_retries:
+                response.raise_for_status()
+                self._record(fetched=1)
+                self._store(cache_key, response, immutable)
+                return response
+
+            logger.warning("GitHub returned %d for %s, retrying in %.1fs", response.status_code, url, wait)
+            with self._rate_limit_lock:
+                self._rate_limited_until = max(self._rate_limited_until, time.time() + wait)
+            attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """条件付きリクエストのヒット率とレート制限の残量"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            rate_limits = {resource: dict(values) for resource, values in self._rate_limits.items()}
+        served = stats["requests"] + stats["immutable_hits"]
+        stats["hit_rate"] = round((stats["not_modified"] + stats["immutable_hits"]) / served, 4) if served else 0.0
+        stats["cached_responses"] = self.cache.count() if self.cache else 0
+        stats["cached_bytes"] = self.cache.size_bytes() if self.cache else 0
+        stats["rate_limit"] = rate_limits
+        return stats
+
+    def get_default_branch(self, repo_name: str) -> str:
+        return self._request(f"/repos/{repo_name}").json()["default_branch"]
+
+    def list_markdown_tree(self, repo_name: str, ref: Optional[str] = None) -> List[Dict]:
+        """
+        Git Trees APIで全階層の.mdファイル一覧を取得（本文なし）
+
+        ディレクトリごとのget_contentsではなく、recursive指定のツリー取得1回で
+        リポジトリ全体を列挙し、.mdのblobだけをローカルでフィルタする。
+        リポジトリ情報・ツリーとも条件付きリクエストのため、変更がなければ304で済む
+        """
+        tree = self._request(
+            f"/repos/{repo_name}/git/trees/{ref or self.get_default_branch(repo_name)}?recursive=1"
+        ).json()
+
+        if tree.get("truncated"):
+            # GitHub側の上限（約10万エントリ）を超えると一覧が途中で切れる
+            logger.warning("Tree listing truncated for %s", repo_name)
+
+        entries = []
+        for element in tree.get("tree", []):
+            if element.get("type") != "blob" or not element["path"].endswith('.md'):
+                continue
+
+            entries.append(markdown_entry(element["path"], element["sha"], element.get("size") or 0))
+
+        logger.info("Tree listing: %d markdown files in %s", len(entries), repo_name)
+        return entries
+
+    def _fetch_blob(self, repo_name: str, entry: Dict) -> Optional[Dict]:
+        """1ファイル分のblobを取得して本文を付与"""
         try:
-            print(f"Exploring path: {path or 'root'} (depth: {depth})")
-            repo = self.github.get_repo(repo_name)
-            contents = repo.get_contents(path)
-            markdown_files = []
-
-            for content in contents:
-                if content.type == "dir":
-                    # サブディレクトリを再帰的に探索
-                    print(f"Entering directory: {content.path}")
-                    sub_files = self.get_all_markdown_files(repo_name, content.path, depth + 1, max_depth)
-                    markdown_files.extend(sub_files)
-
-                elif content.name.endswith('.md'):
-                    # Markdownファイルを追加
-                    try:
-                        file_content = base64.b64decode(content.content).decode('utf-8')
-                        print(f"Found: {content.path} ({len(file_content)} chars)")
-
-                        markdown_files.append({
-                            'path': content.path,
-                            'name': content.name,
-                            'content': file_content,
-                            'sha': content.sha,
-                            'directory': os.path.dirname(content.path) if content.path != content.name else "",
-                            'depth': content.path.count('/'),
-                            'size': len(file_content)
-                        })
-                    except Exception as file_error:
-                        print(f"Error reading file {content.path}: {file_error}")
-
-            return markdown_files
+            response = self._request(
+                f"/repos/{repo_name}/git/blobs/{entry['sha']}",
+                headers={"Accept": "application/vnd.github.raw"},
+                immutable=True
+            )
+            file_content = response.content.decode('utf-8')
+            logger.debug("Found: %s (%d chars)", entry['path'], len(file_content))
 
-        except Exception as e:
-            print(f"Error exploring {path}: {e}")
+            return {
+                **entry,
+                'content': file_content,
+                'size': len(file_content)
+            }
+        except Exception as file_error:
+            logger.warning("Error reading file %s: %s", entry['path'], file_error)
+            return None
+
+    def fetch_file_contents(self, repo_name: str, entries: List[Dict]) -> List[Dict]:
+        """
+        ツリー一覧のエントリについて、必要なblobだけを並列に取得して本文を付与
+
+        並列数は GITHUB_FETCH_CONCURRENCY（コネクションプールの上限と同じ）
+        """
+        if not entries:
             return []
 
-    def get_markdown_files(self, repo_name: str, limit: int = 100) -> List[Dict]:
+        with ThreadPoolExecutor(max_workers=self.fetch_concurrency) as executor:
+            results = executor.map(lambda entry: self._fetch_blob(repo_name, entry), entries)
+            return [file for file in results if file is not None]
+
+    def iter_file_contents(self, repo_name: str, entries: Iterable[Dict]) -> Iterator[Dict]:
         """
-        全階層から.mdファイルを取得（制限付き）
+        blobを並列に取得し、取得できた順にファイルを1件ずつ返す
+
+        同時に保持する未処理リクエストは並列数の2倍までに抑えるため、
+        全ファイルの本文をメモリに抱えることはない
+        """
+        entries_iter = iter(entries)
+        max_in_flight = self.fetch_concurrency * 2
+
+        with ThreadPoolExecutor(max_workers=self.fetch_concurrency) as executor:
+            pending = set()
+            for entry in entries_iter:
+                pending.add(executor.submit(self._fetch_blob, repo_name, entry))
+                if len(pending) >= max_in_flight:
+                    break
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    next_entry = next(entries_iter, None)
+                    if next_entry is not None:
+                        pending.add(executor.submit(self._fetch_blob, repo_name, next_entry))
+
+                    file = future.result()
+                    if file is not None:
+                        yield file
+
+    def iter_archive_contents(self, repo_name: str, entries: Iterable[Dict], ref: Optional[str] = None) -> Iterator[Dict]:
         """
-        print(f"Fetching repository: {repo_name}")
+        リポジトリのtarballを1回だけダウンロードし、entries のファイルを1件ずつ返す
+
+        ファイルごとのblobリクエストの代わりに使う（初回・強制同期向け）。
+        ダウンロードしながら tarfile のストリームモードで読み、ディスクには展開しない
+        """
+        entries = list(entries)
+        if not entries:
+            return
+
+        self._wait_for_rate_limit()
+        # codeload.github.com へのリダイレクトを追う
+        with self.http.stream(
+            "GET",
+            f"/repos/{repo_name}/tarball/{ref or self.get_default_branch(repo_name)}",
+            follow_redirects=True,
+            timeout=httpx.Timeout(300.0, connect=10.0)
+        ) as response:
+            self._record(requests=1, fetched=1)
+            GITHUB_REQUESTS.labels("archive", str(response.status_code)).inc()
+            self._record_rate_limit(response)
+            response.raise_for_status()
+            # tarball は owner-repo-<sha>/ の1階層の下に展開される
+            yield from iter_tar_documents(
+                ResponseStream(response.iter_bytes()), entries, strip_components=1, mode="r|gz"
+            )
 
+    def get_all_markdown_files(self, repo_name: str) -> List[Dict]:
+        """
+        リポジトリから全ての.mdファイルを取得（階層の深さ制限なし）
+        """
         try:
-            # 再帰的に全ファイルを取得
-            all_files = self.get_all_markdown_files(repo_name)
+            entries = self.list_markdown_tree(repo_name)
+            return self.fetch_file_contents(repo_name, entries)
 
-            # 重要度でソート（パス名でアーキテクチャ関連を優先）
-            def priority_score(file):
-                path = file['path'].lower()
-                # アーキテクチャ関連ファイルを優先
-                if 'architecture' in path or 'design' in path:
-                    return 0
-                elif file['name'] == 'README.md':
-                    return 1
-                elif file['depth'] <= 1:  # ルートに近いファイルを優先
-                    return 2
-                else:
-                    return 3 + file['depth']
+        except Exception as e:
+            logger.error("Error listing tree for %s: %s", repo_name, e)
+            return []
 
-            all_files.sort(key=priority_score)
+    def list_markdown_files(self, repo_name: str, limit: int = 100) -> List[Dict]:
+        """
+        全階層から.mdファイル一覧を取得し、優先度順に制限を適用（本文なし）
+        """
+        return select_markdown_files(self.list_markdown_tree(repo_name), limit)
 
-            # 制限適用（デフォルト100に増加）
-            limited_files = all_files[:limit]
+    def get_markdown_files(self, repo_name: str, limit: int = 100) -> List[Dict]:
+        """
+        全階層から.mdファイルを取得（制限付き）
+        """
+        logger.info("Fetching repository: %s", repo_name)
 
-            print(f"Total files found: {len(all_files)}, returning: {len(limited_files)}")
+        try:
+            # ツリー一覧から対象を絞り込み、選ばれたファイルのblobだけ取得
+            limited_entries = self.list_markdown_files(repo_name, limit)
+            limited_files = self.fetch_file_contents(repo_name, limited_entries)
 
             # ファイル一覧を表示
             for file in limited_files:
-                print(f"  - {file['path']} (depth: {file['depth']}, size: {file['size']})")
+                logger.debug("  - %s (depth: %d, size: %d)", file['path'], file['depth'], file['size'])
 
             return limited_files
 
         except Exception as e:
-            print(f"GitHub error: {e}")
-            print(f"Error type: {type(e).__name__}")
-            return []
\ No newline at end of file
+            logger.error("GitHub error (%s): %s", type(e).__name__, e)
+            return []
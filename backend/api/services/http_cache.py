@@ -0,0 +1,150 @@
+"""GitHub API レスポンスの永続キャッシュ - ETag による条件付きリクエスト用"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 期限切れエントリの削除を行う間隔（秒）
+PRUNE_INTERVAL = 3600
+# 上限を超えたら、この割合まで古いものから削除する（put のたびに削除が走らないように）
+EVICT_TO_RATIO = 0.9
+
+
+class HTTPResponseCache:
+    """
+    (URL, Accept) をキーにレスポンス本文と ETag / Last-Modified を保存するSQLiteストア
+
+    次回のリクエストで If-None-Match / If-Modified-Since を送り、
+    304 が返れば保存済みの本文を使う。
+    本文の合計が max_bytes を超えたら最後に使われた時刻の古いものから削除し、
+    max_age 秒以上使われていないものも削除する（0 なら無制限）
+    """
+
+    def __init__(self, path: str, max_bytes: int = 0, max_age: float = 0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                updated_at REAL NOT NULL,
+                accessed_at REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        if "accessed_at" not in columns:
+            # accessed_at 導入前のキャッシュファイル
+            self._conn.execute("ALTER TABLE responses ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0")
+            self._conn.execute("UPDATE responses SET accessed_at = updated_at")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._conn.commit()
+
+        with self._lock:
+            self._total_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(body)), 0) FROM responses"
+            ).fetchone()[0]
+            self._last_pruned = 0.0
+            self._prune()
+
+    def get(self, cache_key: str) -> Optional[Dict]:
+        """{'etag', 'last_modified', 'headers', 'body'}。なければ None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, headers, body FROM responses WHERE cache_key = ?",
+                [cache_key]
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE cache_key = ?", [time.time(), cache_key]
+                )
+                self._conn.commit()
+        if row is None:
+            return None
+        etag, last_modified, headers, body = row
+        return {
+            'etag': etag,
+            'last_modified': last_modified,
+            'headers': json.loads(headers),
+            'body': body
+        }
+
+    def put(
+        self,
+        cache_key: str,
+        body: bytes,
+        headers: Dict[str, str],
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ):
+        if self.max_bytes and len(body) > self.max_bytes * EVICT_TO_RATIO:
+            return  # 1件で上限を占めるものは保存しない
+
+        now = time.time()
+        with self._lock:
+            previous = self._conn.execute(
+                "SELECT LENGTH(body) FROM responses WHERE cache_key = ?", [cache_key]
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(cache_key, etag, last_modified, headers, body, updated_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [cache_key, etag, last_modified, json.dumps(headers), body, now, now]
+            )
+            self._total_bytes += len(body) - (previous[0] if previous else 0)
+            self._prune()
+            self._conn.commit()
+
+    def _prune(self):
+        """期限切れのエントリと、上限を超えた分の古いエントリを削除する（ロック内で呼ぶ）"""
+        now = time.time()
+        expired = evicted = 0
+        if self.max_age and now - self._last_pruned >= PRUNE_INTERVAL:
+            self._last_pruned = now
+            cutoff = now - self.max_age
+            freed = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(body)), 0) FROM responses WHERE accessed_at < ?", [cutoff]
+            ).fetchone()[0]
+            expired = self._conn.execute("DELETE FROM responses WHERE accessed_at < ?", [cutoff]).rowcount
+            self._total_bytes -= freed
+
+        if self.max_bytes and self._total_bytes > self.max_bytes:
+            target = self.max_bytes * EVICT_TO_RATIO
+            rows = self._conn.execute("SELECT cache_key, LENGTH(body) FROM responses ORDER BY accessed_at")
+            keys = []
+            for cache_key, size in rows:
+                if self._total_bytes <= target:
+                    break
+                keys.append((cache_key,))
+                self._total_bytes -= size
+            self._conn.executemany("DELETE FROM responses WHERE cache_key = ?", keys)
+            evicted = len(keys)
+
+        if expired or evicted:
+            self._conn.commit()
+            logger.info("GitHub response cache pruned: %d expired, %d evicted (%.1f MB kept)",
+                        expired, evicted, self._total_bytes / 1024 / 1024)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(LENGTH(body)), 0) FROM responses").fetchone()[0]
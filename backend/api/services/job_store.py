@@ -0,0 +1,267 @@
+"""同期ジョブの永続ストア（SQLite） - 複数ワーカープロセス・再起動をまたいで共有"""
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# 終了状態（保持期間を過ぎたら削除対象）
+FINISHED_STATUSES = ("completed", "error")
+
+
+class SyncJobStore:
+    """
+    同期ジョブのキュー兼ステータス管理
+
+    状態遷移: queued -> processing -> completed / error
+    同一リポジトリのジョブは同時に1つしか processing にならず、
+    queued のジョブは1リポジトリにつき1つにまとめられる。
+    paths 付きのジョブ（Webhookによる部分同期）はまとめる際に対象パスを合算し、
+    not_before までは実行しない（連続するpushを1回の同期にまとめるため）
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sync_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    repository TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    force INTEGER NOT NULL DEFAULT 0,
+                    record TEXT NOT NULL,
+                    worker TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    completed_at REAL,
+                    heartbeat_at REAL,
+                    paths TEXT,
+                    not_before REAL,
+                    source TEXT
+                )
+                """
+            )
+            # 部分同期の導入前に作られたテーブルには列を追加
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(sync_jobs)")}
+            for column, column_type in (("paths", "TEXT"), ("not_before", "REAL"), ("source", "TEXT")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE sync_jobs ADD COLUMN {column} {column_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sync_jobs_status ON sync_jobs (status, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sync_jobs_repository ON sync_jobs (repository, status)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        書き込みロックを取ったトランザクション
+
+        BEGIN IMMEDIATE により、別プロセスのワーカーと同時にジョブを取得しても
+        二重に実行されない
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def _to_job(self, row: sqlite3.Row) -> Dict:
+        """行をAPIで返すジョブ情報に変換"""
+        job = json.loads(row["record"])
+        job.update({
+            "job_id": row["job_id"],
+            "status": row["status"],
+            "repository": row["repository"],
+            "force": bool(row["force"]),
+            "created_at": row["created_at"]
+        })
+        if row["started_at"] is not None:
+            job["started_at"] = row["started_at"]
+        if row["completed_at"] is not None:
+            job["completed_at"] = row["completed_at"]
+        if row["paths"] is not None:
+            job["paths"] = json.loads(row["paths"])
+        # 完了後は実際に使った取得元（api / archive / local）が記録に入る
+        job.setdefault("source", row["source"] or "auto")
+        if row["not_before"] is not None and row["status"] == "queued":
+            job["not_before"] = row["not_before"]
+        return job
+
+    def enqueue(
+        self,
+        repository: str,
+        force: bool = False,
+        paths: Optional[List[str]] = None,
+        delay: float = 0.0,
+        source: str = "auto"
+    ) -> Tuple[Dict, bool]:
+        """
+        同期ジョブを登録
+
+        paths を渡すとそのファイルだけを同期する部分同期、省略するとリポジトリ全体の差分同期。
+        delay 秒後まで実行を遅らせる（その間に来たジョブはまとめられ、期限が延びる）。
+        同じリポジトリの queued ジョブが既にあればそれにまとめて返す（force は引き継ぎ、
+        paths は合算する。どちらかが全体同期なら全体同期になる。source は auto 以外の指定を優先する）
+
+        Returns:
+            (ジョブ情報, 新規作成したかどうか)
+        """
+        now = time.time()
+        not_before = now + delay if delay > 0 else None
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM sync_jobs WHERE repository = ? AND status = 'queued' ORDER BY created_at LIMIT 1",
+                [repository]
+            ).fetchone()
+
+            if row is not None:
+                merged_paths = None
+                if paths is not None and row["paths"] is not None:
+                    merged_paths = json.dumps(sorted(set(json.loads(row["paths"])) | set(paths)), ensure_ascii=False)
+                # 待機中のジョブに遅延付きのジョブが来たら期限を延ばす（すぐ実行するジョブが混ざれば待たない）
+                if not_before is not None:
+                    not_before = max(not_before, row["not_before"]) if row["not_before"] is not None else None
+                conn.execute(
+                    "UPDATE sync_jobs SET force = ?, paths = ?, not_before = ?, source = ? WHERE job_id = ?",
+                    [
+                        int(force or row["force"]), merged_paths, not_before,
+                        row["source"] if source == "auto" else source, row["job_id"]
+                    ]
+                )
+                row = conn.execute("SELECT * FROM sync_jobs WHERE job_id = ?", [row["job_id"]]).fetchone()
+                return self._to_job(row), False
+
+            job_id = str(uuid.uuid4())
+            conn.execute(
+                "INSERT INTO sync_jobs (job_id, repository, status, force, record, created_at, paths, not_before, source) "
+                "VALUES (?, ?, 'queued', ?, '{}', ?, ?, ?, ?)",
+                [
+                    job_id, repository, int(force), now,
+                    json.dumps(sorted(set(paths)), ensure_ascii=False) if paths is not None else None,
+                    not_before,
+                    None if source == "auto" else source
+                ]
+            )
+            row = conn.execute("SELECT * FROM sync_jobs WHERE job_id = ?", [job_id]).fetchone()
+            return self._to_job(row), True
+
+    def claim_next(self, worker: str, max_concurrent: int) -> Optional[Dict]:
+        """
+        実行可能な最も古い queued ジョブを processing にして返す
+
+        全プロセス合計の実行中ジョブが max_concurrent 以上、または
+        同じリポジトリのジョブが実行中の場合は取得しない
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            running = conn.execute("SELECT COUNT(*) FROM sync_jobs WHERE status = 'processing'").fetchone()[0]
+            if running >= max_concurrent:
+                return None
+
+            row = conn.execute(
+                """
+                SELECT * FROM sync_jobs
+                WHERE status = 'queued'
+                  AND (not_before IS NULL OR not_before <= ?)
+                  AND repository NOT IN (SELECT repository FROM sync_jobs WHERE status = 'processing')
+                ORDER BY created_at
+                LIMIT 1
+                """,
+                [now]
+            ).fetchone()
+            if row is None:
+                return None
+
+            conn.execute(
+                "UPDATE sync_jobs SET status = 'processing', worker = ?, started_at = ?, heartbeat_at = ? "
+                "WHERE job_id = ?",
+                [worker, now, now, row["job_id"]]
+            )
+            row = conn.execute("SELECT * FROM sync_jobs WHERE job_id = ?", [row["job_id"]]).fetchone()
+            return self._to_job(row)
+
+    def update_progress(self, job_id: str, progress: Dict):
+        """途中経過を記録し、ハートビートを更新"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT record FROM sync_jobs WHERE job_id = ?", [job_id]).fetchone()
+            if row is None:
+                return
+            record = {**json.loads(row["record"]), **progress}
+            conn.execute(
+                "UPDATE sync_jobs SET record = ?, heartbeat_at = ? WHERE job_id = ?",
+                [json.dumps(record, ensure_ascii=False), time.time(), job_id]
+            )
+
+    def heartbeat(self, job_ids):
+        """実行中のジョブが生きていることを記録"""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+        placeholders = ",".join("?" * len(job_ids))
+        with self._transaction() as conn:
+            conn.execute(
+                f"UPDATE sync_jobs SET heartbeat_at = ? WHERE job_id IN ({placeholders})",
+                [time.time(), *job_ids]
+            )
+
+    def finish(self, job_id: str, status: str, record: Dict):
+        """ジョブを completed / error で終了"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT record FROM sync_jobs WHERE job_id = ?", [job_id]).fetchone()
+            merged = {**(json.loads(row["record"]) if row else {}), **record}
+            conn.execute(
+                "UPDATE sync_jobs SET status = ?, record = ?, completed_at = ?, heartbeat_at = NULL "
+                "WHERE job_id = ?",
+                [status, json.dumps(merged, ensure_ascii=False), time.time(), job_id]
+            )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM sync_jobs WHERE job_id = ?", [job_id]).fetchone()
+            return self._to_job(row) if row else None
+        finally:
+            conn.close()
+
+    def requeue_stale(self, stale_seconds: float) -> int:
+        """
+        ハートビートが途絶えた processing ジョブを queued に戻す
+
+        ワーカーの異常終了・再起動で取り残されたジョブを再実行するため
+        """
+        cutoff = time.time() - stale_seconds
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE sync_jobs SET status = 'queued', worker = NULL, started_at = NULL, heartbeat_at = NULL "
+                "WHERE status = 'processing' AND heartbeat_at < ?",
+                [cutoff]
+            )
+            return cursor.rowcount
+
+    def purge_finished(self, retention_seconds: float) -> int:
+        """保持期間を過ぎた終了済みジョブを削除"""
+        cutoff = time.time() - retention_seconds
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM sync_jobs WHERE status IN ({','.join('?' * len(FINISHED_STATUSES))}) "
+                "AND completed_at < ?",
+                [*FINISHED_STATUSES, cutoff]
+            )
+            return cursor.rowcount
@@ -0,0 +1,233 @@
+"""キーワード検索用の転置インデックス（BM25）- コレクションごとにSQLiteへ保存し、同期時に差分更新する"""
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from services.tokenizer import CJK_CHARS
+
+# CJKの連続部分 / 英数字の識別子（config.yaml, snake_case, ERR-123 などはドット・ハイフンを含めて1語）
+_TERM_PATTERN = re.compile(
+    f"([{CJK_CHARS}]+)|([^\\W{CJK_CHARS}]+(?:[.\\-][^\\W{CJK_CHARS}]+)*)"
+)
+# 識別子を構成要素に分ける境界（区切り文字・camelCase）
+_SUBWORD_PATTERN = re.compile(r"[._\-]+|(?<=[a-z0-9])(?=[A-Z])")
+
+# BM25のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    インデックス・クエリ共通のトークン化
+
+    日本語は分かち書きせず文字bigram（1文字だけの場合はその文字）、
+    識別子は全体に加えて構成要素（get_user_name -> get, user, name）も索引語にする
+    """
+    terms = []
+    for cjk, word in _TERM_PATTERN.findall(text):
+        if cjk:
+            if len(cjk) == 1:
+                terms.append(cjk)
+            else:
+                terms.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+            continue
+
+        whole = word.lower()
+        terms.append(whole)
+        parts = [part.lower() for part in _SUBWORD_PATTERN.split(word) if part]
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part != whole)
+    return terms
+
+
+class KeywordIndex:
+    """
+    (コレクション名, 索引語, チャンクID) -> 出現回数 の転置インデックス
+
+    チャンクの追加・削除のたびに該当チャンクの行だけを書き換えるため、
+    再同期で全体を作り直す必要はない。
+    索引はホストごとのファイルにあるため、どのバージョンのコレクションと一致しているかを versions に記録する
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                collection TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (collection, chunk_id)
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                collection TEXT NOT NULL,
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (collection, term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (collection, chunk_id);
+            -- 索引がどのバージョンのコレクションの内容と一致しているか
+            CREATE TABLE IF NOT EXISTS versions (
+                collection TEXT PRIMARY KEY,
+                version TEXT NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    def _delete(self, collection: str, ids: List[str]):
+        """ロック・トランザクション内で呼ぶこと"""
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            self._conn.execute(
+                f"DELETE FROM postings WHERE collection = ? AND chunk_id IN ({placeholders})",
+                [collection, *part]
+            )
+            self._conn.execute(
+                f"DELETE FROM documents WHERE collection = ? AND chunk_id IN ({placeholders})",
+                [collection, *part]
+            )
+
+    def _insert(self, collection: str, ids: List[str], texts: List[str]):
+        """ロック・トランザクション内で呼ぶこと"""
+        documents = []
+        postings = []
+        for chunk_id, text in zip(ids, texts):
+            terms = Counter(tokenize(text))
+            documents.append((collection, chunk_id, sum(terms.values())))
+            postings.extend((collection, term, chunk_id, tf) for term, tf in terms.items())
+
+        self._conn.executemany(
+            "INSERT INTO documents (collection, chunk_id, length) VALUES (?, ?, ?)",
+            documents
+        )
+        self._conn.executemany(
+            "INSERT INTO postings (collection, term, chunk_id, tf) VALUES (?, ?, ?, ?)",
+            postings
+        )
+
+    def add(self, collection: str, ids: List[str], texts: List[str]):
+        """チャンクを登録（同じIDが登録済みなら置き換える）"""
+        with self._lock:
+            with self._conn:
+                self._delete(collection, ids)
+                self._insert(collection, ids, texts)
+
+    def delete(self, collection: str, ids: List[str]):
+        if not ids:
+            return
+        with self._lock:
+            with self._conn:
+                self._delete(collection, ids)
+
+    def drop(self, collection: str):
+        """コレクションの索引をすべて削除"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM postings WHERE collection = ?", [collection])
+                self._conn.execute("DELETE FROM documents WHERE collection = ?", [collection])
+                self._conn.execute("DELETE FROM versions WHERE collection = ?", [collection])
+
+    def rebuild(self, collection: str, ids: List[str], texts: List[str], version: str):
+        """コレクションの索引を作り直し、version の内容と一致していると記録する"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM postings WHERE collection = ?", [collection])
+                self._conn.execute("DELETE FROM documents WHERE collection = ?", [collection])
+                self._insert(collection, ids, texts)
+                self._set_version(collection, version)
+
+    def _set_version(self, collection: str, version: str):
+        """ロック・トランザクション内で呼ぶこと"""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO versions (collection, version) VALUES (?, ?)", [collection, version]
+        )
+
+    def set_version(self, collection: str, version: str):
+        with self._lock:
+            with self._conn:
+                self._set_version(collection, version)
+
+    def get_version(self, collection: str) -> Optional[str]:
+        """索引が一致しているコレクションのバージョン（未記録なら None）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM versions WHERE collection = ?", [collection]
+            ).fetchone()
+        return row[0] if row else None
+
+    def advance_version(self, collection: str, previous: str, current: str) -> bool:
+        """
+        索引が previous と一致している場合だけ current に進める
+
+        書き込みを索引に反映した直後に呼ぶ。他のホストの書き込みで索引が古くなっていれば進めない
+        """
+        with self._lock:
+            with self._conn:
+                return self._conn.execute(
+                    "UPDATE versions SET version = ? WHERE collection = ? AND version = ?",
+                    [current, collection, previous]
+                ).rowcount > 0
+
+    def count(self, collection: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM documents WHERE collection = ?", [collection]
+            ).fetchone()[0]
+
+    def search(self, collection: str, query: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """BM25スコアの高い順に (チャンクID, スコア) を返す"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        scores: Dict[str, float] = {}
+        with self._lock:
+            total, avg_length = self._conn.execute(
+                "SELECT COUNT(*), AVG(length) FROM documents WHERE collection = ?", [collection]
+            ).fetchone()
+            if not total:
+                return []
+
+            for term in terms:
+                rows = self._conn.execute(
+                    """
+                    SELECT p.chunk_id, p.tf, d.length
+                    FROM postings p
+                    JOIN documents d ON d.collection = p.collection AND d.chunk_id = p.chunk_id
+                    WHERE p.collection = ? AND p.term = ?
+                    """,
+                    [collection, term]
+                ).fetchall()
+                if not rows:
+                    continue
+
+                idf = math.log(1 + (total - len(rows) + 0.5) / (len(rows) + 0.5))
+                for chunk_id, tf, length in rows:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_length or 1))
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """複数の順位リストを RRF（sum 1 / (k + rank)）で統合"""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
@@ -1,15 +1,53 @@
 """OpenAI APIサービス"""
+import logging
 import os
-from typing import List, Dict
-from openai import OpenAI
+import time
+from typing import AsyncIterator, List, Dict
+from openai import AsyncOpenAI, OpenAI
 import json
+from core.metrics import OPENAI_ERRORS, OPENAI_SECONDS, OPENAI_TOKENS, observe
+from services.tokenizer import get_token_counter
+
+logger = logging.getLogger(__name__)
+
+# 回答生成に使うモデル（コスト効率の良いモデル）
+CHAT_MODEL = "gpt-4o-mini"
+
+def record_usage(operation: str, usage, model: str = CHAT_MODEL):
+    """レスポンスの usage（prompt_tokens / completion_tokens）をメトリクスに記録"""
+    if usage is None:
+        return
+    OPENAI_TOKENS.labels(model, operation, "prompt").inc(usage.prompt_tokens or 0)
+    OPENAI_TOKENS.labels(model, operation, "completion").inc(usage.completion_tokens or 0)
 
 class OpenAIService:
     def __init__(self):
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable is not set")
+        # OPENAI_BASE_URL が設定されていればSDKがそちらに接続する（ローカルのフェイクサーバー等）
         self.client = OpenAI(api_key=api_key)
+        self.async_client = AsyncOpenAI(api_key=api_key)
+
+    def _build_messages(self, query: str, context: str) -> List[Dict]:
+        """RAG回答用のメッセージを組み立てる"""
+        return [
+            {
+                "role": "system",
+                "content": (
+                    "あなたは提供されたドキュメントを基に質問に答えるアシスタントです。\n"
+                    "以下のルールに従ってください：\n"
+                    "1. 提供されたコンテキストの情報のみを使用して回答する\n"
+                    "2. コンテキストに情報がない場合は、その旨を明確に伝える\n"
+                    "3. 簡潔で正確な回答を心がける\n"
+                    "4. コードやコマンドはMarkdown形式で記述する"
+                )
+            },
+            {
+                "role": "user",
+                "content": f"コンテキスト:\n{context}\n\n質問: {query}"
+            }
+        ]
 
     def generate_response(self, query: str, context: str, max_tokens: int = 500) -> str:
         """
@@ -24,36 +62,88 @@ class OpenAIService:
             生成された回答
         """
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",  # コスト効率の良いモデル
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "あなたは提供されたドキュメントを基に質問に答えるアシスタントです。\n"
-                            "以下のルールに従ってください：\n"
-                            "1. 提供されたコンテキストの情報のみを使用して回答する\n"
-                            "2. コンテキストに情報がない場合は、その旨を明確に伝える\n"
-                            "3. 簡潔で正確な回答を心がける\n"
-                            "4. コードやコマンドはMarkdown形式で記述する"
-                        )
-                    },
-                    {
-                        "role": "user",
-                        "content": f"コンテキスト:\n{context}\n\n質問: {query}"
-                    }
-                ],
-                max_tokens=max_tokens,
-                temperature=0.3,  # 低めの温度で一貫性のある回答
-                top_p=0.9
-            )
+            with observe(OPENAI_SECONDS, model=CHAT_MODEL, operation="generate"):
+                response = self.client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=self._build_messages(query, context),
+                    max_tokens=max_tokens,
+                    temperature=0.3,  # 低めの温度で一貫性のある回答
+                    top_p=0.9
+                )
+            record_usage("generate", response.usage)
 
             return response.choices[0].message.content
 
         except Exception as e:
-            print(f"OpenAI API error: {e}")
+            OPENAI_ERRORS.labels(CHAT_MODEL, "generate").inc()
+            logger.error("OpenAI API error: %s", e)
             return f"エラーが発生しました: {str(e)}"
 
+    async def agenerate_response(self, query: str, context: str, max_tokens: int = 500) -> str:
+        """
+        generate_response の非同期版（イベントループをブロックしない）
+
+        失敗時はエラーメッセージを回答として返さず例外を送出する（回答キャッシュに保存させないため）
+        """
+        try:
+            with observe(OPENAI_SECONDS, model=CHAT_MODEL, operation="generate"):
+                response = await self.async_client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=self._build_messages(query, context),
+                    max_tokens=max_tokens,
+                    temperature=0.3,
+                    top_p=0.9
+                )
+            record_usage("generate", response.usage)
+
+            return response.choices[0].message.content
+
+        except Exception as e:
+            OPENAI_ERRORS.labels(CHAT_MODEL, "generate").inc()
+            logger.error("OpenAI API error: %s", e)
+            raise
+
+    async def stream_response(self, query: str, context: str, max_tokens: int = 500) -> AsyncIterator[str]:
+        """
+        回答をトークン（差分テキスト）単位で逐次返す
+
+        ストリーミングのレスポンスには usage が含まれないため、トークン数はトークナイザーで数える。
+        所要時間は最後の差分を返し終えるまで（クライアントが途中で切断した場合も記録する）
+
+        Yields:
+            生成されたテキストの差分
+        """
+        messages = self._build_messages(query, context)
+        start = time.perf_counter()
+        completion = []
+        try:
+            stream = await self.async_client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0.3,
+                top_p=0.9,
+                stream=True
+            )
+
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    completion.append(delta)
+                    yield delta
+        except Exception:
+            OPENAI_ERRORS.labels(CHAT_MODEL, "stream").inc()
+            raise
+        finally:
+            OPENAI_SECONDS.labels(CHAT_MODEL, "stream").observe(time.perf_counter() - start)
+            count_tokens = get_token_counter(CHAT_MODEL)
+            OPENAI_TOKENS.labels(CHAT_MODEL, "stream", "prompt").inc(
+                sum(count_tokens(message["content"]) for message in messages)
+            )
+            OPENAI_TOKENS.labels(CHAT_MODEL, "stream", "completion").inc(count_tokens("".join(completion)))
+
     def summarize_code(self, code: str, language: str = "unknown") -> str:
         """
         コードの要約を生成
@@ -66,24 +156,27 @@ class OpenAIService:
             コードの要約
         """
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "コードを簡潔に要約してください。主な機能と重要な処理を説明してください。"
-                    },
-                    {
-                        "role": "user",
-                        "content": f"言語: {language}\n\nコード:\n```\n{code}\n```"
-                    }
-                ],
-                max_tokens=200,
-                temperature=0.3
-            )
+            with observe(OPENAI_SECONDS, model=CHAT_MODEL, operation="summarize"):
+                response = self.client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "コードを簡潔に要約してください。主な機能と重要な処理を説明してください。"
+                        },
+                        {
+                            "role": "user",
+                            "content": f"言語: {language}\n\nコード:\n```\n{code}\n```"
+                        }
+                    ],
+                    max_tokens=200,
+                    temperature=0.3
+                )
+            record_usage("summarize", response.usage)
 
             return response.choices[0].message.content
 
         except Exception as e:
-            print(f"Code summarization error: {e}")
+            OPENAI_ERRORS.labels(CHAT_MODEL, "summarize").inc()
+            logger.error("Code summarization error: %s", e)
             return "コードの要約に失敗しました"
\ No newline at end of file
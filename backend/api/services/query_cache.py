@@ -0,0 +1,90 @@
+"""検索クエリ用のTTL付きLRUキャッシュ"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    件数上限（LRU）と有効期限（TTL）付きのスレッドセーフなキャッシュ
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """値を返す（未登録・期限切れはNone）"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self._stats["misses"] += 1
+                return None
+
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                self._stats["misses"] += 1
+                return None
+
+            self._items.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """条件に一致するキーを削除し、削除件数を返す"""
+        with self._lock:
+            keys = [key for key in self._items if predicate(key)]
+            for key in keys:
+                del self._items[key]
+            self._stats["invalidations"] += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._items)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["maxsize"] = self.maxsize
+        stats["ttl"] = self.ttl
+        return stats
+
+
+def normalize_query(query: str) -> str:
+    """前後・連続する空白の違いを吸収したキャッシュキー用の文字列"""
+    return " ".join(query.split())
+
+
+# プロセス内で共有するキャッシュ
+# クエリ埋め込み: (モデル名, 正規化クエリ) -> ベクトル
+query_embedding_cache = TTLCache(
+    maxsize=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "86400"))
+)
+
+# 検索結果: (コレクション名, 正規化クエリ, 件数, where) -> 結果リスト
+# 同期でコレクションに書き込むと該当コレクションのエントリは破棄される
+search_result_cache = TTLCache(
+    maxsize=int(os.getenv("SEARCH_RESULT_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("SEARCH_RESULT_CACHE_TTL", "300"))
+)
@@ -0,0 +1,244 @@
+"""リポジトリのファイル取得元 - アーカイブ（tar/zip）・ローカルのgitミラーからの読み込み"""
+import hashlib
+import io
+import logging
+import os
+import re
+import subprocess
+import tarfile
+import zipfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# GitHubの owner/repo 形式（"." / ".." だけの名前は除く）
+REPOSITORY_NAME_PATTERN = re.compile(r"^(?!\.{1,2}/)[A-Za-z0-9_.-]+/(?!\.{1,2}$)[A-Za-z0-9_.-]+$")
+
+
+def markdown_entry(path: str, sha: str, size: int) -> Dict:
+    """ファイル一覧の1エントリ（本文なし）"""
+    return {
+        'path': path,
+        'name': os.path.basename(path),
+        'sha': sha,
+        'directory': os.path.dirname(path),
+        'depth': path.count('/'),
+        'size': size
+    }
+
+
+def select_markdown_files(entries: List[Dict], limit: int = 100) -> List[Dict]:
+    """優先度順に並べて上位 limit 件を返す（どの取得元でも同じファイルを同期対象にする）"""
+    # 重要度でソート（パス名でアーキテクチャ関連を優先）
+    def priority_score(file):
+        path = file['path'].lower()
+        # アーキテクチャ関連ファイルを優先
+        if 'architecture' in path or 'design' in path:
+            return 0
+        elif file['name'] == 'README.md':
+            return 1
+        elif file['depth'] <= 1:  # ルートに近いファイルを優先
+            return 2
+        else:
+            return 3 + file['depth']
+
+    entries = sorted(entries, key=priority_score)
+
+    # 制限適用（デフォルト100に増加）
+    limited_entries = entries[:limit]
+
+    logger.info("Total files found: %d, returning: %d", len(entries), len(limited_entries))
+
+    return limited_entries
+
+
+def git_blob_sha(content: bytes) -> str:
+    """Gitのblob SHA（Trees APIの sha と同じ値）"""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+def _strip(name: str, components: int) -> Optional[str]:
+    """アーカイブ内のパスから先頭 components 階層を除く（除けなければ None）"""
+    if name.startswith('./'):
+        name = name[2:]
+    parts = name.split('/', components)
+    return parts[components] if len(parts) > components and parts[components] else None
+
+
+def _document(entry: Dict, content: bytes) -> Optional[Dict]:
+    """エントリに本文を付与（SHAは実際に読んだ内容から計算し直す）"""
+    try:
+        text = content.decode('utf-8')
+    except UnicodeDecodeError as e:
+        logger.warning("Error reading file %s: %s", entry['path'], e)
+        return None
+    return {**entry, 'sha': git_blob_sha(content), 'content': text, 'size': len(text)}
+
+
+def iter_tar_members(
+    fileobj,
+    strip_components: int = 0,
+    mode: str = "r|*"
+) -> Iterator[Tuple[str, tarfile.TarFile, tarfile.TarInfo]]:
+    """
+    tarをストリームとして先頭から読み、.mdの通常ファイルを (パス, tar, メンバー) で返す
+
+    ディスクには展開しない。ストリームモードのため、メンバーの本文は次のメンバーに進む前に読むこと
+    """
+    with tarfile.open(fileobj=fileobj, mode=mode) as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            path = _strip(member.name, strip_components)
+            if path and path.endswith('.md'):
+                yield path, archive, member
+
+
+def iter_tar_documents(
+    fileobj,
+    entries: Iterable[Dict],
+    strip_components: int = 0,
+    mode: str = "r|*"
+) -> Iterator[Dict]:
+    """tarストリームから entries に含まれるファイルだけを読み、ドキュメントとして返す"""
+    wanted = {entry['path']: entry for entry in entries}
+    for path, archive, member in iter_tar_members(fileobj, strip_components, mode):
+        entry = wanted.pop(path, None)
+        if entry is None:
+            continue
+        document = _document(entry, archive.extractfile(member).read())
+        if document is not None:
+            logger.debug("Found: %s (%d chars)", path, document['size'])
+            yield document
+        if not wanted:
+            break
+
+
+class ResponseStream(io.RawIOBase):
+    """バイト列のイテレーター（HTTPレスポンス本文など）を tarfile が読めるファイルとして見せる"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = chunk
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+class LocalMirrorSource:
+    """
+    ローカルのミラーからファイルを読む取得元（ネットワーク不要）
+
+    {root}/{owner}/{repo}.git または {root}/{owner}/{repo}（bare リポジトリ・作業ツリー）、
+    {root}/{owner}/{repo}.tar.gz / .tgz / .tar / .zip の順に探す。
+    アーカイブはGitHubのtarball/zipballと同じく先頭1階層（ARCHIVE_STRIP_COMPONENTS）を除いて読む
+    """
+
+    ARCHIVE_EXTENSIONS = (".tar.gz", ".tgz", ".tar", ".zip")
+
+    def __init__(self, root: str):
+        self.root = root
+        self.ref = os.getenv("LOCAL_MIRROR_REF", "HEAD")
+        self.strip_components = int(os.getenv("ARCHIVE_STRIP_COMPONENTS", "1"))
+
+    def locate(self, repo_name: str) -> Optional[Tuple[str, str]]:
+        """
+        ミラーの (種類 'git' / 'tar' / 'zip', パス)。なければ None
+
+        owner/repo 形式でない名前や、シンボリックリンクを辿ると root の外に出るパスは None
+        """
+        if not REPOSITORY_NAME_PATTERN.match(repo_name):
+            logger.warning("Invalid repository name for local mirror: %r", repo_name)
+            return None
+        base = os.path.join(self.root, *repo_name.split('/'))
+        root = os.path.realpath(self.root)
+        for path in (base + ".git", base, *(base + extension for extension in self.ARCHIVE_EXTENSIONS)):
+            if os.path.exists(path) and os.path.commonpath([root, os.path.realpath(path)]) != root:
+                logger.warning("Local mirror path escapes %s: %s", self.root, path)
+                return None
+        for path in (base + ".git", base):
+            if os.path.isfile(os.path.join(path, "HEAD")):
+                return "git", path
+            if os.path.isfile(os.path.join(path, ".git", "HEAD")):
+                return "git", os.path.join(path, ".git")
+        for extension in self.ARCHIVE_EXTENSIONS:
+            if os.path.isfile(base + extension):
+                return ("zip" if extension == ".zip" else "tar"), base + extension
+        return None
+
+    def _git(self, git_dir: str, *args: str) -> subprocess.Popen:
+        return subprocess.Popen(["git", f"--git-dir={git_dir}", *args], stdout=subprocess.PIPE)
+
+    def _list_entries(self, kind: str, path: str) -> List[Dict]:
+        entries = []
+        if kind == "git":
+            # <mode> SP <type> SP <sha> SP <size> TAB <path> NUL
+            output = subprocess.run(
+                ["git", f"--git-dir={path}", "ls-tree", "-r", "-l", "-z", self.ref],
+                stdout=subprocess.PIPE, check=True
+            ).stdout.decode('utf-8')
+            for line in filter(None, output.split('\0')):
+                info, file_path = line.split('\t', 1)
+                _, object_type, sha, size = info.split()
+                if object_type == "blob" and file_path.endswith('.md'):
+                    entries.append(markdown_entry(file_path, sha, int(size)))
+        elif kind == "zip":
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    file_path = _strip(info.filename, self.strip_components)
+                    if not info.is_dir() and file_path and file_path.endswith('.md'):
+                        entries.append(markdown_entry(file_path, git_blob_sha(archive.read(info)), info.file_size))
+        else:
+            # tarはストリームで1回読み、SHAを計算するために本文も読む（保持はしない）
+            with open(path, "rb") as fileobj:
+                for file_path, archive, member in iter_tar_members(fileobj, self.strip_components):
+                    content = archive.extractfile(member).read()
+                    entries.append(markdown_entry(file_path, git_blob_sha(content), member.size))
+        return entries
+
+    def list_markdown_files(self, repo_name: str, limit: int = 100) -> List[Dict]:
+        """ミラーの.mdファイル一覧（GitHubからの同期と同じ優先度・件数で選ぶ）"""
+        kind, path = self.locate(repo_name)
+        entries = self._list_entries(kind, path)
+        logger.info("Local mirror listing: %d markdown files in %s", len(entries), path)
+        return select_markdown_files(entries, limit)
+
+    def iter_file_contents(self, repo_name: str, entries: Iterable[Dict]) -> Iterator[Dict]:
+        """entries のファイルをミラーから読み、1件ずつ返す"""
+        entries = list(entries)
+        if not entries:
+            return
+        kind, path = self.locate(repo_name)
+
+        if kind == "git":
+            process = self._git(path, "archive", "--format=tar", self.ref)
+            try:
+                yield from iter_tar_documents(process.stdout, entries, mode="r|")
+            finally:
+                process.stdout.close()
+                process.kill()
+                process.wait()
+        elif kind == "zip":
+            wanted = {entry['path']: entry for entry in entries}
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    entry = wanted.get(_strip(info.filename, self.strip_components) or "")
+                    if entry is None or info.is_dir():
+                        continue
+                    document = _document(entry, archive.read(info))
+                    if document is not None:
+                        yield document
+        else:
+            with open(path, "rb") as fileobj:
+                yield from iter_tar_documents(fileobj, entries, self.strip_components)
@@ -0,0 +1,185 @@
+"""検索結果の再ランキング - 多めに取得した候補をクエリとの関連度で並べ直す"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from core.metrics import OPENAI_SECONDS, observe
+
+logger = logging.getLogger(__name__)
+
+# 再ランキング用に取得する候補数
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+
+
+class CrossEncoderScorer:
+    """ローカルのクロスエンコーダーで (クエリ, 文書) の組を採点"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, max_length=512)
+        self.name = f"cross-encoder:{model_name}"
+
+    def score(self, query: str, texts: List[str], timeout: Optional[float] = None) -> List[float]:
+        """ローカルで計算するため timeout は使わない（バッチの大きさで所要時間を抑える）"""
+        return [float(score) for score in self.model.predict([(query, text) for text in texts])]
+
+
+class LLMScorer:
+    """チャットモデルに複数の文書をまとめて渡し、関連度を0〜10で採点させる"""
+
+    def __init__(self, model: str, timeout: float):
+        from openai import OpenAI
+        # 再試行すると予算を超えるため1回だけ送る（失敗すれば検索順のまま返す）
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=timeout, max_retries=0)
+        self.model = model
+        self.name = f"llm:{model}"
+
+    def score(self, query: str, texts: List[str], timeout: Optional[float] = None) -> List[float]:
+        """timeout（秒）を超えたら例外を送出する（省略時はクライアントの既定値）"""
+        from services.openai_service import record_usage
+        documents = "\n\n".join(f"[{i}]\n{text[:1500]}" for i, text in enumerate(texts))
+        with observe(OPENAI_SECONDS, model=self.model, operation="rerank"):
+            response = self.client.chat.completions.create(
+                timeout=timeout,
+                model=self.model,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": (
+                            "あなたは検索結果の関連度を評価します。各文書が質問への回答にどれだけ役立つかを"
+                            "0〜10の数値で評価し、{\"scores\": [文書0の点数, 文書1の点数, ...]} のJSONだけを返してください。"
+                        )
+                    },
+                    {"role": "user", "content": f"質問: {query}\n\n文書:\n{documents}"}
+                ],
+                max_tokens=10 * len(texts) + 20,
+                temperature=0,
+                response_format={"type": "json_object"}
+            )
+        record_usage("rerank", response.usage, self.model)
+        scores = json.loads(response.choices[0].message.content).get("scores", [])
+        if len(scores) != len(texts):
+            raise ValueError(f"Expected {len(texts)} scores, got {len(scores)}")
+        return [float(score) for score in scores]
+
+
+class Reranker:
+    """
+    候補を検索順にバッチで採点し、採点済みの候補をスコア順に並べ直す
+
+    次のバッチを採点すると latency_budget_ms を超えそうな時点で打ち切り、
+    残りの候補は元の検索順のまま後ろに並べる。
+    各バッチには予算の残り時間をタイムアウトとして渡すため、最初のバッチも予算を超えて待たない
+    """
+
+    def __init__(self, scorer, batch_size: int = 8, latency_budget_ms: float = 300):
+        self.scorer = scorer
+        self.batch_size = batch_size
+        self.latency_budget_ms = latency_budget_ms
+
+    def rerank(self, query: str, results: List[Dict], n_results: int) -> Tuple[List[Dict], Dict]:
+        """
+        Returns:
+            (並べ直した上位 n_results 件, {'scorer', 'candidates', 'scored', 'budget_exhausted', 'elapsed_ms'})
+        """
+        started = time.perf_counter()
+        scored: List[Tuple[float, int, Dict]] = []
+        last_batch_ms = 0.0
+        budget_exhausted = False
+
+        for start in range(0, len(results), self.batch_size):
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            remaining_ms = self.latency_budget_ms - elapsed_ms
+            if remaining_ms <= 0 or (scored and last_batch_ms > remaining_ms):
+                budget_exhausted = True
+                break
+
+            batch_started = time.perf_counter()
+            batch = results[start:start + self.batch_size]
+            try:
+                scores = self.scorer.score(
+                    query, [result.get('content', '') for result in batch], timeout=remaining_ms / 1000
+                )
+            except Exception as e:
+                logger.warning("Rerank error (%s): %s", self.scorer.name, e)
+                budget_exhausted = (time.perf_counter() - started) * 1000 >= self.latency_budget_ms
+                break
+            last_batch_ms = (time.perf_counter() - batch_started) * 1000
+
+            scored.extend(
+                (score, start + offset, {**result, 'rerank_score': round(score, 4)})
+                for offset, (score, result) in enumerate(zip(scores, batch))
+            )
+
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        reranked = [result for _, _, result in scored] + results[len(scored):]
+
+        return reranked[:n_results], {
+            'scorer': self.scorer.name,
+            'candidates': len(results),
+            'scored': len(scored),
+            'budget_exhausted': budget_exhausted,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+
+
+def create_scorer(latency_budget_ms: float):
+    """
+    RERANK_BACKEND に応じた採点器を作成
+
+    llm（既定）: チャットモデルによるバッチ採点（OPENAI_API_KEY が必要）
+    cross-encoder: sentence-transformers のクロスエンコーダー（RERANK_MODEL、requirements.txt には含まない）
+    クロスエンコーダーを読み込めない場合は llm、それも使えなければ None（再ランキングなし）
+    """
+    backend = os.getenv("RERANK_BACKEND", "llm").lower()
+
+    if backend == "cross-encoder":
+        model_name = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+        try:
+            scorer = CrossEncoderScorer(model_name)
+            logger.info("Using cross-encoder reranker (%s)", model_name)
+            return scorer
+        except Exception as e:
+            logger.warning("Cross-encoder unavailable (%s), falling back to LLM reranker", e)
+            backend = "llm"
+
+    if backend == "llm" and os.getenv("OPENAI_API_KEY"):
+        from services.openai_service import CHAT_MODEL
+        logger.info("Using LLM reranker (%s)", CHAT_MODEL)
+        return LLMScorer(CHAT_MODEL, timeout=latency_budget_ms / 1000)
+
+    logger.info("Reranking is disabled")
+    return None
+
+
+_reranker: Optional[Reranker] = None
+_reranker_initialized = False
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Optional[Reranker]:
+    """再ランキングの遅延初期化（採点器がなければ None）"""
+    global _reranker, _reranker_initialized
+    with _reranker_lock:
+        if not _reranker_initialized:
+            latency_budget_ms = float(os.getenv("RERANK_LATENCY_BUDGET_MS", "300"))
+            scorer = create_scorer(latency_budget_ms)
+            if scorer is not None:
+                _reranker = Reranker(
+                    scorer,
+                    batch_size=int(os.getenv("RERANK_BATCH_SIZE", "8")),
+                    latency_budget_ms=latency_budget_ms
+                )
+            _reranker_initialized = True
+        return _reranker
+
+
+def rerank_results(query: str, results: List[Dict], n_results: int) -> Tuple[List[Dict], Dict]:
+    """再ランキングを使えない場合は検索順の上位 n_results 件をそのまま返す"""
+    reranker = get_reranker()
+    if reranker is None or not results:
+        return results[:n_results], {'scorer': None, 'candidates': len(results), 'scored': 0}
+    return reranker.rerank(query, results, n_results)
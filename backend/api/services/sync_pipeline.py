@@ -0,0 +1,285 @@
+"""同期パイプライン - 取得・チャンク分割・埋め込み・書き込みをストリーミングで重ねて実行"""
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from core.metrics import SYNC_FILES, SYNC_STAGE_SECONDS, observe_stages
+from core.timing import StageTimer
+from services.chroma_service import ChromaService
+from services.github_service import GitHubService
+from services.repository_source import LocalMirrorSource
+
+_DONE = object()
+
+
+class _StageError:
+    """バックグラウンドスレッドで発生した例外を次段に渡すための入れ物"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def prefetch(iterable: Iterable, maxsize: int, name: str) -> Iterator:
+    """
+    iterable を別スレッドで消費し、上限付きキュー経由で値を返す
+
+    キューが満杯になると上流のスレッドは待機するため、
+    段階間で保持されるデータ量は maxsize 件に抑えられる
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_StageError(e))
+
+    thread = threading.Thread(target=produce, name=f"sync-{name}", daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+    finally:
+        # 下流が途中で止まった場合も上流スレッドを解放する
+        stop.set()
+
+
+def timed(iterable: Iterable, timer: StageTimer, stage: str) -> Iterator:
+    """イテレータの next() に掛かった時間を stage として積算する"""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            timer.add(stage, time.perf_counter() - start)
+        yield item
+
+
+class ChunkBatch:
+    """埋め込み・書き込みの単位となるチャンクのまとまり"""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.embeddings: List[List[float]] = []
+        # このバッチを書き込んだ後に削除してよい旧チャンク
+        self.stale_ids: List[str] = []
+        # このバッチで最後のチャンクまで書き込まれるファイル数
+        self.files_completed = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class SyncPipeline:
+    """
+    差分同期をストリーミングで実行する
+
+    fetch（スレッドプール）→ chunk/embed（専用スレッド）→ write（呼び出し元スレッド）
+    の各段階を上限付きキューでつなぎ、バッチ単位で順次書き込む。
+    書き込み済みのバッチはその時点で検索対象になる。
+    """
+
+    def __init__(self, github_service: GitHubService, chroma_service: ChromaService):
+        self.github_service = github_service
+        self.chroma_service = chroma_service
+        # ローカルミラー（bare リポジトリ・アーカイブ）を置くディレクトリ。あればGitHubより優先する
+        mirror_root = os.getenv("LOCAL_MIRROR_ROOT")
+        self.local_source = LocalMirrorSource(mirror_root) if mirror_root else None
+        self.batch_size = int(os.getenv("SYNC_EMBED_BATCH_SIZE", "64"))
+        self.file_buffer = int(os.getenv("SYNC_FILE_BUFFER", "32"))
+        self.batch_buffer = int(os.getenv("SYNC_BATCH_BUFFER", "2"))
+        # 1リポジトリで同期するファイル数の上限（優先度順に選ぶ）
+        self.file_limit = int(os.getenv("SYNC_FILE_LIMIT", "100"))
+
+    def _iter_batches(
+        self,
+        documents: Iterable[Dict],
+        stale_ids_by_path: Dict[str, List[str]],
+        timer: StageTimer
+    ) -> Iterator[ChunkBatch]:
+        """ファイルをチャンク分割し、固定サイズのバッチにまとめる"""
+        batch = ChunkBatch()
+
+        for doc in documents:
+            with timer.stage("chunk"):
+                chunks = self.chroma_service.build_chunks(doc)
+
+            for chunk_id, text, metadata in chunks:
+                batch.ids.append(chunk_id)
+                batch.texts.append(text)
+                batch.metadatas.append(metadata)
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = ChunkBatch()
+
+            # ファイルの最後のチャンクは現在のバッチ以前に含まれる
+            batch.stale_ids.extend(stale_ids_by_path.get(doc['path'], []))
+            batch.files_completed += 1
+
+        if len(batch) or batch.stale_ids or batch.files_completed:
+            yield batch
+
+    def _embed_batches(
+        self,
+        repository: str,
+        batches: Iterable[ChunkBatch],
+        timer: StageTimer
+    ) -> Iterator[ChunkBatch]:
+        """バッチごとに、コレクションを作ったモデルで埋め込みを計算"""
+        for batch in batches:
+            if len(batch):
+                with timer.stage("embed"):
+                    batch.embeddings = self.chroma_service.embed_texts(batch.texts, repository)
+            yield batch
+
+    def run(
+        self,
+        repository: str,
+        force: bool = False,
+        on_progress: Optional[Callable[[Dict], None]] = None,
+        paths: Optional[List[str]] = None,
+        source: str = "auto"
+    ) -> Dict:
+        """
+        差分同期を実行し、件数と段階ごとの所要時間を返す
+
+        paths を渡すとそのファイルだけを同期する（Webhookによる部分同期）。
+        対象の選び方は全体同期と同じで、ツリーにない・対象外になったパスのチャンクは削除する。
+        force=true の場合 paths は無視して全件を再構築する。
+        on_progress にはバッチを書き込むたびに途中経過が渡される
+
+        ファイル本文の取得元（source）:
+        - api: ファイルごとにblobを取得
+        - archive: リポジトリのtarballを1回だけダウンロードしてストリームで読む
+        - auto: 初回（登録済みファイルなし）・強制同期の全体同期なら archive、それ以外は api
+        LOCAL_MIRROR_ROOT にミラーがあるリポジトリは source に関係なくミラーから読む
+        """
+        timer = StageTimer()
+        started = time.perf_counter()
+
+        local = self.local_source is not None and self.local_source.locate(repository) is not None
+        lister = self.local_source if local else self.github_service
+
+        with timer.stage("list"):
+            entries = lister.list_markdown_files(repository, self.file_limit)
+
+            if not entries:
+                raise ValueError("No markdown files found or repository not accessible")
+
+            if force:
+                paths = None
+                self.chroma_service.reset_collection(repository)
+                indexed = {}
+            else:
+                # 別のモデルで作られ、そのモデルを使えないコレクションには追記しない（EmbeddingModelMismatch）
+                self.chroma_service.collection_embedder(repository)
+                indexed = self.chroma_service.get_indexed_files(repository, paths)
+
+            if paths is not None:
+                wanted = set(paths)
+                entries = [entry for entry in entries if entry['path'] in wanted]
+
+        # 現在のツリーと登録済みSHAの差分を計算
+        current_paths = {entry['path'] for entry in entries}
+        added = [e for e in entries if e['path'] not in indexed]
+        updated = [
+            e for e in entries
+            if e['path'] in indexed and indexed[e['path']]['sha'] != e['sha']
+        ]
+        removed_paths = [path for path in indexed if path not in current_paths]
+        added_paths = {e['path'] for e in added}
+
+        # 変更ファイルの旧チャンクは、新しいチャンクを書き込んだ後に削除（検索の空白期間を作らない）
+        stale_ids_by_path = {e['path']: indexed[e['path']]['ids'] for e in updated}
+
+        progress = {
+            "files_total": len(added) + len(updated),
+            "files_processed": 0,
+            "chunks_written": 0,
+            "added": 0,
+            "updated": 0,
+            "deleted": 0,
+            "skipped": len(entries) - len(added) - len(updated)
+        }
+
+        to_fetch = added + updated
+        if local:
+            source = "local"
+            contents = self.local_source.iter_file_contents(repository, to_fetch)
+        else:
+            if source == "auto":
+                source = "archive" if paths is None and (force or not indexed) else "api"
+            if source == "archive":
+                contents = self.github_service.iter_archive_contents(repository, to_fetch)
+            else:
+                contents = self.github_service.iter_file_contents(repository, to_fetch)
+
+        def count_fetched(documents: Iterable[Dict]) -> Iterator[Dict]:
+            for doc in documents:
+                progress["added" if doc['path'] in added_paths else "updated"] += 1
+                yield doc
+
+        documents = prefetch(
+            timed(contents, timer, "fetch"),
+            maxsize=self.file_buffer,
+            name="fetch"
+        )
+        batches = prefetch(
+            self._embed_batches(
+                repository,
+                self._iter_batches(count_fetched(documents), stale_ids_by_path, timer),
+                timer
+            ),
+            maxsize=self.batch_buffer,
+            name="embed"
+        )
+
+        for batch in batches:
+            with timer.stage("write"):
+                self.chroma_service.upsert_chunks(
+                    repository, batch.ids, batch.texts, batch.metadatas, batch.embeddings
+                )
+                self.chroma_service.delete_chunks(repository, batch.stale_ids)
+
+            progress["files_processed"] += batch.files_completed
+            progress["chunks_written"] += len(batch)
+            if on_progress:
+                on_progress({**progress, "timings": timer.as_dict()})
+
+        # 削除されたファイルのチャンクを削除
+        with timer.stage("write"):
+            removed_ids = [chunk_id for path in removed_paths for chunk_id in indexed[path]['ids']]
+            self.chroma_service.delete_chunks(repository, removed_ids)
+        progress["deleted"] = len(removed_paths)
+
+        timer.add("total", time.perf_counter() - started)
+        observe_stages(SYNC_STAGE_SECONDS, timer.timings)
+        for change in ("added", "updated", "deleted", "skipped"):
+            SYNC_FILES.labels(change).inc(progress[change])
+        return {**progress, "partial": paths is not None, "source": source, "timings": timer.as_dict()}
@@ -0,0 +1,137 @@
+"""同期ワーカー - ジョブストアから queued ジョブを取得して同期専用プールで実行"""
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Set
+
+from core.metrics import SYNC_JOBS
+from services.job_store import SyncJobStore
+from services.sync_pipeline import SyncPipeline
+
+logger = logging.getLogger(__name__)
+
+
+class SyncWorker:
+    """
+    各APIプロセスで1つ動くポーリングループ
+
+    ジョブの取得はジョブストアのトランザクションで排他されるため、
+    複数プロセスで動かしても同じジョブが二重に実行されることはない
+    """
+
+    def __init__(
+        self,
+        job_store: SyncJobStore,
+        pipeline_factory: Callable[[], SyncPipeline],
+        executor: ThreadPoolExecutor,
+        capacity: int
+    ):
+        self.job_store = job_store
+        self.pipeline_factory = pipeline_factory
+        self.executor = executor
+        self.capacity = capacity
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+
+        # 全プロセス合計で同時に実行する同期数の上限
+        self.max_concurrent = int(os.getenv("MAX_CONCURRENT_SYNCS", "2"))
+        self.poll_interval = float(os.getenv("SYNC_POLL_INTERVAL", "1"))
+        # この秒数ハートビートがない processing ジョブは再実行する
+        self.stale_seconds = float(os.getenv("SYNC_JOB_STALE_SECONDS", "300"))
+        # 終了済みジョブの保持期間
+        self.retention_seconds = float(os.getenv("SYNC_JOB_RETENTION_SECONDS", "3600"))
+
+        self._running: Set[str] = set()
+        self._running_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_purge = 0.0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="sync-worker", daemon=True)
+        self._thread.start()
+        logger.info("Sync worker started (%s)", self.worker_id)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def wake(self):
+        """ジョブ登録直後に待たずにポーリングさせる"""
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self._tick()
+            except Exception as e:
+                logger.exception("Sync worker error: %s", e)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _tick(self):
+        with self._running_lock:
+            running = set(self._running)
+        self.job_store.heartbeat(running)
+
+        requeued = self.job_store.requeue_stale(self.stale_seconds)
+        if requeued:
+            logger.warning("Requeued %d stale sync jobs", requeued)
+
+        # 保持期間のチェックは1分に1回で十分
+        if time.time() - self._last_purge > 60:
+            self.job_store.purge_finished(self.retention_seconds)
+            self._last_purge = time.time()
+
+        while len(running) < self.capacity and not self._stop.is_set():
+            job = self.job_store.claim_next(self.worker_id, self.max_concurrent)
+            if job is None:
+                break
+            running.add(job["job_id"])
+            with self._running_lock:
+                self._running.add(job["job_id"])
+            self.executor.submit(self._execute, job)
+
+    def _execute(self, job: Dict):
+        """
+        ジョブを実行し、結果をジョブストアに記録
+
+        バッチを書き込むたびに途中経過をジョブに反映する
+        """
+        job_id = job["job_id"]
+        repository = job["repository"]
+        try:
+            result = self.pipeline_factory().run(
+                repository,
+                force=job["force"],
+                on_progress=lambda progress: self.job_store.update_progress(job_id, progress),
+                paths=job.get("paths"),
+                source=job["source"]
+            )
+            synced = result["added"] + result["updated"]
+            self.job_store.finish(job_id, "completed", {
+                **result,
+                "files_synced": synced,
+                "message": f"Successfully synced {synced} files ({result['skipped']} unchanged)"
+            })
+            SYNC_JOBS.labels("completed").inc()
+            logger.info(
+                "Synced %s: %d files (%d unchanged, %d deleted)", repository, synced, result['skipped'], result['deleted'],
+                extra={"job_id": job_id, "repository": repository, "source": result['source'], "timings": result['timings']}
+            )
+        except Exception as e:
+            SYNC_JOBS.labels("error").inc()
+            logger.exception("Sync error for %s: %s", repository, e, extra={"job_id": job_id, "repository": repository})
+            self.job_store.finish(job_id, "error", {"files_synced": 0, "error": str(e)})
+        finally:
+            with self._running_lock:
+                self._running.discard(job_id)
+            self.wake()
@@ -0,0 +1,54 @@
+"""埋め込みモデルに合わせたトークン数の計測"""
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+CJK_CHARS = "\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\uff66-\uff9f"
+_CJK_PATTERN = re.compile(f"[{CJK_CHARS}]")
+TOKEN_PATTERN = re.compile(f"[{CJK_CHARS}]|\\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算（CJKは1文字1トークン、それ以外は4文字1トークン）"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + max(0, len(text) - cjk) // 4
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model_name: str) -> Callable[[str], int]:
+    """
+    モデルに対応するトークン数カウント関数を返す
+
+    OpenAIのモデル（埋め込み・チャット）は tiktoken、Sentence Transformer・ONNX はモデル付属のトークナイザーを使う。
+    どちらも利用できない場合は概算にフォールバックする
+    """
+    if model_name.startswith(("text-embedding-", "gpt-")):
+        try:
+            import tiktoken
+            encoding = tiktoken.encoding_for_model(model_name)
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+        except Exception as e:
+            logger.warning("tiktoken unavailable for %s (%s), using estimate", model_name, e)
+
+    if model_name.startswith("sentence-transformers/"):
+        try:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+        except Exception as e:
+            logger.warning("Tokenizer unavailable for %s (%s), using estimate", model_name, e)
+
+    if model_name.startswith("onnx:"):
+        try:
+            from tokenizers import Tokenizer
+            model_dir = os.getenv("ONNX_MODEL_PATH", "/data/models/multilingual-e5-small")
+            tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+        except Exception as e:
+            logger.warning("Tokenizer unavailable for %s (%s), using estimate", model_name, e)
+
+    return estimate_tokens